@@ -1,5 +1,6 @@
-from fyyur import app
+from fyyur import create_app
 
+app = create_app()
 
 # Default port:
 if __name__ == '__main__':
@@ -0,0 +1,44 @@
+"""Per-show cost of the `datetime` template filter.
+
+Compares the old pipeline (strftime in the view, dateutil parse + babel
+format in the filter) with fyyur.helpers.format_datetime on datetimes.
+
+    python benchmarks/format_datetime.py [number_of_shows]
+"""
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from fyyur.helpers import format_datetime  # noqa: E402
+
+
+def format_datetime_before(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en')
+
+
+def main(shows=5000):
+    start = datetime(2021, 1, 1, 20, 0)
+    times = [start + timedelta(hours=i) for i in range(shows)]
+    strings = [t.strftime('%Y-%m-%d %H:%M:%S') for t in times]
+    assert [format_datetime_before(s, 'full') for s in strings[:50]] == [format_datetime(t, 'full') for t in times[:50]]
+
+    before = min(timeit.repeat(lambda: [format_datetime_before(s, 'full') for s in strings], number=1, repeat=5))
+    after = min(timeit.repeat(lambda: [format_datetime(t, 'full') for t in times], number=1, repeat=5))
+    print(f'{shows} shows')
+    print(f'before: {before * 1000:8.1f} ms total, {before / shows * 1e6:6.1f} us/show')
+    print(f'after:  {after * 1000:8.1f} ms total, {after / shows * 1e6:6.1f} us/show')
+    print(f'speedup: {before / after:.1f}x')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
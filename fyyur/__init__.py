@@ -1,18 +1,103 @@
+import os
+from collections.abc import Mapping
+
+import click
 from flask import Flask
-from flask_migrate import Migrate
+from flask.cli import FlaskGroup
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 
+from config import profiles
+from fyyur.cache import ResponseCache
+from fyyur.instrumentation import SQLInstrumentation
+from fyyur.pool import engine_options, init_pool, pool_stats
+from fyyur.replicas import ReplicaRouter, RoutingSession, replica_binds
+
 
 # ----------------------------------------------------------------------------#
 # App Config.
+#
+# The extensions are created unbound and create_app() builds an app around
+# them, so importing fyyur costs little: the views, models, forms and their
+# template helpers load when an app is created, babel, dateutil and WTForms
+# on first use, and the CLI-only modules (migrations, seeding, benchmarks,
+# imports, purges) only under the `flask` command.
 # ----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+moment = Moment()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+replica_router = ReplicaRouter()
+cache = ResponseCache()
+# cached pages outlive the request, render them from the primary
+cache.render_context = replica_router.primary
+instrumentation = SQLInstrumentation()
+instrumentation.add_collector(
+    lambda: [(f'fyyur_cache_{k}', v) for k, v in cache.stats().items() if isinstance(v, (int, float))]
+)
+instrumentation.add_collector(
+    lambda: [(f'fyyur_db_pool_{k}', v) for k, v in pool_stats(db.engine).items() if isinstance(v, (int, float))]
+)
+instrumentation.add_collector(
+    lambda: [(f'fyyur_db_{name}_{k}', v) for name, stats in replica_router.stats().items()
+             for k, v in stats.items() if isinstance(v, (int, float))]
+)
+
+
+def create_app(config=None):
+    # `config` is a profile name from config.py, a config class, or a mapping
+    # of settings applied over the profile chosen by FYYUR_ENV.
+    app = Flask(__name__)
+    if config is None or isinstance(config, str):
+        app.config.from_object(profiles[config or os.environ.get('FYYUR_ENV', 'development')])
+    elif isinstance(config, Mapping):
+        app.config.from_object(profiles[os.environ.get('FYYUR_ENV', 'development')])
+        app.config.from_mapping(config)
+    else:
+        app.config.from_object(config)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+    app.config.setdefault('SQLALCHEMY_BINDS', replica_binds(app.config))
+    moment.init_app(app)
+    db.init_app(app)
+    init_pool(app, db)
+    replica_router.init_app(app, db)
+    cache.init_app(app)
+    instrumentation.init_app(app)
+
+    # the session events of availability, counters and search are
+    # registered on import
+    from fyyur import availability, counters, search
+    from fyyur.api import api_v1
+    from fyyur.assets import assets
+    from fyyur.recent import recent_listings
+    from fyyur.reference import genre_registry
+    from fyyur.routes import main
+    recent_listings.init_app(app)
+    app.register_blueprint(main)
+    app.register_blueprint(api_v1)
+    app.register_blueprint(assets)
+    with app.app_context():
+        genre_registry.prime()
+        recent_listings.prime()
+    if _loaded_by_flask_command():
+        register_commands(app)
+    return app
+
+
+def _loaded_by_flask_command():
+    # uvicorn is a click command too, only the `flask` CLI counts
+    context = click.get_current_context(silent=True)
+    return context is not None and isinstance(context.find_root().command, FlaskGroup)
 
 
-from fyyur import routes
+def register_commands(app):
+    # Adds the `flask` commands, e.g. for app.test_cli_runner() in tests;
+    # create_app() calls it when the `flask` command loads the app.
+    from flask_migrate import Migrate
+    from fyyur import assets, benchmark, counters, importer, plans, purge, seed, startup
+    Migrate(app, db)
+    for command in (
+        counters.shows_cli, assets.assets_cli, importer.import_command, importer.bulk_edit_command,
+        seed.seed_command, purge.purge_command, plans.check_plans_command,
+        benchmark.bench_command, benchmark.bench_concurrency_command, startup.bench_startup_command,
+    ):
+        app.cli.add_command(command)
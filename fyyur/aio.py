@@ -0,0 +1,406 @@
+import asyncio
+import io
+import sys
+from datetime import datetime
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import g, has_app_context, render_template, request
+from flask.signals import request_started
+from sqlalchemy import event, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from werkzeug.exceptions import HTTPException
+
+from fyyur import cache, create_app, instrumentation
+from fyyur.conditional import conditional_applies, precondition, with_validators
+from fyyur.directory import DIRECTORY_ORDER, venue_rows, group_areas, area_rows
+from fyyur.models import Venue, Artist, Show, Genre, genres_venues, artists_genres, hide_deleted
+from fyyur.pagination import keyset_query, make_page, per_page
+from fyyur.pool import async_engine_options, pool_stats, transaction_timeouts
+from fyyur.recent import recent_listings
+from fyyur.search import tokenize, postgres_match, index_search
+
+# ----------------------------------------------------------------------------#
+# Async read path.
+#
+# `application` is an ASGI app (e.g. `uvicorn fyyur.aio:application`) that
+# serves the read-only pages as coroutines on an async engine (asyncpg,
+# aiosqlite), so a slow query parks a coroutine instead of a worker thread.
+# Independent statements of a page run concurrently, each on its own pooled
+# connection. Every other request goes to the Flask WSGI app unchanged.
+#
+# The async views render the same templates inside a regular Flask request
+# context, so before/after request hooks, sessions, flashes, @conditional
+# ETags and the page cache work as on the sync path. Sync helpers that may
+# do I/O (cold feed or search index loads, Redis) run in a thread.
+# ----------------------------------------------------------------------------#
+
+ASYNC_DRIVERS = {'postgresql': 'postgresql+asyncpg', 'sqlite': 'sqlite+aiosqlite'}
+
+
+def async_database_url(url):
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise RuntimeError(f'No async driver for {url.drivername}')
+    return url.set(drivername=driver)
+
+
+class AsyncDatabase:
+    # One async engine per bind, the primary and the replicas of
+    # fyyur/replicas.py; reads use the bind chosen for the request.
+
+    def __init__(self, app=None):
+        self._engines = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['async_database'] = self
+
+    def engine_for(self, bind=None):
+        # created on first use, connections belong to the serving event loop
+        engine = self._engines.get(bind)
+        if engine is None:
+            config = self.app.config
+            if bind is None:
+                url = config.get('ASYNC_DATABASE_URI') or async_database_url(config['SQLALCHEMY_DATABASE_URI'])
+                sync_url = config['SQLALCHEMY_DATABASE_URI']
+            else:
+                sync_url = config['SQLALCHEMY_BINDS'][bind]['url']
+                url = async_database_url(sync_url)
+            engine = self._engines[bind] = create_async_engine(url, **async_engine_options(config, sync_url))
+            statement = transaction_timeouts(config)
+            if statement is not None:
+                event.listen(engine.sync_engine, 'begin', lambda connection: connection.execute(statement))
+        return engine
+
+    @property
+    def engine(self):
+        return self.engine_for(None)
+
+    async def fetch(self, statement):
+        # Core connections skip the session's do_orm_execute hook
+        bind = g.get('read_bind') if has_app_context() else None
+        async with self.engine_for(bind).connect() as connection:
+            return (await connection.execute(hide_deleted(statement))).all()
+
+    async def fetch_all(self, *statements):
+        # one connection per statement, so they run concurrently
+        return await asyncio.gather(*(self.fetch(statement) for statement in statements))
+
+    async def dispose(self):
+        engines, self._engines = self._engines, {}
+        for engine in engines.values():
+            await engine.dispose()
+
+    def stats(self):
+        engine = self._engines.get(None)
+        return pool_stats(engine.sync_engine) if engine is not None else {}
+
+
+# the app this entrypoint serves, `uvicorn` imports it directly
+app = create_app()
+async_db = AsyncDatabase(app)
+instrumentation.add_collector(
+    lambda: [(f'fyyur_async_db_pool_{k}', v) for k, v in async_db.stats().items() if isinstance(v, (int, float))]
+)
+
+
+#  Views
+#  ----------------------------------------------------------------
+
+# endpoint -> coroutine function, same arguments and result as the sync view
+ASYNC_VIEWS = {}
+
+
+def async_view(endpoint):
+    def decorator(view):
+        ASYNC_VIEWS[endpoint] = view
+        return view
+    return decorator
+
+
+@async_view('main.index')
+async def index():
+    venues, artists = await asyncio.gather(
+        asyncio.to_thread(recent_listings.latest, 'venues'),
+        asyncio.to_thread(recent_listings.latest, 'artists')
+    )
+    return render_template('pages/home.html', venues=venues, artists=artists)
+
+
+@async_view('main.venues')
+async def venues():
+    if app.config.get('VENUES_LAZY_AREAS'):
+        areas = await async_db.fetch(area_rows().statement)
+        areas = [{"city": area.city, "state": area.state, "num_venues": area.num_venues} for area in areas]
+        return render_template('pages/venues.html', areas=areas, lazy=True)
+    cursor = request.args.get('cursor')
+    limit = per_page('VENUES_PER_PAGE')
+    query, direction = keyset_query(venue_rows(), DIRECTORY_ORDER, cursor)
+    rows = await async_db.fetch(query.limit(limit + 1).statement)
+    page = make_page(rows, DIRECTORY_ORDER, cursor, limit, direction)
+    return render_template('pages/venues.html', areas=group_areas(page.items), page=page, lazy=False)
+
+
+@async_view('main.artists')
+async def artists():
+    cursor = request.args.get('cursor')
+    limit = per_page('ARTISTS_PER_PAGE')
+    columns = (Artist.created_at, Artist.id)
+    query, direction = keyset_query(select(Artist.id, Artist.name, Artist.created_at), columns, cursor)
+    rows = await async_db.fetch(query.limit(limit + 1))
+    page = make_page(rows, columns, cursor, limit, direction)
+    return render_template('pages/artists.html', artists=page.items, page=page)
+
+
+@async_view('main.shows')
+async def shows():
+    cursor = request.args.get('cursor')
+    limit = per_page('SHOWS_PER_PAGE')
+    columns = (Show.start_time, Show.id)
+    query, direction = keyset_query(select(
+        Show.id,
+        Show.start_time,
+        Show.venue_id,
+        Venue.name.label('venue_name'),
+        Show.artist_id,
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link')
+    ).join(Venue, Show.venue_id == Venue.id).join(Artist, Show.artist_id == Artist.id), columns, cursor)
+    rows = await async_db.fetch(query.limit(limit + 1))
+    page = make_page(rows, columns, cursor, limit, direction)
+    return render_template('pages/shows.html', shows=[dict(show._mapping) for show in page], page=page)
+
+
+# Columns of Venue.to_dict() / Artist.to_dict(), genres come separately.
+DETAIL_COLUMNS = {
+    Venue: ('id', 'name', 'city', 'state', 'address', 'phone', 'image_link', 'facebook_link', 'website',
+            'seeking_talent', 'seeking_description'),
+    Artist: ('id', 'name', 'city', 'state', 'phone', 'image_link', 'facebook_link', 'website',
+             'seeking_venue', 'seeking_description'),
+}
+
+
+async def _detail(model, entity_id, own_key, genre_key, partner, partner_key, prefix):
+    # The entity, its genres and its past and upcoming shows, all at once.
+    link = genre_key.table
+    shows = select(
+        partner_key.label(f'{prefix}_id'),
+        partner.name.label(f'{prefix}_name'),
+        partner.image_link.label(f'{prefix}_image_link'),
+        Show.start_time
+    ).join(partner, partner_key == partner.id).where(own_key == entity_id).order_by(Show.start_time, Show.id)
+    now = datetime.now()
+    entity, genres, past, upcoming = await async_db.fetch_all(
+        select(*[getattr(model, name) for name in DETAIL_COLUMNS[model]]).where(model.id == entity_id),
+        select(Genre.name).join(link, link.c.genre_id == Genre.id).where(genre_key == entity_id).order_by(Genre.id),
+        shows.where(Show.start_time < now),
+        shows.where(Show.start_time > now)
+    )
+    if not entity:
+        return None
+    data = dict(entity[0]._mapping)
+    data['genres'] = [genre.name for genre in genres]
+    data['past_shows'] = [dict(show._mapping) for show in past]
+    data['past_shows_count'] = len(past)
+    data['upcoming_shows'] = [dict(show._mapping) for show in upcoming]
+    data['upcoming_shows_count'] = len(upcoming)
+    return data
+
+
+@async_view('main.show_venue')
+async def show_venue(venue_id):
+    data = await _detail(Venue, venue_id, Show.venue_id, genres_venues.c.venue_id, Artist, Show.artist_id, 'artist')
+    if data is None:
+        return render_template('errors/404.html')
+    return render_template('pages/show_venue.html', venue=data)
+
+
+@async_view('main.show_artist')
+async def show_artist(artist_id):
+    data = await _detail(Artist, artist_id, Show.artist_id, artists_genres.c.artist_id, Venue, Show.venue_id, 'venue')
+    if data is None:
+        return render_template('errors/404.html')
+    return render_template('pages/show_artist.html', artist=data)
+
+
+async def _search(model, term):
+    limit = app.config.get('SEARCH_RESULT_LIMIT', 50)
+    tokens = tokenize(term)
+    columns = select(model.id, model.name, model.num_upcoming_shows)
+    if not tokens:
+        return await async_db.fetch(columns.order_by(model.name).limit(limit))
+    if async_db.engine.dialect.name == 'postgresql':
+        match, rank = postgres_match(model, tokens)
+        return await async_db.fetch(columns.where(match).order_by(rank.desc(), model.id).limit(limit))
+    ids = await asyncio.to_thread(index_search, model, tokens, limit)
+    if not ids:
+        return []
+    found = {row.id: row for row in await async_db.fetch(columns.where(model.id.in_(ids)))}
+    return [found[i] for i in ids if i in found]
+
+
+async def _search_page(model, template):
+    search_term = request.form.get('search_term', '')
+    results = await _search(model, search_term)
+    response = {
+        "count": len(results),
+        "data": [{"id": row.id, "name": row.name, "num_upcoming_shows": row.num_upcoming_shows} for row in results]
+    }
+    return render_template(template, results=response, search_term=search_term)
+
+
+@async_view('main.search_venues')
+async def search_venues():
+    return await _search_page(Venue, 'pages/search_venues.html')
+
+
+@async_view('main.search_artists')
+async def search_artists():
+    return await _search_page(Artist, 'pages/search_artists.html')
+
+
+#  Dispatch
+#  ----------------------------------------------------------------
+
+
+async def _version_state(version, view_args):
+    if hasattr(version, 'statement'):
+        rows = await async_db.fetch(version.statement(**view_args))
+        return version.from_row(rows[0] if rows else None)
+    return await asyncio.to_thread(version, **view_args)
+
+
+async def _cached(view, endpoint, view_args):
+    # the @cache.page part of the sync view
+    dependencies = getattr(view, 'cache_dependencies', None)
+    if dependencies is None or not cache.page_applies():
+        return await ASYNC_VIEWS[endpoint](**view_args)
+    key, value = await asyncio.to_thread(cache.lookup, request.full_path, dependencies(**view_args))
+    if value is not None:
+        return value, {'X-Cache': 'HIT'}
+    with cache.render_context():
+        rv = await ASYNC_VIEWS[endpoint](**view_args)
+    if isinstance(rv, str):
+        await asyncio.to_thread(cache.store, key, rv)
+        return rv, {'X-Cache': 'MISS'}
+    return rv
+
+
+async def _dispatch(endpoint, view_args):
+    # the @conditional part of the sync view
+    view = app.view_functions[endpoint]
+    version = getattr(view, 'conditional_version', None)
+    if version is None or not conditional_applies():
+        return await _cached(view, endpoint, view_args)
+    state = await _version_state(version, view_args)
+    if state is None:
+        return await _cached(view, endpoint, view_args)
+    validators, response = precondition(state)
+    if response is None:
+        response = app.make_response(await _cached(view, endpoint, view_args))
+        if response.status_code != 200:
+            return response
+    return with_validators(response, validators)
+
+
+async def _full_dispatch(endpoint, view_args):
+    # Flask.full_dispatch_request with an awaited view
+    try:
+        request_started.send(app, _async_wrapper=app.ensure_sync)
+        rv = app.preprocess_request()
+        if rv is None:
+            rv = await _dispatch(endpoint, view_args)
+    except Exception as e:
+        rv = app.handle_user_exception(e)
+    return app.finalize_request(rv)
+
+
+async def _respond(environ, endpoint, view_args):
+    ctx = app.request_context(environ)
+    error = None
+    try:
+        ctx.push()
+        try:
+            return await _full_dispatch(endpoint, view_args)
+        except Exception as e:
+            error = e
+            return app.handle_exception(e)
+    finally:
+        ctx.pop(error)
+
+
+def _environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('ascii'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f'HTTP/{scope["http_version"]}',
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        value = value.decode('latin-1')
+        environ[name] = environ[name] + ',' + value if name in environ else value
+    return environ
+
+
+async def _read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def _send(send, response, method):
+    headers = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in response.headers.items()]
+    await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': b'' if method == 'HEAD' else response.get_data()})
+    response.close()
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await async_db.dispose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+wsgi_application = WsgiToAsgi(app)
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] == 'http':
+        try:
+            endpoint, view_args = app.url_map.bind_to_environ(_environ(scope, b'')).match()
+        except HTTPException:
+            endpoint = None  # 404s, 405s and redirects are Flask's
+        if endpoint in ASYNC_VIEWS:
+            environ = _environ(scope, await _read_body(receive))
+            response = await _respond(environ, endpoint, view_args)
+            return await _send(send, response, scope['method'])
+    return await wsgi_application(scope, receive, send)
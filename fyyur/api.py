@@ -0,0 +1,361 @@
+import json
+from datetime import datetime
+
+from flask import Blueprint, Response, abort, request, url_for
+from werkzeug.exceptions import HTTPException
+
+from fyyur import db
+from fyyur.availability import available
+from fyyur.facets import bitmap_ids, facet_indexes
+from fyyur.conditional import conditional, EntityVersion, TableVersion
+from fyyur.instrumentation import query_budget
+from fyyur.models import Venue, Artist, Show, genres_venues, artists_genres
+from fyyur.pagination import decode_cursor, make_page, paginate, per_page
+from fyyur.reference import genre_registry
+from fyyur.replicas import read_replica
+from fyyur.search import search
+
+try:
+    import orjson
+except ImportError:  # optional, the standard library encoder is the fallback
+    orjson = None
+
+# ----------------------------------------------------------------------------#
+# JSON API, version 1.
+#
+# Read-only endpoints for venues, artists, shows and search. `?fields=` picks
+# the attributes and nested collections to return (e.g.
+# `?fields=name,city,upcoming_shows`) and only those columns and
+# collections are queried: rows are selected column by column and no model
+# instances are built.
+# ----------------------------------------------------------------------------#
+
+api_v1 = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def json_response(data, status=200):
+    if orjson is not None:
+        body = orjson.dumps(data)
+    else:
+        body = json.dumps(data, default=_default, separators=(',', ':'))
+    return Response(body, status=status, mimetype='application/json')
+
+
+def requested_fields(available, default=None):
+    # `id` is always returned, the rest as listed in ?fields=
+    value = request.args.get('fields')
+    if not value:
+        return list(default or available)
+    fields = [f.strip() for f in value.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in available]
+    if unknown:
+        abort(400, description=f'Unknown fields: {", ".join(unknown)}. Available: {", ".join(available)}')
+    return ['id'] + [f for f in fields if f != 'id']
+
+
+def _page_links(page):
+    # lists keep repeated filters (?genre=Jazz&genre=Rock)
+    args = {k: v for k, v in request.args.lists() if k != 'cursor'}
+    return {
+        'next': url_for(request.endpoint, cursor=page.next_cursor, **args) if page.next_cursor else None,
+        'prev': url_for(request.endpoint, cursor=page.prev_cursor, **args) if page.prev_cursor else None,
+    }
+
+
+class EntityResource:
+    # Venues and artists: scalar columns, their genres and their past and
+    # upcoming shows joined with the other side (artists for a venue, venues
+    # for an artist).
+
+    def __init__(self, model, columns, genre_table, genre_key, show_key, other, other_key, prefix, per_page_key):
+        self.model = model
+        self.columns = {name: getattr(model, name) for name in columns}
+        self.columns['upcoming_shows_count'] = model.num_upcoming_shows
+        self.columns['past_shows_count'] = model.num_past_shows
+        self.genre_table = genre_table
+        self.genre_key = genre_key
+        self.show_key = show_key
+        self.other = other
+        self.other_key = other_key
+        self.prefix = prefix
+        self.per_page_key = per_page_key
+        self.list_fields = list(self.columns) + ['genres']
+        self.detail_fields = self.list_fields + ['past_shows', 'upcoming_shows']
+
+    def select(self, fields):
+        return db.session.query(*[self.columns[f].label(f) for f in fields if f in self.columns])
+
+    def genres(self, ids):
+        # link rows only, names come from the in-memory registry
+        names = dict(genre_registry.choices())
+        key = self.genre_table.c[self.genre_key]
+        genres = {i: [] for i in ids}
+        rows = db.session.query(key, self.genre_table.c.genre_id).filter(key.in_(ids))
+        for entity_id, genre_id in rows:
+            genres[entity_id].append(names.get(genre_id))
+        return genres
+
+    def shows(self, entity_id, upcoming):
+        other = self.other
+        now = datetime.now()
+        rows = db.session.query(
+            other.id.label(f'{self.prefix}_id'),
+            other.name.label(f'{self.prefix}_name'),
+            other.image_link.label(f'{self.prefix}_image_link'),
+            Show.start_time
+        ).join(other, self.other_key == other.id).filter(
+            self.show_key == entity_id,
+            Show.start_time > now if upcoming else Show.start_time < now
+        ).order_by(Show.start_time, Show.id)
+        return [row._asdict() for row in rows]
+
+    def listing(self):
+        fields = requested_fields(self.list_fields)
+        page = paginate(self.select(fields), (self.model.id,), request.args.get('cursor'), per_page(self.per_page_key))
+        data = [row._asdict() for row in page.items]
+        if 'genres' in fields and data:
+            genres = self.genres([item['id'] for item in data])
+            for item in data:
+                item['genres'] = genres[item['id']]
+        return json_response({'data': data, 'links': _page_links(page)})
+
+    def browse(self):
+        # listing narrowed by facets, with the counts of every facet value
+        index = facet_indexes[self.model]
+        fields = requested_fields(self.list_fields)
+        selected = {
+            'genre': _genre_ids(request.args.getlist('genre')),
+            'state': request.args.getlist('state'),
+            'city': request.args.getlist('city'),
+            index.seeking: [_flag(index.seeking, value) for value in request.args.getlist(index.seeking)],
+        }
+        matching, counts = index.search(selected)
+
+        columns = (self.model.id,)
+        cursor = request.args.get('cursor')
+        limit = per_page(self.per_page_key)
+        direction = 'next'
+        bound = None
+        if cursor:
+            (bound,), direction = decode_cursor(columns, cursor)
+        if direction == 'next':
+            ids = bitmap_ids(matching, after=bound, limit=limit + 1)
+        else:
+            ids = bitmap_ids(matching, before=bound, limit=limit + 1)
+        found = {row.id: row for row in self.select(fields).filter(self.model.id.in_(ids))} if ids else {}
+        page = make_page([found[i] for i in ids if i in found], columns, cursor, limit, direction)
+
+        data = [row._asdict() for row in page.items]
+        if 'genres' in fields and data:
+            genres = self.genres([item['id'] for item in data])
+            for item in data:
+                item['genres'] = genres[item['id']]
+        names = dict(genre_registry.choices())
+        facets = {}
+        for dimension, values in counts.items():
+            facets[dimension] = [
+                {'value': names.get(value) if dimension == 'genre' else value, 'count': count}
+                for value, count in sorted(values.items(), key=lambda item: (-item[1], str(item[0])))
+                if count or value in selected[dimension]
+            ]
+        return json_response({
+            'data': data,
+            'total': matching.bit_count(),
+            'facets': facets,
+            'links': _page_links(page),
+        })
+
+    def detail(self, entity_id):
+        fields = requested_fields(self.detail_fields)
+        row = self.select(fields).filter(self.model.id == entity_id).first()
+        if row is None:
+            abort(404, description=f'No {self.model.__tablename__[:-1]} with id {entity_id}')
+        data = row._asdict()
+        if 'genres' in fields:
+            data['genres'] = self.genres([entity_id])[entity_id]
+        if 'past_shows' in fields:
+            data['past_shows'] = self.shows(entity_id, upcoming=False)
+        if 'upcoming_shows' in fields:
+            data['upcoming_shows'] = self.shows(entity_id, upcoming=True)
+        return json_response({'data': data})
+
+
+def _genre_ids(names):
+    ids = {name.lower(): genre_id for genre_id, name in genre_registry.choices()}
+    unknown = [name for name in names if name.lower() not in ids]
+    if unknown:
+        abort(400, description=f'Unknown genres: {", ".join(unknown)}')
+    return [ids[name.lower()] for name in names]
+
+
+def _flag(name, value):
+    if value.lower() not in ('true', 'false'):
+        abort(400, description=f'{name} must be true or false')
+    return value.lower() == 'true'
+
+
+venue_resource = EntityResource(
+    Venue,
+    ('id', 'name', 'city', 'state', 'address', 'phone', 'image_link', 'facebook_link', 'website',
+     'seeking_talent', 'seeking_description'),
+    genres_venues, 'venue_id', Show.venue_id, Artist, Show.artist_id, 'artist', 'VENUES_PER_PAGE'
+)
+artist_resource = EntityResource(
+    Artist,
+    ('id', 'name', 'city', 'state', 'phone', 'image_link', 'facebook_link', 'website',
+     'seeking_venue', 'seeking_description'),
+    artists_genres, 'artist_id', Show.artist_id, Venue, Show.venue_id, 'venue', 'ARTISTS_PER_PAGE'
+)
+SEARCH_RESOURCES = {'venues': venue_resource, 'artists': artist_resource}
+
+SHOW_COLUMNS = {
+    'id': Show.id,
+    'start_time': Show.start_time,
+    'end_time': Show.end_time,
+    'venue_id': Show.venue_id,
+    'venue_name': Venue.name,
+    'venue_image_link': Venue.image_link,
+    'artist_id': Show.artist_id,
+    'artist_name': Artist.name,
+    'artist_image_link': Artist.image_link,
+}
+
+
+@api_v1.route('/venues')
+@read_replica
+@query_budget(3)
+@conditional(TableVersion(Venue))
+def venues():
+    return venue_resource.listing()
+
+
+@api_v1.route('/venues/facets')
+@read_replica
+@query_budget(4)
+@conditional(TableVersion(Venue))
+def venue_facets():
+    return venue_resource.browse()
+
+
+@api_v1.route('/venues/<int:venue_id>')
+@read_replica
+@query_budget(5)
+@conditional(EntityVersion(Venue))
+def venue(venue_id):
+    return venue_resource.detail(venue_id)
+
+
+@api_v1.route('/artists')
+@read_replica
+@query_budget(3)
+@conditional(TableVersion(Artist))
+def artists():
+    return artist_resource.listing()
+
+
+@api_v1.route('/artists/facets')
+@read_replica
+@query_budget(4)
+@conditional(TableVersion(Artist))
+def artist_facets():
+    return artist_resource.browse()
+
+
+@api_v1.route('/artists/<int:artist_id>')
+@read_replica
+@query_budget(5)
+@conditional(EntityVersion(Artist))
+def artist(artist_id):
+    return artist_resource.detail(artist_id)
+
+
+@api_v1.route('/shows')
+@read_replica
+@query_budget(2)
+@conditional(TableVersion(Venue, Artist))
+def shows():
+    fields = requested_fields(list(SHOW_COLUMNS))
+    # the sort key is always selected, for the page cursors
+    selected = dict.fromkeys(fields + ['start_time'])
+    # always joined, shows of deleted venues and artists are left out
+    query = (
+        db.session.query(*[SHOW_COLUMNS[f].label(f) for f in selected])
+        .select_from(Show)
+        .join(Venue, Show.venue_id == Venue.id)
+        .join(Artist, Show.artist_id == Artist.id)
+    )
+    page = paginate(query, (Show.start_time, Show.id), request.args.get('cursor'), per_page('SHOWS_PER_PAGE'))
+    data = [{f: getattr(row, f) for f in fields} for row in page.items]
+    return json_response({'data': data, 'links': _page_links(page)})
+
+
+def _window():
+    try:
+        start_time = datetime.fromisoformat(request.args['start'])
+        end_time = datetime.fromisoformat(request.args['end'])
+    except (KeyError, ValueError):
+        abort(400, description='start and end are required, as ISO 8601 date-times (e.g. 2026-05-21T20:00)')
+    if start_time.tzinfo is not None or end_time.tzinfo is not None:
+        abort(400, description='start and end are local times, without a UTC offset')
+    if end_time <= start_time:
+        abort(400, description='end must be after start')
+    return start_time, end_time
+
+
+def _available(model):
+    city = request.args.get('city')
+    if not city:
+        abort(400, description='city is required')
+    start_time, end_time = _window()
+    rows = available(model, city, request.args.get('state'), start_time, end_time)
+    return json_response({'data': [row._asdict() for row in rows]})
+
+
+@api_v1.route('/venues/available')
+@read_replica
+@query_budget(3)
+@conditional(TableVersion(Venue, Artist))
+def available_venues():
+    return _available(Venue)
+
+
+@api_v1.route('/artists/available')
+@read_replica
+@query_budget(3)
+@conditional(TableVersion(Venue, Artist))
+def available_artists():
+    return _available(Artist)
+
+
+@api_v1.route('/search')
+@read_replica
+@query_budget(4)
+def search_entities():
+    term = request.args.get('q', '')
+    kind = request.args.get('type')
+    if kind is not None and kind not in SEARCH_RESOURCES:
+        abort(400, description=f'type must be one of: {", ".join(SEARCH_RESOURCES)}')
+    available = [f for f in venue_resource.columns if f in artist_resource.columns]
+    fields = requested_fields(available, default=['id', 'name', 'upcoming_shows_count'])
+    results = {}
+    for name, resource in SEARCH_RESOURCES.items():
+        if kind in (None, name):
+            rows = search(resource.model, term, query=resource.select(fields))
+            results[name] = [row._asdict() for row in rows]
+    return json_response({'data': results})
+
+
+# the app's HTML 404/500 pages are registered per code, which wins over a
+# class handler, so those codes are claimed here as well
+@api_v1.errorhandler(HTTPException)
+@api_v1.errorhandler(404)
+@api_v1.errorhandler(500)
+def api_error(error):
+    return json_response({'error': {'status': error.code, 'message': error.description}}, error.code)
+
@@ -0,0 +1,256 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import threading
+
+import click
+from flask import Blueprint, current_app, request, send_from_directory, url_for
+from flask.cli import AppGroup
+
+try:
+    import brotli
+except ImportError:  # optional, only the gzip variants are written without it
+    brotli = None
+
+try:
+    import rcssmin
+except ImportError:  # optional, the conservative minifier below is the fallback
+    rcssmin = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+# ----------------------------------------------------------------------------#
+# Static assets.
+#
+# `flask assets build` concatenates and minifies the CSS and JS of
+# layouts/main.html into bundles, copies the other assets the templates link
+# (IE shims, images) and names every output after a hash of its content,
+# with .gz and .br variants of the text files next to it, under
+# static/dist/. manifest.json maps source names to the built ones. Templates
+# link through asset_url() / asset_urls(), which fall back to the source
+# files while ASSETS_BUNDLED is off or nothing has been built. A built name
+# never changes content, so /static/dist/ is served with a year-long
+# immutable Cache-Control and repeat visits only revalidate the HTML.
+# ----------------------------------------------------------------------------#
+
+STATIC = os.path.join(os.path.dirname(__file__), 'static')
+DIST = os.path.join(STATIC, 'dist')
+MANIFEST = os.path.join(DIST, 'manifest.json')
+
+# bundle name: source files in load order, relative to static/
+BUNDLES = {
+    'main.css': [
+        'css/bootstrap.min.css',
+        'css/layout.main.css',
+        'css/main.css',
+        'css/main.responsive.css',
+        'css/main.quickfix.css',
+    ],
+    # feature detection has to run before the page renders
+    'head.js': [
+        'js/libs/modernizr-2.8.2.min.js',
+    ],
+    # deferred, in the order the layout used to load them
+    'main.js': [
+        'js/libs/moment.min.js',
+        'js/libs/jquery-1.11.1.min.js',
+        'js/script.js',
+        'js/libs/bootstrap-3.1.1.min.js',
+        'js/plugins.js',
+    ],
+}
+
+# linked on their own, fingerprinted but not bundled
+SINGLES = [
+    'js/libs/respond-1.4.2.min.js',
+    'img/front-splash.jpg',
+]
+
+COMPRESSED = ('.css', '.js', '.svg', '.json')
+_CSS_STRING = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')')
+_SOURCE_MAP = re.compile(r'^\s*//[#@] sourceMappingURL=.*$|/\*[#@] sourceMappingURL=.*?\*/', re.M)
+
+
+#  Build
+#  ----------------------------------------------------------------
+
+
+def minify_css(text):
+    if rcssmin is not None:
+        return rcssmin.cssmin(text)
+    # comments (keeping /*! licences), runs of whitespace, and spaces around
+    # punctuation where CSS ignores them; quoted strings are left alone
+    text = re.sub(r'/\*(?!!).*?\*/', '', text, flags=re.S)
+    parts = _CSS_STRING.split(text)
+    for i in range(0, len(parts), 2):
+        part = re.sub(r'\s+', ' ', parts[i])
+        part = re.sub(r'\s*([{};,>])\s*', r'\1', part)
+        # a space after a colon is never significant, before one it can be (`a :hover`)
+        parts[i] = re.sub(r':\s+', ':', part).replace(';}', '}')
+    return ''.join(parts).strip()
+
+
+def minify_js(text, name):
+    if name.endswith('.min.js'):
+        return text
+    if rjsmin is not None:
+        return rjsmin.jsmin(text)
+    # only what cannot be part of a statement: indentation, blank lines and
+    # whole-line // comments
+    lines = (line.strip() for line in text.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+
+def _read(name):
+    with open(os.path.join(STATIC, name), encoding='utf-8') as f:
+        # maps point next to the source file, not the bundle
+        return _SOURCE_MAP.sub('', f.read())
+
+
+def build_bundle(name, sources):
+    if name.endswith('.css'):
+        return '\n'.join(minify_css(_read(source)) for source in sources).encode('utf-8')
+    # `;` guards against a file that ends without one
+    return '\n;'.join(minify_js(_read(source), source) for source in sources).encode('utf-8')
+
+
+def fingerprint(name, content):
+    stem, ext = os.path.splitext(name)
+    return f'{stem}.{hashlib.sha256(content).hexdigest()[:12]}{ext}'
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        return f.write(content)
+
+
+def write_asset(built, content):
+    # The file and its compressed variants. Returns their sizes.
+    path = os.path.join(DIST, built)
+    sizes = {'raw': _write(path, content)}
+    if built.endswith(COMPRESSED):
+        # mtime=0 keeps rebuilds byte-identical
+        sizes['gzip'] = _write(path + '.gz', gzip.compress(content, 9, mtime=0))
+        if brotli is not None:
+            sizes['br'] = _write(path + '.br', brotli.compress(content, quality=11))
+    return sizes
+
+
+def _contents():
+    for name, sources in BUNDLES.items():
+        yield name, build_bundle(name, sources)
+    for name in SINGLES:
+        with open(os.path.join(STATIC, name), 'rb') as f:
+            yield name, f.read()
+
+
+def build_assets():
+    # Builds every bundle and single asset. Files of earlier builds stay, so
+    # pages cached before a deploy keep working; the manifest is written
+    # last. Returns {source name: (built name, sizes)}.
+    report = {}
+    for name, content in _contents():
+        built = fingerprint(name, content)
+        report[name] = (built, write_asset(built, content))
+    built = {name: target for name, (target, sizes) in report.items()}
+    _write(MANIFEST, json.dumps(built, indent=2, sort_keys=True).encode('utf-8'))
+    reload_manifest()
+    return report
+
+
+#  Template helpers
+#  ----------------------------------------------------------------
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+
+def manifest():
+    # {source name: built name}, empty when nothing has been built
+    global _manifest
+    if _manifest is None:
+        with _manifest_lock:
+            if _manifest is None:
+                try:
+                    with open(MANIFEST, encoding='utf-8') as f:
+                        _manifest = json.load(f)
+                except FileNotFoundError:
+                    _manifest = {}
+    return _manifest
+
+
+def reload_manifest():
+    global _manifest
+    _manifest = None
+
+
+def asset_url(name):
+    built = manifest().get(name) if current_app.config.get('ASSETS_BUNDLED') else None
+    if built is None:
+        return url_for('static', filename=name)
+    return url_for('assets.dist', filename=built)
+
+
+def asset_urls(bundle):
+    # The bundle, or its source files while it is not built.
+    if current_app.config.get('ASSETS_BUNDLED') and bundle in manifest():
+        return [url_for('assets.dist', filename=manifest()[bundle])]
+    return [url_for('static', filename=source) for source in BUNDLES[bundle]]
+
+
+#  Serving
+#  ----------------------------------------------------------------
+
+assets = Blueprint('assets', __name__)
+assets.add_app_template_global(asset_url)
+assets.add_app_template_global(asset_urls)
+
+
+def _encoded(filename):
+    # The best precompressed variant the client accepts, if one was built.
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[encoding] and os.path.isfile(os.path.join(DIST, filename + suffix)):
+            return encoding, filename + suffix
+    return None, filename
+
+
+@assets.route('/static/dist/<path:filename>')
+def dist(filename):
+    encoding, path = _encoded(filename)
+    response = send_from_directory(
+        DIST, path,
+        mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+        max_age=current_app.config['ASSETS_MAX_AGE']
+    )
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+#  Commands
+#  ----------------------------------------------------------------
+
+
+@click.group('assets', cls=AppGroup)
+def assets_cli():
+    """Build the static asset bundles."""
+
+
+@assets_cli.command('build')
+def build_command():
+    """Bundle, minify, fingerprint and precompress the CSS and JS."""
+    for name, (built, sizes) in build_assets().items():
+        variants = ', '.join(f'{encoding} {size}' for encoding, size in sizes.items())
+        click.echo(f'{name} -> {built} ({variants} bytes)')
+    if brotli is None:
+        click.echo('brotli is not installed, only gzip variants were written (pip install brotli).')
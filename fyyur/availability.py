@@ -0,0 +1,325 @@
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import and_, event, exists, func, inspect, literal, select, union_all
+from sqlalchemy.orm import Session, aliased
+
+from fyyur import db, replica_router
+from fyyur.counters import shows_cli
+from fyyur.models import Venue, Show
+
+# ----------------------------------------------------------------------------#
+# Availability.
+#
+# A show books its venue and its artist from start_time to end_time. On
+# Postgres two exclusion constraints (GiST over the key and the tsrange)
+# reject overlapping bookings and serve the overlap queries below. Other
+# backends keep an in-process interval index per venue and artist, covering
+# shows that end after INDEX_HORIZON ago, and check new and moved shows
+# against it when they are flushed; that check holds within one process,
+# which is what a development database needs.
+# ----------------------------------------------------------------------------#
+
+INDEX_HORIZON = timedelta(days=1)
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _seconds(value):
+    return (value - _EPOCH).total_seconds()
+
+
+class BookingConflict(Exception):
+
+    def __init__(self, conflicts):
+        super().__init__(', '.join(f'{kind} booked by show {show_id}' for kind, show_id in conflicts))
+        self.conflicts = conflicts
+
+
+def is_booking_conflict(error):
+    # Also true for the exclusion violation (SQLSTATE 23P01) of a booking
+    # that raced past the pre-check on Postgres.
+    if isinstance(error, BookingConflict):
+        return True
+    return getattr(getattr(error, 'orig', None), 'pgcode', None) == '23P01'
+
+
+def describe_conflicts(conflicts):
+    kinds = sorted({kind for kind, show_id in conflicts}, reverse=True)
+    return f'The {" and the ".join(kinds)} {"are" if len(kinds) > 1 else "is"} already booked at that time.'
+
+
+#  In-process interval index
+#  ----------------------------------------------------------------
+
+
+class IntervalIndex:
+    # Per key, the bookings sorted by start with a running maximum of their
+    # ends: the bookings overlapping [start, end) all sit before the first
+    # one starting at `end`, and the walk back stops once the running
+    # maximum no longer reaches `start`.
+
+    def __init__(self):
+        self.keys = {}
+
+    def add(self, key, booking_id, start, end):
+        if key not in self.keys:
+            self.keys[key] = (array('d'), array('d'), array('d'), array('q'))
+        starts, ends, max_ends, ids = self.keys[key]
+        i = bisect_right(starts, start)
+        starts.insert(i, start)
+        ends.insert(i, end)
+        max_ends.insert(i, end)
+        ids.insert(i, booking_id)
+        self._rescan(key, i)
+
+    def remove(self, key, booking_id):
+        if key not in self.keys:
+            return
+        starts, ends, max_ends, ids = self.keys[key]
+        if booking_id not in ids:
+            return
+        i = ids.index(booking_id)
+        for values in self.keys[key]:
+            del values[i]
+        if not ids:
+            del self.keys[key]
+        else:
+            self._rescan(key, i)
+
+    def _rescan(self, key, i):
+        starts, ends, max_ends, ids = self.keys[key]
+        running = max_ends[i - 1] if i else float('-inf')
+        for j in range(i, len(ends)):
+            running = max(running, ends[j])
+            max_ends[j] = running
+
+    def overlapping(self, key, start, end):
+        if key not in self.keys:
+            return []
+        starts, ends, max_ends, ids = self.keys[key]
+        found = []
+        i = bisect_left(starts, end) - 1
+        while i >= 0 and max_ends[i] > start:
+            if ends[i] > start:
+                found.append(ids[i])
+            i -= 1
+        return found
+
+
+_bookings = {}
+_bookings_lock = threading.RLock()
+
+
+def _in_database():
+    return db.engine.dialect.name == 'postgresql'
+
+
+def _bookings_index():
+    # {'venue': IntervalIndex, 'artist': IntervalIndex} and the horizon they cover
+    with _bookings_lock:
+        if not _bookings:
+            horizon = datetime.now() - INDEX_HORIZON
+            indexes = {'venue': IntervalIndex(), 'artist': IntervalIndex()}
+            with replica_router.primary():
+                # in start order every add appends
+                rows = db.session.execute(
+                    select(Show.id, Show.venue_id, Show.artist_id, Show.start_time, Show.end_time)
+                    .where(Show.end_time > horizon)
+                    .order_by(Show.start_time, Show.id)
+                )
+                for show_id, venue_id, artist_id, start_time, end_time in rows:
+                    indexes['venue'].add(venue_id, show_id, _seconds(start_time), _seconds(end_time))
+                    indexes['artist'].add(artist_id, show_id, _seconds(start_time), _seconds(end_time))
+            _bookings.update(indexes, horizon=horizon)
+        return _bookings
+
+
+def index_bookings(shows):
+    # For shows written without the ORM (bulk imports), once committed.
+    # `shows` are (id, venue_id, artist_id, start_time, end_time).
+    with _bookings_lock:
+        if not _bookings:
+            return
+        for show_id, venue_id, artist_id, start_time, end_time in shows:
+            if end_time > _bookings['horizon']:
+                _bookings['venue'].add(venue_id, show_id, _seconds(start_time), _seconds(end_time))
+                _bookings['artist'].add(artist_id, show_id, _seconds(start_time), _seconds(end_time))
+
+
+def unindex_bookings(shows):
+    # For shows deleted without the ORM (purges), once committed.
+    # `shows` are (id, venue_id, artist_id).
+    with _bookings_lock:
+        if not _bookings:
+            return
+        for show_id, venue_id, artist_id in shows:
+            _bookings['venue'].remove(venue_id, show_id)
+            _bookings['artist'].remove(artist_id, show_id)
+
+
+def invalidate_bookings():
+    with _bookings_lock:
+        _bookings.clear()
+
+
+#  Queries
+#  ----------------------------------------------------------------
+
+
+def overlaps(start_time, end_time):
+    if _in_database():
+        # matches the exclusion constraints, so their GiST indexes apply
+        return func.tsrange(Show.start_time, Show.end_time).op('&&')(func.tsrange(start_time, end_time))
+    return and_(Show.start_time < end_time, Show.end_time > start_time)
+
+
+def _sql_conflicts(venue_id, artist_id, start_time, end_time, exclude_id):
+    overlap = overlaps(start_time, end_time)
+    if exclude_id is not None:
+        overlap = and_(overlap, Show.id != exclude_id)
+    return [tuple(row) for row in db.session.execute(union_all(
+        select(literal('venue'), Show.id).where(Show.venue_id == venue_id, overlap),
+        select(literal('artist'), Show.id).where(Show.artist_id == artist_id, overlap)
+    ))]
+
+
+def booking_conflicts(venue_id, artist_id, start_time, end_time, exclude_id=None):
+    # ('venue' | 'artist', show id) for every show the booking would overlap.
+    if not _in_database():
+        with _bookings_lock:
+            index = _bookings_index()
+            if start_time >= index['horizon']:
+                start, end = _seconds(start_time), _seconds(end_time)
+                return [
+                    (kind, show_id)
+                    for kind, key in (('venue', venue_id), ('artist', artist_id))
+                    for show_id in index[kind].overlapping(key, start, end)
+                    if show_id != exclude_id
+                ]
+    return _sql_conflicts(venue_id, artist_id, start_time, end_time, exclude_id)
+
+
+def _city_rows(model, city, state):
+    query = select(model.id, model.name, model.city, model.state).where(model.city == city)
+    if state:
+        query = query.where(model.state == state)
+    return query.order_by(model.name, model.id)
+
+
+def available_rows(model, city, state, start_time, end_time):
+    key = Show.venue_id if model is Venue else Show.artist_id
+    booked = exists().where(key == model.id, overlaps(start_time, end_time))
+    return _city_rows(model, city, state).where(~booked)
+
+
+def available(model, city, state, start_time, end_time):
+    # The venues or artists of a city with no show overlapping the window.
+    if not _in_database():
+        with _bookings_lock:
+            index = _bookings_index()
+            if start_time >= index['horizon']:
+                kind = 'venue' if model is Venue else 'artist'
+                start, end = _seconds(start_time), _seconds(end_time)
+                rows = db.session.execute(_city_rows(model, city, state)).all()
+                return [row for row in rows if not index[kind].overlapping(row.id, start, end)]
+    return db.session.execute(available_rows(model, city, state, start_time, end_time)).all()
+
+
+#  Checking flushed shows
+#  ----------------------------------------------------------------
+
+
+def _booking(show, previous=False):
+    state = inspect(show)
+    values = []
+    for key in ('venue_id', 'artist_id', 'start_time', 'end_time'):
+        history = state.attrs[key].history
+        values.append(history.deleted[0] if previous and history.deleted else getattr(show, key))
+    return tuple(values)
+
+
+def _move(show_id, old, new):
+    for booking, sign in ((old, -1), (new, 1)):
+        if booking is None or booking[3] <= _bookings['horizon']:
+            continue
+        venue_id, artist_id, start_time, end_time = booking
+        for kind, key in (('venue', venue_id), ('artist', artist_id)):
+            if sign < 0:
+                _bookings[kind].remove(key, show_id)
+            else:
+                _bookings[kind].add(key, show_id, _seconds(start_time), _seconds(end_time))
+
+
+@event.listens_for(Session, 'before_flush')
+def _load_bookings(session, flush_context, instances):
+    # before the flush, so the index does not already hold the new rows
+    if any(isinstance(e, Show) for e in list(session.new) + list(session.dirty)) and not _in_database():
+        _bookings_index()
+
+
+@event.listens_for(Session, 'after_flush')
+def _reserve_bookings(session, flush_context):
+    if _in_database():
+        return
+    moves = session.info.setdefault('booking_moves', [])
+    with _bookings_lock:
+        for show in list(session.new) + list(session.dirty):
+            if not isinstance(show, Show):
+                continue
+            old = None if show in session.new else _booking(show, previous=True)
+            new = _booking(show)
+            if old == new:
+                continue
+            conflicts = booking_conflicts(*new, exclude_id=show.id)
+            if conflicts:
+                raise BookingConflict(conflicts)
+            _move(show.id, old, new)
+            moves.append((show.id, old, new))
+        for show in session.deleted:
+            if isinstance(show, Show):
+                moves.append((show.id, _booking(show, previous=True), None))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_booking_deletes(session):
+    with _bookings_lock:
+        for show_id, old, new in session.info.pop('booking_moves', []):
+            if new is None and _bookings:
+                _move(show_id, old, None)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _release_bookings(session):
+    with _bookings_lock:
+        for show_id, old, new in reversed(session.info.pop('booking_moves', [])):
+            if new is not None and _bookings:
+                _move(show_id, new, old)
+
+
+#  Commands
+#  ----------------------------------------------------------------
+
+
+@shows_cli.command('conflicts')
+def conflicts_command():
+    """List shows booked at the same venue or by the same artist at overlapping times."""
+    found = 0
+    for key in ('venue_id', 'artist_id'):
+        first, second = aliased(Show), aliased(Show)
+        pairs = db.session.execute(
+            select(getattr(first, key), first.id, first.start_time, second.id, second.start_time)
+            .join(second, and_(
+                getattr(first, key) == getattr(second, key),
+                first.id < second.id,
+                first.start_time < second.end_time,
+                second.start_time < first.end_time
+            ))
+            .order_by(getattr(first, key), first.start_time)
+        )
+        for entity_id, first_id, first_start, second_id, second_start in pairs:
+            found += 1
+            click.echo(f'{key[:-3]} {entity_id}: show {first_id} ({first_start}) overlaps show {second_id} ({second_start})')
+    click.echo(f'{found} conflicting pairs.')
@@ -0,0 +1,359 @@
+import asyncio
+import contextvars
+import itertools
+import json
+import statistics
+import subprocess
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from fyyur import db, cache
+from fyyur.instrumentation import capture_queries
+from fyyur.models import Venue, Artist
+
+# ----------------------------------------------------------------------------#
+# Route benchmarks.
+#
+# `flask bench` drives every route through the Flask test client against the
+# configured (seeded, see `flask seed`) database and reports p50/p95
+# latency, query count and peak Python memory per route as JSON.
+#
+# `flask bench-concurrency` puts the read routes under many concurrent
+# clients, once through the WSGI app with a fixed number of worker threads
+# and once through the ASGI app of fyyur/aio.py, and compares throughput.
+# ----------------------------------------------------------------------------#
+
+# Destructive routes that cannot be repeated against the same rows, and
+# uploads.
+SKIPPED_ENDPOINTS = {
+    'main.delete_venue', 'main.delete_artist', 'main.import_data', 'main.edit_data', 'static', 'assets.dist'
+}
+
+
+def _venue_form(venue, genre_id=1):
+    return {
+        'name': f'Bench Venue {time.perf_counter_ns()}', 'city': venue.city, 'state': venue.state,
+        'address': '1 Bench St', 'phone': '555-555-5555', 'genres': [str(genre_id)], 'image_link': '',
+        'website_link': '', 'facebook_link': '', 'seeking_description': '',
+    }
+
+
+def _artist_form(artist, genre_id=1):
+    return {
+        'name': f'Bench Artist {time.perf_counter_ns()}', 'city': artist.city, 'state': artist.state,
+        'phone': '555-555-5555', 'genres': [str(genre_id)], 'image_link': '',
+        'website_link': '', 'facebook_link': '', 'seeking_description': '',
+    }
+
+
+def _edit_form(make_form, entity):
+    # saves the form as loaded, genres included
+    genre_ids = [genre.id for genre in entity.genres] or [1]
+    return dict(make_form(entity, genre_ids[0]), name=entity.name, genres=[str(g) for g in genre_ids])
+
+
+def route_requests(include_writes):
+    # The busiest venue and artist make the detail pages a worst case.
+    venue = Venue.query.order_by(Venue.num_past_shows.desc()).first()
+    artist = Artist.query.order_by(Artist.num_past_shows.desc()).first()
+    if venue is None or artist is None:
+        raise click.ClickException('The database is empty, run `flask seed` first.')
+    term = venue.name.split()[0]
+    # a two-hour slot a week out, on the hour like the seeded shows
+    start = (datetime.now() + timedelta(days=7)).replace(minute=0, second=0, microsecond=0)
+    window = {'start': start.isoformat(), 'end': (start + timedelta(hours=2)).isoformat()}
+    requests = [
+        ('main.index', 'GET', '/', None),
+        ('main.venues', 'GET', '/venues', None),
+        ('main.venues_area', 'GET', f'/venues/area?city={venue.city}&state={venue.state}', None),
+        ('main.search_venues', 'POST', '/venues/search', {'search_term': term}),
+        ('main.show_venue', 'GET', f'/venues/{venue.id}', None),
+        ('main.create_venue_form', 'GET', '/venues/create', None),
+        ('main.edit_venue', 'GET', f'/venues/{venue.id}/edit', None),
+        ('main.artists', 'GET', '/artists', None),
+        ('main.search_artists', 'POST', '/artists/search', {'search_term': term}),
+        ('main.show_artist', 'GET', f'/artists/{artist.id}', None),
+        ('main.create_artist_form', 'GET', '/artists/create', None),
+        ('main.edit_artist', 'GET', f'/artists/{artist.id}/edit', None),
+        ('main.shows', 'GET', '/shows', None),
+        ('main.create_shows', 'GET', '/shows/create', None),
+        ('main.cache_stats', 'GET', '/cache/stats', None),
+        ('main.pool_stats_view', 'GET', '/pool/stats', None),
+        ('metrics', 'GET', '/metrics', None),
+        ('api_v1.venues', 'GET', '/api/v1/venues', None),
+        ('api_v1.venue_facets', 'GET', '/api/v1/venues/facets', None),
+        ('api_v1.venue', 'GET', f'/api/v1/venues/{venue.id}', None),
+        ('api_v1.available_venues', 'GET', '/api/v1/venues/available?' + urlencode(dict(window, city=venue.city)), None),
+        ('api_v1.artists', 'GET', '/api/v1/artists', None),
+        ('api_v1.artist_facets', 'GET', '/api/v1/artists/facets', None),
+        ('api_v1.artist', 'GET', f'/api/v1/artists/{artist.id}', None),
+        ('api_v1.available_artists', 'GET', '/api/v1/artists/available?' + urlencode(dict(window, city=artist.city)), None),
+        ('api_v1.shows', 'GET', '/api/v1/shows', None),
+        ('api_v1.search_entities', 'GET', f'/api/v1/search?q={term}', None),
+    ]
+    if include_writes:
+        # every show a later slot past the seeded ones, a repeated booking would conflict
+        first = (datetime.now() + timedelta(days=2 * 365)).replace(minute=0, second=0, microsecond=0)
+        slots = itertools.count()
+        requests += [
+            ('main.create_venue_submission', 'POST', '/venues/create', lambda: _venue_form(venue)),
+            ('main.edit_venue_submission', 'POST', f'/venues/{venue.id}/edit', _edit_form(_venue_form, venue)),
+            ('main.create_artist_submission', 'POST', '/artists/create', lambda: _artist_form(artist)),
+            ('main.edit_artist_submission', 'POST', f'/artists/{artist.id}/edit', _edit_form(_artist_form, artist)),
+            ('main.create_show_submission', 'POST', '/shows/create',
+             lambda: {'venue_id': venue.id, 'artist_id': artist.id,
+                      'start_time': (first + timedelta(hours=3 * next(slots))).strftime('%Y-%m-%d %H:%M:%S')}),
+        ]
+    db.session.close()
+    return requests
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _open(client, method, url, data):
+    response = client.open(url, method=method, data=data() if callable(data) else data)
+    response.get_data()
+    response.close()
+    return response
+
+
+def _call(client, method, url, data):
+    # Outside the CLI's app context, like a request to a server: its
+    # session, identity map and batch loader would carry over otherwise.
+    return contextvars.Context().run(_open, client, method, url, data)
+
+
+def bench_route(client, method, url, data, iterations):
+    _call(client, method, url, data)  # warm up caches, templates and the pool
+
+    timings, queries, status = [], [], None
+    for _ in range(iterations):
+        with capture_queries() as captured:
+            started = time.perf_counter()
+            response = _call(client, method, url, data)
+            timings.append(time.perf_counter() - started)
+        queries.append(captured.count)
+        status = response.status_code
+
+    tracemalloc.start()
+    _call(client, method, url, data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'method': method,
+        'url': url,
+        'status': status,
+        'iterations': iterations,
+        'p50_ms': round(_percentile(timings, 50) * 1000, 3),
+        'p95_ms': round(_percentile(timings, 95) * 1000, 3),
+        'mean_ms': round(statistics.mean(timings) * 1000, 3),
+        'queries': max(queries),
+        'peak_memory_kib': round(peak / 1024, 1),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _delta(before, after):
+    if not before:
+        return ''
+    return f'{(after - before) / before * 100:+.0f}%'
+
+
+@click.command('bench')
+@click.option('--iterations', default=20, show_default=True, help='Timed requests per route.')
+@click.option('--output', default='bench_results.json', show_default=True, type=click.Path())
+@click.option('--compare', type=click.Path(exists=True), help='Earlier results file to compare against.')
+@click.option('--writes/--no-writes', default=False, show_default=True, help='Also benchmark form submissions (adds rows).')
+@click.option('--cache/--no-cache', 'use_cache', default=False, show_default=True, help='Keep the page cache enabled.')
+@with_appcontext
+def bench_command(iterations, output, compare, writes, use_cache):
+    """Benchmark every route and save the results as JSON."""
+    current_app.config['WTF_CSRF_ENABLED'] = False
+    cache.enabled = use_cache
+    client = current_app.test_client()
+
+    routes = {}
+    for name, method, url, data in route_requests(writes):
+        routes[name] = bench_route(client, method, url, data, iterations)
+
+    missing = sorted({rule.endpoint for rule in current_app.url_map.iter_rules()} - set(routes) - SKIPPED_ENDPOINTS)
+
+    results = {
+        'commit': _git_commit(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'database': db.engine.url.render_as_string(hide_password=True),
+        'cache': use_cache,
+        'routes': routes,
+    }
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    previous = {}
+    if compare:
+        with open(compare) as f:
+            previous = json.load(f).get('routes', {})
+    click.echo(f'{"route":<32}{"p50 ms":>10}{"p95 ms":>10}{"queries":>9}{"peak KiB":>10}')
+    for name, result in routes.items():
+        line = f'{name:<32}{result["p50_ms"]:>10}{result["p95_ms"]:>10}{result["queries"]:>9}{result["peak_memory_kib"]:>10}'
+        if name in previous:
+            line += f'   p50 {_delta(previous[name]["p50_ms"], result["p50_ms"])}, queries {previous[name]["queries"]} -> {result["queries"]}'
+        click.echo(line)
+    if missing:
+        click.echo(f'Not benchmarked: {", ".join(missing)}' + ('' if writes else ' (form submissions need --writes)'))
+    click.echo(f'Results written to {output}')
+
+
+#  Concurrency
+#  ----------------------------------------------------------------
+
+
+def _summary(latencies, statuses, elapsed):
+    return {
+        'requests': len(latencies),
+        'errors': sum(1 for status in statuses if status is None or status >= 500),
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(_percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(_percentile(latencies, 95) * 1000, 3),
+    }
+
+
+def bench_wsgi(app, requests, clients, total, threads):
+    # A threaded WSGI server: `clients` callers queue for `threads` workers.
+    local = threading.local()
+    latencies, statuses = [], []
+    lock = threading.Lock()
+    remaining = iter(range(total))
+
+    def handle(method, url, data):
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        return _call(local.client, method, url, data).status_code
+
+    def client(workers):
+        while True:
+            with lock:
+                i = next(remaining, None)
+            if i is None:
+                return
+            _, method, url, data = requests[i % len(requests)]
+            started = time.perf_counter()
+            status = workers.submit(handle, method, url, data).result()
+            with lock:
+                latencies.append(time.perf_counter() - started)
+                statuses.append(status)
+
+    with ThreadPoolExecutor(threads) as workers:
+        callers = [threading.Thread(target=client, args=(workers,)) for _ in range(clients)]
+        started = time.perf_counter()
+        for caller in callers:
+            caller.start()
+        for caller in callers:
+            caller.join()
+        elapsed = time.perf_counter() - started
+    return _summary(latencies, statuses, elapsed)
+
+
+async def _asgi_call(application, method, url, data):
+    path, _, query = url.partition('?')
+    body = urlencode(data, doseq=True).encode() if data else b''
+    headers = [(b'host', b'localhost')]
+    if body:
+        headers += [(b'content-type', b'application/x-www-form-urlencoded'), (b'content-length', str(len(body)).encode())]
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method, 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': headers, 'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+    }
+    status = None
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    await application(scope, receive, send)
+    return status
+
+
+async def _bench_asgi(requests, clients, total):
+    from fyyur.aio import application, async_db
+    latencies, statuses = [], []
+    remaining = iter(range(total))
+
+    async def client():
+        for i in remaining:
+            _, method, url, data = requests[i % len(requests)]
+            started = time.perf_counter()
+            statuses.append(await _asgi_call(application, method, url, data))
+            latencies.append(time.perf_counter() - started)
+
+    await _asgi_call(application, 'GET', '/', None)  # open the async pool
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+    await async_db.dispose()
+    return _summary(latencies, statuses, elapsed)
+
+
+def bench_asgi(requests, clients, total):
+    # Outside the CLI's app context, like under an ASGI server: requests
+    # would share it (and its session) otherwise.
+    return contextvars.Context().run(asyncio.run, _bench_asgi(requests, clients, total))
+
+
+@click.command('bench-concurrency')
+@click.option('--clients', default=200, show_default=True, help='Concurrent clients.')
+@click.option('--requests', 'total', default=2000, show_default=True, help='Requests per server.')
+@click.option('--threads', default=16, show_default=True, help='Worker threads of the WSGI server.')
+@click.option('--output', type=click.Path(), help='Also save the results as JSON.')
+@click.option('--cache/--no-cache', 'use_cache', default=False, show_default=True, help='Keep the page cache enabled.')
+@with_appcontext
+def bench_concurrency_command(clients, total, threads, output, use_cache):
+    """Compare WSGI and ASGI throughput of the read routes."""
+    from fyyur.aio import ASYNC_VIEWS
+    app = current_app._get_current_object()
+    cache.enabled = use_cache
+    requests = [r for r in route_requests(False) if r[0] in ASYNC_VIEWS]
+    for name, method, url, data in requests:
+        _call(app.test_client(), method, url, data)  # warm up caches, templates and the pool
+
+    results = {
+        'commit': _git_commit(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'database': db.engine.url.render_as_string(hide_password=True),
+        'clients': clients,
+        'routes': [name for name, _, _, _ in requests],
+        'wsgi': bench_wsgi(app, requests, clients, total, threads),
+        'asgi': bench_asgi(requests, clients, total),
+    }
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    click.echo(f'{clients} clients, {total} requests over {", ".join(results["routes"])}')
+    click.echo(f'{"server":<22}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"errors":>8}')
+    for server, label in (('wsgi', f'wsgi ({threads} threads)'), ('asgi', 'asgi')):
+        result = results[server]
+        click.echo(f'{label:<22}{result["requests_per_second"]:>10}{result["p50_ms"]:>10}{result["p95_ms"]:>10}{result["errors"]:>8}')
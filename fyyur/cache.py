@@ -0,0 +1,196 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+from functools import wraps
+
+from flask import request, session
+
+# ----------------------------------------------------------------------------#
+# Page and fragment cache.
+#
+# Cached entries are keyed by route (or fragment name) plus the current
+# version of every entity they were rendered from. Handlers that change data
+# bump those versions, so stale entries are never looked up again and simply
+# age out of the LRU/TTL store.
+# ----------------------------------------------------------------------------#
+
+
+class MemoryBackend:
+    # Per-process store, fine for development and single-worker deployments.
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.versions = {}
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_versions(self, names):
+        with self.lock:
+            return [self.versions.get(name, 0) for name in names]
+
+    def bump(self, names):
+        with self.lock:
+            for name in names:
+                self.versions[name] = self.versions.get(name, 0) + 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def info(self):
+        return {'entries': len(self.entries), 'max_entries': self.max_entries, 'evictions': self.evictions}
+
+
+class RedisBackend:
+    # Shared store for multi-worker deployments; Redis applies the TTL and,
+    # with an allkeys-lru maxmemory policy, the LRU bound.
+
+    def __init__(self, url, prefix='fyyur:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return value.decode() if value is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, value.encode(), ex=int(ttl))
+
+    def get_versions(self, names):
+        if not names:
+            return []
+        return [int(v or 0) for v in self.client.mget([self.prefix + 'v:' + n for n in names])]
+
+    def bump(self, names):
+        pipe = self.client.pipeline()
+        for name in names:
+            pipe.incr(self.prefix + 'v:' + name)
+        pipe.execute()
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + 'page:*'):
+            self.client.delete(key)
+
+    def info(self):
+        return {'backend': 'redis'}
+
+
+def _dependency_name(dependency):
+    return ':'.join(str(part) for part in dependency)
+
+
+class ResponseCache:
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.enabled = False
+        self.ttl = 300
+        self.hits = 0
+        self.misses = 0
+        # wraps every render whose result is stored
+        self.render_context = nullcontext
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CACHE_ENABLED', True)
+        app.config.setdefault('CACHE_BACKEND', 'memory')
+        app.config.setdefault('CACHE_MAX_ENTRIES', 1000)
+        app.config.setdefault('CACHE_DEFAULT_TTL', 300)
+        self.enabled = app.config['CACHE_ENABLED']
+        self.ttl = app.config['CACHE_DEFAULT_TTL']
+        if app.config['CACHE_BACKEND'] == 'redis':
+            self.backend = RedisBackend(app.config['CACHE_REDIS_URL'])
+        else:
+            self.backend = MemoryBackend(app.config['CACHE_MAX_ENTRIES'])
+        app.extensions['response_cache'] = self
+
+    def _key(self, name, dependencies):
+        names = [_dependency_name(d) for d in dependencies]
+        versions = self.backend.get_versions(names)
+        return 'page:' + name + '|' + ','.join(f'{n}@{v}' for n, v in zip(names, versions))
+
+    def fragment(self, name, dependencies, render, ttl=None):
+        if not self.enabled:
+            return render()
+        key, value = self.lookup(name, dependencies)
+        if value is None:
+            with self.render_context():
+                value = render()
+            self.store(key, value, ttl)
+        return value
+
+    def page_applies(self):
+        # pages carrying flashed messages are per-user, never cache them
+        return self.enabled and request.method == 'GET' and not session.get('_flashes')
+
+    def lookup(self, name, dependencies):
+        # Returns the entry's key and the cached value, None on a miss.
+        key = self._key(name, dependencies)
+        value = self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return key, value
+
+    def store(self, key, value, ttl=None):
+        self.backend.set(key, value, ttl or self.ttl)
+
+    def page(self, dependencies, ttl=None):
+        # `dependencies` maps the view arguments to the entity versions the
+        # page is rendered from, e.g. lambda venue_id: [('venue', venue_id)].
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**kwargs):
+                if not self.page_applies():
+                    return view(**kwargs)
+                key, value = self.lookup(request.full_path, dependencies(**kwargs))
+                if value is not None:
+                    return value, {'X-Cache': 'HIT'}
+                with self.render_context():
+                    response = view(**kwargs)
+                if isinstance(response, str):
+                    self.store(key, response, ttl)
+                    return response, {'X-Cache': 'MISS'}
+                return response
+            wrapper.cache_dependencies = dependencies
+            return wrapper
+        return decorator
+
+    def invalidate(self, *dependencies):
+        if self.backend is not None:
+            self.backend.bump([_dependency_name(d) for d in dependencies])
+
+    def stats(self):
+        total = self.hits + self.misses
+        stats = {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 3) if total else None
+        }
+        stats.update(self.backend.info())
+        return stats
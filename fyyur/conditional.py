@@ -0,0 +1,192 @@
+import hashlib
+import os
+import subprocess
+import threading
+from datetime import timezone
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+from sqlalchemy import event, func, inspect, select, update
+from sqlalchemy.orm import Session
+
+from fyyur import db
+from fyyur.assets import manifest
+from fyyur.models import Venue, Artist, Show
+
+# ----------------------------------------------------------------------------#
+# Conditional GET.
+#
+# Venues and artists carry an updated_at that moves on every edit, genre
+# change and show change (the counter updates in fyyur/counters.py touch it)
+# and when a show partner's name or image changes. Views decorated with
+# @conditional run one version query first and answer a matching
+# If-None-Match / If-Modified-Since with a 304 without rendering anything;
+# otherwise the response gets the ETag and Last-Modified headers. ETags
+# include the build (BUILD_ID or the git commit, and the asset manifest), so
+# a deploy changes them even when the data did not.
+# ----------------------------------------------------------------------------#
+
+# Venue/Artist attributes shown on the other side's pages.
+SHOWN_ON_PARTNER_PAGES = ('name', 'image_link')
+
+
+class EntityVersion:
+    # Version of a single venue or artist page, by primary key. The statement
+    # is exposed for the async read path, see fyyur/aio.py.
+
+    def __init__(self, model):
+        self.model = model
+
+    def statement(self, **view_args):
+        entity_id = next(iter(view_args.values()))
+        return select(self.model.updated_at).where(self.model.id == entity_id)
+
+    def from_row(self, row):
+        if row is None or row[0] is None:
+            return None  # let the view answer the 404
+        return row[0], row[0].isoformat()
+
+    def __call__(self, **view_args):
+        return self.from_row(db.session.execute(self.statement(**view_args)).first())
+
+
+class TableVersion:
+    # Version of pages listing whole tables: the latest updated_at plus the
+    # row count, which catches deletes. One query for all `models`.
+
+    def __init__(self, *models):
+        self.models = models
+
+    def statement(self, **view_args):
+        columns = []
+        for model in self.models:
+            columns.append(select(func.max(model.updated_at)).scalar_subquery())
+            columns.append(select(func.count(model.id)).scalar_subquery())
+        return select(*columns)
+
+    def from_row(self, row):
+        stamps = [stamp for stamp in row[::2] if stamp is not None]
+        return (max(stamps) if stamps else None), ':'.join(str(value) for value in row)
+
+    def __call__(self, **view_args):
+        return self.from_row(db.session.execute(self.statement(**view_args)).one())
+
+
+def _not_modified(etag, last_modified):
+    # If-None-Match wins over If-Modified-Since when both are sent
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified is not None:
+        return _http_time(last_modified) <= request.if_modified_since
+    return False
+
+
+def _http_time(value):
+    # HTTP dates have whole seconds; updated_at is naive, sent as UTC
+    return value.replace(microsecond=0, tzinfo=timezone.utc)
+
+
+def conditional_applies():
+    # pages carrying flashed messages are per-user, always render them
+    return request.method in ('GET', 'HEAD') and not session.get('_flashes')
+
+
+_code = None
+_build = (None, None)
+_build_lock = threading.Lock()
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(__file__), stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_id():
+    # Pages change with the templates and link the built assets by name. The
+    # code part is read once per process, the manifest part follows
+    # `flask assets build` (reload_manifest()).
+    global _code, _build
+    assets = manifest()
+    if _build[0] is not assets:
+        with _build_lock:
+            if _code is None:
+                _code = current_app.config.get('BUILD_ID') or _git_commit() or ''
+            _build = (assets, hashlib.sha1(f'{_code}|{sorted(assets.items())}'.encode()).hexdigest())
+    return _build[1]
+
+
+def precondition(state):
+    # `state` is (last_modified, token). Returns the validators for the
+    # response and a 304 response when the client's copy is current.
+    last_modified, token = state
+    etag = hashlib.sha1(f'{build_id()}|{request.full_path}|{token}'.encode()).hexdigest()
+    if _not_modified(etag, last_modified):
+        return (etag, last_modified), current_app.response_class(status=304)
+    return (etag, last_modified), None
+
+
+def with_validators(response, validators):
+    etag, last_modified = validators
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = _http_time(last_modified)
+    # caches may keep the page but must revalidate it
+    response.cache_control.no_cache = True
+    return response
+
+
+def conditional(version):
+    # `version(**view_args)` returns (last_modified, token) or None to skip.
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            if not conditional_applies():
+                return view(**kwargs)
+            state = version(**kwargs)
+            if state is None:
+                return view(**kwargs)
+            validators, response = precondition(state)
+            if response is None:
+                response = make_response(view(**kwargs))
+                if response.status_code != 200:
+                    return response
+            return with_validators(response, validators)
+        wrapper.conditional_version = version
+        return wrapper
+    return decorator
+
+
+#  Keeping updated_at current
+#  ----------------------------------------------------------------
+
+
+@event.listens_for(Session, 'before_flush')
+def _touch_modified(session, flush_context, instances):
+    # onupdate only fires when a column changed, genre changes count too
+    for entity in session.dirty:
+        if isinstance(entity, (Venue, Artist)) and session.is_modified(entity):
+            entity.updated_at = func.now()
+
+
+@event.listens_for(Session, 'after_flush')
+def _touch_partners(session, flush_context):
+    # a renamed artist changes the page of every venue it played, and back
+    for entity in session.dirty:
+        if not isinstance(entity, (Venue, Artist)):
+            continue
+        state = inspect(entity)
+        if not any(state.attrs[key].history.has_changes() for key in SHOWN_ON_PARTNER_PAGES):
+            continue
+        if isinstance(entity, Venue):
+            partner, own_key, partner_key = Artist, Show.venue_id, Show.artist_id
+        else:
+            partner, own_key, partner_key = Venue, Show.artist_id, Show.venue_id
+        session.connection().execute(
+            update(partner.__table__)
+            .where(partner.__table__.c.id.in_(select(partner_key).where(own_key == entity.id)))
+            .values(updated_at=func.now())
+        )
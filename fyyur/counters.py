@@ -0,0 +1,203 @@
+from collections import Counter, defaultdict
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import and_, bindparam, event, func, inspect, or_, select, update
+
+from fyyur import db, cache
+from fyyur.models import Venue, Artist, Show
+
+# ----------------------------------------------------------------------------#
+# Show counters.
+#
+# Venue and Artist carry num_upcoming_shows / num_past_shows so list pages can
+# read them without a COUNT per row. Show.is_upcoming records which of the two
+# counters a show currently sits in; the mapper events below keep the counters
+# in step with inserts, updates and deletes, `flask shows rollover` moves shows
+# whose start time has passed and `flask shows reconcile` repairs drift.
+# A show counts while both its venue and its artist exist: deleting either
+# takes it out of both counters at once, before `flask purge` removes it.
+# ----------------------------------------------------------------------------#
+
+
+def _bump(connection, model, entity_id, upcoming, delta):
+    # a show change also changes the venue/artist page, touch updated_at
+    column = model.num_upcoming_shows if upcoming else model.num_past_shows
+    connection.execute(
+        update(model.__table__)
+        .where(model.__table__.c.id == entity_id)
+        .values({column.key: column + delta, 'updated_at': func.now()})
+    )
+
+
+def _previous(state, key):
+    history = state.attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(state.object, key)
+
+
+def _load_previous(target, value, oldvalue, initiator):
+    pass
+
+
+# Setting an expired attribute (after a commit) keeps no history unless the
+# old value is loaded first; the counters and the booking index need it.
+for _key in ('venue_id', 'artist_id', 'start_time', 'end_time'):
+    event.listen(getattr(Show, _key), 'set', _load_previous, active_history=True)
+
+
+@event.listens_for(Show, 'before_insert')
+def _show_before_insert(mapper, connection, show):
+    show.is_upcoming = show.start_time > datetime.now()
+
+
+@event.listens_for(Show, 'after_insert')
+def _show_after_insert(mapper, connection, show):
+    _bump(connection, Venue, show.venue_id, show.is_upcoming, 1)
+    _bump(connection, Artist, show.artist_id, show.is_upcoming, 1)
+
+
+@event.listens_for(Show, 'before_update')
+def _show_before_update(mapper, connection, show):
+    state = inspect(show)
+    if not any(state.attrs[key].history.has_changes() for key in ('venue_id', 'artist_id', 'start_time')):
+        return
+    was_upcoming = _previous(state, 'is_upcoming')
+    _bump(connection, Venue, _previous(state, 'venue_id'), was_upcoming, -1)
+    _bump(connection, Artist, _previous(state, 'artist_id'), was_upcoming, -1)
+    show.is_upcoming = show.start_time > datetime.now()
+    _bump(connection, Venue, show.venue_id, show.is_upcoming, 1)
+    _bump(connection, Artist, show.artist_id, show.is_upcoming, 1)
+
+
+@event.listens_for(Show, 'after_delete')
+def _show_after_delete(mapper, connection, show):
+    _bump(connection, Venue, show.venue_id, show.is_upcoming, -1)
+    _bump(connection, Artist, show.artist_id, show.is_upcoming, -1)
+
+
+def count_inserted_shows(shows):
+    # Counter updates for show rows inserted without the ORM (bulk imports),
+    # one executemany per table. `shows` are dicts with venue_id, artist_id
+    # and is_upcoming.
+    _count_shows_without_orm(shows, 1)
+
+
+def count_deleted_shows(shows):
+    # The same for show rows deleted without the ORM.
+    _count_shows_without_orm(shows, -1)
+
+
+def _counted():
+    # shows whose venue and artist are both not deleted
+    return and_(
+        select(Venue.id).where(Venue.id == Show.venue_id, Venue.deleted_at.is_(None)).exists(),
+        select(Artist.id).where(Artist.id == Show.artist_id, Artist.deleted_at.is_(None)).exists()
+    )
+
+
+def count_hidden_shows(model, entity_id):
+    # Takes the shows of a venue or artist about to be deleted out of the
+    # counters, its partners' updated_at moves with them so their pages
+    # revalidate. Call it before setting deleted_at.
+    show_key = Show.venue_id if model is Venue else Show.artist_id
+    shows = db.session.execute(
+        select(Show.venue_id, Show.artist_id, Show.is_upcoming).where(show_key == entity_id, _counted())
+    ).all()
+    if shows:
+        count_deleted_shows([show._asdict() for show in shows])
+    return len(shows)
+
+
+def _count_shows_without_orm(shows, sign):
+    for model, key in ((Venue, 'venue_id'), (Artist, 'artist_id')):
+        counts = defaultdict(lambda: [0, 0])
+        for show in shows:
+            counts[show[key]][0 if show['is_upcoming'] else 1] += sign
+        table = model.__table__
+        db.session.execute(
+            update(table)
+            .where(table.c.id == bindparam('entity_id'))
+            .values(
+                num_upcoming_shows=table.c.num_upcoming_shows + bindparam('upcoming'),
+                num_past_shows=table.c.num_past_shows + bindparam('past'),
+                updated_at=func.now()
+            ),
+            [{'entity_id': i, 'upcoming': upcoming, 'past': past} for i, (upcoming, past) in counts.items()]
+        )
+
+
+def rollover_shows(now=None):
+    # Move shows that started since the last run from upcoming to past.
+    now = now or datetime.now()
+    started = db.session.query(Show.id, Show.venue_id, Show.artist_id, _counted().label('counted')).filter(
+        Show.is_upcoming.is_(True),
+        Show.start_time <= now
+    ).with_for_update().all()
+    if not started:
+        return 0
+    for model, key in ((Venue, 'venue_id'), (Artist, 'artist_id')):
+        moved = Counter(getattr(show, key) for show in started if show.counted)
+        for entity_id, count in moved.items():
+            db.session.execute(
+                update(model.__table__)
+                .where(model.__table__.c.id == entity_id)
+                .values(
+                    num_upcoming_shows=model.num_upcoming_shows - count,
+                    num_past_shows=model.num_past_shows + count,
+                    updated_at=func.now()
+                )
+            )
+    db.session.execute(
+        update(Show.__table__)
+        .where(Show.__table__.c.id.in_([show.id for show in started]))
+        .values(is_upcoming=False)
+    )
+    db.session.commit()
+    cache.invalidate(('shows',))
+    return len(started)
+
+
+def _count_shows(model, fk, upcoming):
+    return select(func.count(Show.id)).where(
+        fk == model.id,
+        Show.is_upcoming.is_(upcoming),
+        _counted()
+    ).scalar_subquery()
+
+
+def reconcile_counters(now=None):
+    # Recompute every flag and counter from the shows table.
+    now = now or datetime.now()
+    db.session.execute(update(Show.__table__).values(is_upcoming=Show.start_time > now))
+    for model, fk in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+        upcoming = _count_shows(model, fk, True)
+        past = _count_shows(model, fk, False)
+        # only rows that drifted, so updated_at moves only where pages changed
+        db.session.execute(
+            update(model.__table__)
+            .where(or_(model.num_upcoming_shows != upcoming, model.num_past_shows != past))
+            .values(num_upcoming_shows=upcoming, num_past_shows=past, updated_at=func.now())
+        )
+    db.session.commit()
+    cache.invalidate(('shows',))
+
+
+@click.group('shows', cls=AppGroup)
+def shows_cli():
+    """Maintain the show counters on venues and artists."""
+
+
+@shows_cli.command('rollover')
+def rollover_command():
+    """Move shows whose start time has passed to the past counters."""
+    click.echo(f'{rollover_shows()} shows rolled over.')
+
+
+@shows_cli.command('reconcile')
+def reconcile_command():
+    """Recompute all show counters from the shows table."""
+    reconcile_counters()
+    click.echo('Show counters reconciled.')
@@ -0,0 +1,69 @@
+from itertools import groupby
+
+from sqlalchemy import func
+
+from fyyur import db
+from fyyur.models import Venue
+
+# ----------------------------------------------------------------------------#
+# Venue directory.
+# ----------------------------------------------------------------------------#
+
+
+# Sort key of the directory, also used as the pagination key.
+DIRECTORY_ORDER = (Venue.state, Venue.city, Venue.name, Venue.id)
+
+
+def venue_rows(city=None, state=None):
+    # One statement for the whole directory, the upcoming show count is the
+    # counter column maintained in fyyur/counters.py.
+    query = db.session.query(
+        Venue.id,
+        Venue.name,
+        Venue.city,
+        Venue.state,
+        Venue.num_upcoming_shows
+    )
+    if city is not None:
+        query = query.filter(Venue.city == city)
+    if state is not None:
+        query = query.filter(Venue.state == state)
+    return query
+
+
+def group_areas(rows):
+    data = []
+    for (area_city, area_state), area_rows in groupby(rows, key=lambda r: (r.city, r.state)):
+        data.append({
+            "city": area_city,
+            "state": area_state,
+            "venues": [{
+                "id": row.id,
+                "name": row.name,
+                "num_upcoming_shows": row.num_upcoming_shows
+            } for row in area_rows]
+        })
+    return data
+
+
+def venue_directory(city=None, state=None):
+    return group_areas(venue_rows(city, state).order_by(*DIRECTORY_ORDER).all())
+
+
+def area_rows():
+    # grouped in index order (state, city) so the grouping can stream
+    return db.session.query(
+        Venue.city,
+        Venue.state,
+        func.count(Venue.id).label('num_venues')
+    ).group_by(Venue.state, Venue.city).order_by(Venue.state, Venue.city)
+
+
+def venue_areas():
+    # City/state headings only, used when areas are loaded one at a time.
+    areas = area_rows().all()
+    return [{
+        "city": area.city,
+        "state": area.state,
+        "num_venues": area.num_venues
+    } for area in areas]
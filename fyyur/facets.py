@@ -0,0 +1,126 @@
+import threading
+from collections import defaultdict
+
+from sqlalchemy import select
+
+from fyyur import db, replica_router
+from fyyur.conditional import TableVersion
+from fyyur.models import Venue, Artist, genres_venues, artists_genres
+
+# ----------------------------------------------------------------------------#
+# Facets.
+#
+# Venues and artists can be narrowed by genre, state, city and their seeking
+# flag. Each process keeps one bitmap per facet value (a Python int with bit
+# `id` set for every entity that has the value), so a filter is a few ORs and
+# ANDs and every facet count a popcount, whatever the filters and without a
+# COUNT per value. The bitmaps are rebuilt from two queries when the table
+# version (latest updated_at and row count, which genre changes also move)
+# differs from the one they were built at.
+# ----------------------------------------------------------------------------#
+
+
+def _bitmap(ids):
+    bits = bytearray(max(ids) // 8 + 1)
+    for i in ids:
+        bits[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def bitmap_ids(bitmap, after=None, before=None, limit=None):
+    # Ids set in `bitmap` in paging order: ascending from after `after`, or
+    # descending from before `before`.
+    ids = []
+    if before is not None:
+        bitmap &= (1 << before) - 1
+        while bitmap and len(ids) != limit:
+            i = bitmap.bit_length() - 1
+            ids.append(i)
+            bitmap ^= 1 << i
+        return ids
+    offset = 0 if after is None else after + 1
+    bitmap >>= offset
+    while bitmap and len(ids) != limit:
+        lowest = bitmap & -bitmap
+        ids.append(offset + lowest.bit_length() - 1)
+        bitmap ^= lowest
+    return ids
+
+
+class FacetIndex:
+
+    def __init__(self, model, link_table, link_key, seeking):
+        self.model = model
+        self.link_table = link_table
+        self.link_key = link_key
+        self.seeking = seeking
+        self.dimensions = ('genre', 'state', 'city', seeking)
+        # (table version, {dimension: {value: bitmap}}), replaced as a whole
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def _build(self):
+        members = {dimension: defaultdict(list) for dimension in self.dimensions}
+        model = self.model
+        for entity_id, state, city, seeking in db.session.execute(
+            select(model.id, model.state, model.city, getattr(model, self.seeking))
+        ):
+            members['state'][state].append(entity_id)
+            members['city'][city].append(entity_id)
+            members[self.seeking][bool(seeking)].append(entity_id)
+        key = self.link_table.c[self.link_key]
+        for entity_id, genre_id in db.session.execute(select(key, self.link_table.c.genre_id)):
+            members['genre'][genre_id].append(entity_id)
+        return {
+            dimension: {value: _bitmap(ids) for value, ids in values.items()}
+            for dimension, values in members.items()
+        }
+
+    def bitmaps(self):
+        # kept beyond the request, read and built from the primary
+        with replica_router.primary():
+            version = TableVersion(self.model)()[1]
+            snapshot = self._snapshot
+            if snapshot is None or snapshot[0] != version:
+                with self._lock:
+                    if self._snapshot is None or self._snapshot[0] != version:
+                        self._snapshot = (version, self._build())
+                    snapshot = self._snapshot
+        return snapshot[1]
+
+    def search(self, selected):
+        # `selected` maps dimensions to accepted values, any of them within a
+        # dimension and all dimensions together. Returns the bitmap of the
+        # matches and the counts per dimension and value, each counted with
+        # the filters of the other dimensions so a facet shows what picking
+        # another of its values would give.
+        bitmaps = self.bitmaps()
+        everything = 0
+        for bitmap in bitmaps[self.seeking].values():
+            everything |= bitmap
+        filters = {}
+        for dimension, values in selected.items():
+            if values:
+                union = 0
+                for value in values:
+                    union |= bitmaps[dimension].get(value, 0)
+                filters[dimension] = union
+        matching = everything
+        for bitmap in filters.values():
+            matching &= bitmap
+        counts = {}
+        for dimension, values in bitmaps.items():
+            base = matching
+            if dimension in filters:
+                base = everything
+                for other, bitmap in filters.items():
+                    if other != dimension:
+                        base &= bitmap
+            counts[dimension] = {value: (bitmap & base).bit_count() for value, bitmap in values.items()}
+        return matching, counts
+
+
+facet_indexes = {
+    Venue: FacetIndex(Venue, genres_venues, 'venue_id', 'seeking_talent'),
+    Artist: FacetIndex(Artist, artists_genres, 'artist_id', 'seeking_venue'),
+}
@@ -1,15 +1,29 @@
-import dateutil.parser
-import babel
+from datetime import datetime
+from functools import lru_cache
+
 
 # ----------------------------------------------------------------------------#
 # Filters.
 # ----------------------------------------------------------------------------#
 
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+
+@lru_cache(maxsize=None)
+def _compiled_format(format, locale):
+    # Parsing the pattern and the locale is most of babel's per-call cost.
+    # babel loads on the first call, not when the app starts.
+    from babel import Locale
+    from babel.dates import parse_pattern
+    return parse_pattern(DATETIME_FORMATS.get(format, format)), Locale.parse(locale)
+
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-      format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-      format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format, locale='en')
+def format_datetime(value, format='medium', locale='en'):
+    if not isinstance(value, datetime):
+        import dateutil.parser
+        value = dateutil.parser.parse(value)
+    pattern, locale = _compiled_format(format, locale)
+    return pattern.apply(value, locale)
@@ -0,0 +1,577 @@
+import csv
+import io
+import json
+import os
+import re
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta
+from itertools import islice
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import DBAPIError, SQLAlchemyError
+from sqlalchemy.orm import selectinload
+from werkzeug.datastructures import MultiDict
+from wtforms import BooleanField
+
+from fyyur import db, cache
+from fyyur.availability import (
+    IntervalIndex, booking_conflicts, describe_conflicts, index_bookings, is_booking_conflict
+)
+from fyyur.counters import count_inserted_shows
+from fyyur.forms import VenueForm, ArtistForm, ShowForm
+from fyyur.models import Venue, Artist, Show, genres_venues, artists_genres
+from fyyur.recent import listing_entry, recent_listings
+from fyyur.reference import genre_registry, sync_genres
+from fyyur.search import document_text, index_documents
+
+# ----------------------------------------------------------------------------#
+# Bulk import and edit.
+#
+# Rows from CSV or JSONL files are checked with the same forms the create
+# pages use and genres are resolved against the in-memory registry. Valid
+# rows are loaded a chunk per transaction, through COPY on Postgres and
+# executemany elsewhere; invalid rows are skipped and reported by line.
+# Bulk edits apply partial updates to existing venues and artists, all in
+# one transaction, writing only the columns and genre links that change.
+# ----------------------------------------------------------------------------#
+
+CHUNK_SIZE = 5000
+FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+TRUE_VALUES = {'1', 'true', 't', 'yes', 'y', 'on'}
+# form field -> column, where they differ
+FIELD_COLUMNS = {'website_link': 'website'}
+_GENRE_SEPARATOR = re.compile(r'\s*[;|,]\s*')
+_NULL = '\\N'
+
+Record = namedtuple('Record', 'line values genres')
+
+
+def detect_format(filename):
+    format = FORMATS.get(os.path.splitext(filename or '')[1].lower())
+    if format is None:
+        raise ValueError(f'Cannot tell the format of {filename!r}, expected .csv or .jsonl')
+    return format
+
+
+def read_rows(stream, format):
+    # Yields (line number, row dict); unparseable JSON lines yield None.
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            row.pop(None, None)  # values past the last header
+            yield reader.line_num, row
+    elif format == 'jsonl':
+        for line_num, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_num, row if isinstance(row, dict) else None
+    else:
+        raise ValueError(f'Unknown import format {format!r}')
+
+
+class ImportReport:
+
+    def __init__(self, kind, max_errors=1000):
+        self.kind = kind
+        self.max_errors = max_errors
+        self.rows = 0
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, line, errors):
+        self.failed += 1
+        if self.max_errors is None or len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def to_dict(self):
+        return {
+            'kind': self.kind,
+            'rows': self.rows,
+            'imported': self.imported,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
+
+
+def _form(form_class):
+    # one form per import, re-processed for every row
+    form = form_class(formdata=None, meta={'csrf': False})
+    if 'genres' in form:
+        form.genres.choices = genre_registry.choices()
+    return form
+
+
+def _flags(form):
+    return {field.name for field in form if isinstance(field, BooleanField)}
+
+
+def _genre_ids(form):
+    genre_ids = {str(genre_id): genre_id for genre_id, _ in form.genres.choices}
+    genre_ids.update((name.lower(), genre_id) for genre_id, name in form.genres.choices)
+    return genre_ids
+
+
+def _resolve_genres(names, genre_ids):
+    # genres may be given by name or id, as a list or a ';' separated string
+    names = names or []
+    if isinstance(names, str):
+        names = [n for n in _GENRE_SEPARATOR.split(names.strip()) if n]
+    genres = []
+    unknown = []
+    for name in names:
+        genre_id = genre_ids.get(str(name).strip().lower())
+        if genre_id is None:
+            unknown.append(str(name))
+        elif genre_id not in genres:
+            genres.append(genre_id)
+    return genres, unknown
+
+
+def _formdata(row, flags):
+    data = MultiDict()
+    for key, value in row.items():
+        if value is None:
+            continue
+        if isinstance(value, list):
+            data.setlist(key, [str(v) for v in value])
+        elif key in flags:
+            if str(value).strip().lower() in TRUE_VALUES:
+                data[key] = 'y'
+        else:
+            data[key] = str(value)
+    return data
+
+
+def _database_error(error):
+    return str(getattr(error, 'orig', None) or error).strip()
+
+
+def _validate(form, row, flags):
+    if row is None:
+        return {'row': ['Not a JSON object']}
+    form.process(_formdata(row, flags))
+    if not form.validate():
+        return form.errors
+    return None
+
+
+def _is_postgres():
+    return db.engine.dialect.name == 'postgresql'
+
+
+def _copy(table, rows):
+    columns = list(rows[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([_NULL if row[c] is None else row[c] for c in columns])
+    buffer.seek(0)
+    connection = db.session.connection()
+    statement = f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '{_NULL}')"
+    dbapi = connection.dialect.loaded_dbapi
+    try:
+        connection.connection.cursor().copy_expert(statement, buffer)
+    except dbapi.Error as e:
+        # the raw cursor bypasses SQLAlchemy, wrap the error the way
+        # execute() would (IntegrityError etc.) so _load() can split the chunk
+        raise DBAPIError.instance(statement, None, e, dbapi.Error, dialect=connection.dialect) from e
+
+
+def _insert(table, rows):
+    if not rows:
+        return
+    if _is_postgres():
+        _copy(table, rows)
+    else:
+        db.session.execute(insert(table), rows)
+
+
+def _reserve_ids(table, count):
+    # COPY cannot return generated keys, draw them from the sequence first
+    sequence = func.nextval(func.pg_get_serial_sequence(table.name, 'id'))
+    return db.session.scalars(select(sequence).select_from(func.generate_series(1, count))).all()
+
+
+class EntityImporter:
+    # Venues and artists: a row per entity plus its genre links.
+
+    def __init__(self, model, form_class, link_table, link_key):
+        self.model = model
+        self.form_class = form_class
+        self.link_table = link_table
+        self.link_key = link_key
+
+    def validate(self, chunk, report):
+        form = _form(self.form_class)
+        flags = _flags(form)
+        genre_ids = _genre_ids(form)
+        genre_names = dict(form.genres.choices)
+
+        records = []
+        for line, row in chunk:
+            unknown = []
+            if row is not None:
+                genres, unknown = _resolve_genres(row.get('genres'), genre_ids)
+                row = dict(row, genres=genres)
+            errors = _validate(form, row, flags)
+            if unknown:
+                errors = dict(errors or {}, genres=[f'Unknown genre: {", ".join(unknown)}'])
+            if errors:
+                report.error(line, errors)
+                continue
+            genres = form.genres.data
+            values = {FIELD_COLUMNS.get(field.name, field.name): field.data for field in form if field.name != 'genres'}
+            values['search_text'] = document_text(
+                [values['name'], values['city'], values['state']] + [genre_names[g] for g in genres]
+            )
+            records.append(Record(line, values, genres))
+        return records
+
+    def load(self, records):
+        table = self.model.__table__
+        rows = [record.values for record in records]
+        if _is_postgres():
+            ids = _reserve_ids(table, len(rows))
+            for row, entity_id in zip(rows, ids):
+                row['id'] = entity_id
+            _copy(table, rows)
+        else:
+            ids = db.session.scalars(
+                insert(table).returning(table.c.id, sort_by_parameter_order=True), rows
+            ).all()
+        _insert(self.link_table, [
+            {self.link_key: entity_id, 'genre_id': genre_id}
+            for entity_id, record in zip(ids, records) for genre_id in record.genres
+        ])
+        return ids
+
+    def rejected(self, record, error):
+        return {'row': [_database_error(error)]}
+
+    def loaded(self, records, ids):
+        index_documents(self.model, [(i, r.values['search_text']) for i, r in zip(ids, records)])
+        recent_listings.push(self.model.__tablename__, [
+            listing_entry(i, r.values['name'], r.values['city'], r.values['state'])
+            for i, r in reversed(list(zip(ids, records)))
+        ])
+        cache.invalidate((self.model.__tablename__,))
+
+
+class ShowImporter:
+
+    def validate(self, chunk, report):
+        form = _form(ShowForm)
+        checked = []
+        for line, row in chunk:
+            if row is not None and not row.get('start_time'):
+                # the field would fall back to its default, an import must say when
+                report.error(line, {'start_time': [form.start_time.validators[0].message]})
+                continue
+            errors = _validate(form, row, ())
+            if errors:
+                report.error(line, errors)
+            else:
+                end_time = form.start_time.data + timedelta(minutes=form.duration.data)
+                checked.append((line, form.venue_id.data, form.artist_id.data, form.start_time.data, end_time))
+
+        # one query per table for the whole chunk instead of a get() per row
+        venue_ids = set(db.session.scalars(select(Venue.id).where(Venue.id.in_({c[1] for c in checked}))))
+        artist_ids = set(db.session.scalars(select(Artist.id).where(Artist.id.in_({c[2] for c in checked}))))
+        now = datetime.now()
+        # bookings of this chunk so far, rows of a chunk may clash with each other
+        chunk_bookings = {'venue': IntervalIndex(), 'artist': IntervalIndex()}
+        records = []
+        for line, venue_id, artist_id, start_time, end_time in checked:
+            errors = {}
+            if venue_id not in venue_ids:
+                errors['venue_id'] = [f'Venue {venue_id} does not exist']
+            if artist_id not in artist_ids:
+                errors['artist_id'] = [f'Artist {artist_id} does not exist']
+            if errors:
+                report.error(line, errors)
+                continue
+            start, end = start_time.timestamp(), end_time.timestamp()
+            conflicts = [
+                (kind, show_line)
+                for kind, key in (('venue', venue_id), ('artist', artist_id))
+                for show_line in chunk_bookings[kind].overlapping(key, start, end)
+            ]
+            if not conflicts and not _is_postgres():
+                # Postgres rejects overlaps with its exclusion constraints
+                conflicts = booking_conflicts(venue_id, artist_id, start_time, end_time)
+            if conflicts:
+                report.error(line, {'start_time': [describe_conflicts(conflicts)]})
+                continue
+            chunk_bookings['venue'].add(venue_id, line, start, end)
+            chunk_bookings['artist'].add(artist_id, line, start, end)
+            records.append(Record(line, {
+                'venue_id': venue_id,
+                'artist_id': artist_id,
+                'start_time': start_time,
+                'end_time': end_time,
+                'is_upcoming': start_time > now,
+            }, None))
+        return records
+
+    def load(self, records):
+        table = Show.__table__
+        rows = [record.values for record in records]
+        ids = None
+        if _is_postgres():
+            _insert(table, rows)
+        else:
+            # ids for the in-process booking index
+            ids = db.session.scalars(
+                insert(table).returning(table.c.id, sort_by_parameter_order=True), rows
+            ).all()
+        # bulk rows skip the Show mapper events
+        count_inserted_shows(rows)
+        return ids
+
+    def rejected(self, record, error):
+        if not is_booking_conflict(error):
+            return {'row': [_database_error(error)]}
+        # Postgres leaves overlaps to its exclusion constraints, report them
+        # the way the pre-check does on other databases
+        values = record.values
+        conflicts = booking_conflicts(values['venue_id'], values['artist_id'], values['start_time'], values['end_time'])
+        return {'start_time': [describe_conflicts(conflicts) if conflicts else _database_error(error)]}
+
+    def loaded(self, records, ids):
+        if ids:
+            index_bookings([
+                (i, r.values['venue_id'], r.values['artist_id'], r.values['start_time'], r.values['end_time'])
+                for i, r in zip(ids, records)
+            ])
+        cache.invalidate(
+            ('shows',),
+            *{('venue', r.values['venue_id']) for r in records},
+            *{('artist', r.values['artist_id']) for r in records}
+        )
+
+
+IMPORTERS = {
+    'venues': EntityImporter(Venue, VenueForm, genres_venues, 'venue_id'),
+    'artists': EntityImporter(Artist, ArtistForm, artists_genres, 'artist_id'),
+    'shows': ShowImporter(),
+}
+
+
+def _load(importer, records, report):
+    # One transaction per chunk. When the database rejects it (a constraint
+    # the forms do not check), halve the chunk until the bad rows are found.
+    try:
+        ids = importer.load(records)
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        if len(records) > 1:
+            middle = len(records) // 2
+            _load(importer, records[:middle], report)
+            _load(importer, records[middle:], report)
+        else:
+            report.error(records[0].line, importer.rejected(records[0], e))
+    else:
+        report.imported += len(records)
+        importer.loaded(records, ids)
+
+
+def import_rows(kind, rows, chunk_size=CHUNK_SIZE, report=None, progress=None):
+    # `rows` yields (line number, dict) pairs, see read_rows().
+    importer = IMPORTERS[kind]
+    report = report or ImportReport(kind)
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        report.rows += len(chunk)
+        records = importer.validate(chunk, report)
+        if records:
+            _load(importer, records, report)
+        if progress is not None:
+            progress(report)
+    return report
+
+
+@click.command('import')
+@click.argument('kind', type=click.Choice(sorted(IMPORTERS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'format_', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+@click.option('--chunk-size', default=CHUNK_SIZE, show_default=True, type=click.IntRange(min=1))
+@click.option('--errors', type=click.Path(dir_okay=False), help='Write every rejected row to this JSONL file.')
+@with_appcontext
+def import_command(kind, path, format_, chunk_size, errors):
+    """Bulk import venues, artists or shows from a CSV or JSONL file."""
+    try:
+        format_ = format_ or detect_format(path)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='PATH')
+
+    def progress(report):
+        click.echo(f'\r{report.rows} rows read, {report.imported} imported, {report.failed} rejected', nl=False)
+
+    report = ImportReport(kind, max_errors=None if errors else 20)
+    with open(path, newline='', encoding='utf-8') as f:
+        import_rows(kind, read_rows(f, format_), chunk_size, report, progress)
+    click.echo()
+    if errors:
+        with open(errors, 'w') as f:
+            for error in report.errors:
+                f.write(json.dumps(error) + '\n')
+        click.echo(f'Rejected rows written to {errors}')
+    else:
+        for error in report.errors:
+            click.echo(f'line {error["line"]}: {json.dumps(error["errors"])}')
+
+
+#  Bulk edit
+#  ----------------------------------------------------------------
+
+EDITABLE = {
+    'venues': (Venue, VenueForm),
+    'artists': (Artist, ArtistForm),
+}
+
+
+class EditReport:
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.results = []
+
+    def add(self, line, entity_id, status, errors=None):
+        result = {'line': line, 'id': entity_id, 'status': status}
+        if errors:
+            result['errors'] = errors
+        self.results.append(result)
+
+    def to_dict(self):
+        counts = Counter(result['status'] for result in self.results)
+        return {
+            'kind': self.kind,
+            'rows': len(self.results),
+            'updated': counts['updated'],
+            'unchanged': counts['unchanged'],
+            'failed': counts['failed'],
+            'results': self.results,
+        }
+
+
+def _entity_id(row):
+    try:
+        return int(row.get('id'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _current_row(form, entity):
+    row = {
+        field.name: getattr(entity, FIELD_COLUMNS.get(field.name, field.name))
+        for field in form if field.name != 'genres'
+    }
+    row['genres'] = [genre.id for genre in entity.genres]
+    return row
+
+
+def edit_rows(kind, rows):
+    # `rows` yields (line number, dict) pairs holding an `id` and the fields
+    # to change. Each row is checked with the edit form against the stored
+    # values it leaves alone; rows that fail are reported and skipped, the
+    # rest are committed together.
+    model, form_class = EDITABLE[kind]
+    form = _form(form_class)
+    flags = _flags(form)
+    genre_ids = _genre_ids(form)
+    fields = {field.name for field in form}
+    rows = list(rows)
+    report = EditReport(kind)
+
+    # one query for the entities and one for their genres
+    ids = {_entity_id(row) for line, row in rows if row is not None} - {None}
+    entities = {
+        entity.id: entity
+        for entity in db.session.scalars(select(model).where(model.id.in_(ids)).options(selectinload(model.genres)))
+    }
+    updated = []
+    for line, row in rows:
+        if row is None:
+            report.add(line, None, 'failed', {'row': ['Not a JSON object']})
+            continue
+        entity = entities.get(_entity_id(row))
+        if entity is None:
+            report.add(line, row.get('id'), 'failed', {'id': [f'No {kind[:-1]} with id {row.get("id")}']})
+            continue
+        patch = {key: value for key, value in row.items() if key != 'id'}
+        unknown = sorted(set(patch) - fields)
+        if unknown:
+            report.add(line, entity.id, 'failed', {'row': [f'Unknown fields: {", ".join(unknown)}']})
+            continue
+        errors = {}
+        if 'genres' in patch:
+            patch['genres'], unknown = _resolve_genres(patch['genres'], genre_ids)
+            if unknown:
+                errors['genres'] = [f'Unknown genre: {", ".join(unknown)}']
+        # stored values the row does not touch are not judged again
+        form_errors = _validate(form, dict(_current_row(form, entity), **patch), flags) or {}
+        for name, messages in form_errors.items():
+            if name in patch and name not in errors:
+                errors[name] = messages
+        if errors:
+            report.add(line, entity.id, 'failed', errors)
+            continue
+
+        changed = False
+        for field in form:
+            if field.name in patch and field.name != 'genres':
+                column = FIELD_COLUMNS.get(field.name, field.name)
+                if getattr(entity, column) != field.data:
+                    setattr(entity, column, field.data)
+                    changed = True
+        if 'genres' in patch:
+            changed = sync_genres(entity, form.genres.data) or changed
+        report.add(line, entity.id, 'updated' if changed else 'unchanged')
+        if changed:
+            updated.append(entity.id)
+
+    try:
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        for result in report.results:
+            if result['status'] == 'updated':
+                result.update(status='failed', errors={'row': [str(getattr(e, 'orig', None) or e).strip()]})
+    else:
+        if updated:
+            cache.invalidate((kind,), *[(kind[:-1], entity_id) for entity_id in updated])
+    return report
+
+
+@click.command('bulk-edit')
+@click.argument('kind', type=click.Choice(sorted(EDITABLE)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'format_', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+@with_appcontext
+def bulk_edit_command(kind, path, format_):
+    """Apply partial updates to many venues or artists from a CSV or JSONL file."""
+    try:
+        format_ = format_ or detect_format(path)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='PATH')
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = read_rows(f, format_)
+        if format_ == 'csv':
+            # every line has every column, an empty cell leaves the field as it is
+            rows = ((line, {key: value for key, value in row.items() if value != ''}) for line, row in rows)
+        report = edit_rows(kind, rows).to_dict()
+    click.echo(f'{report["updated"]} updated, {report["unchanged"]} unchanged, {report["failed"]} rejected')
+    for result in report['results']:
+        if result['status'] == 'failed':
+            click.echo(f'line {result["line"]}: {json.dumps(result["errors"])}')
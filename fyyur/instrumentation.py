@@ -0,0 +1,199 @@
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from flask import Response, current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# ----------------------------------------------------------------------------#
+# SQL instrumentation.
+#
+# Engine events record every statement run while handling a request: query
+# count, time spent in the database and how often each statement shape (the
+# SQL with literals and IN lists collapsed) repeats, which is what an N+1
+# looks like. Totals go out in X-DB-* response headers and on /metrics.
+# ----------------------------------------------------------------------------#
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r'\bIN\s*\((?:[^()]|\([^()]*\))*\)', re.IGNORECASE)
+_SPACES = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    shape = _LITERALS.sub('?', statement)
+    shape = _IN_LISTS.sub('IN (...)', shape)
+    return _SPACES.sub(' ', shape).strip()
+
+
+class RequestQueries:
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold):
+        return {shape: n for shape, n in self.shapes.items() if n >= threshold}
+
+
+_captures = threading.local()
+
+
+@contextmanager
+def capture_queries():
+    # Records every statement run on this thread inside the block.
+    captured = RequestQueries()
+    stack = getattr(_captures, 'stack', None)
+    if stack is None:
+        stack = _captures.stack = []
+    stack.append(captured)
+    try:
+        yield captured
+    finally:
+        stack.remove(captured)
+
+
+def query_budget(limit):
+    # Declares how many statements a view may run, checked by
+    # assert_query_budget() and reported when exceeded at runtime.
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+def assert_query_budget(client, url, budget=None, method='GET', **kwargs):
+    # Test helper: fails when `url` runs more statements than its view
+    # declared with @query_budget (or than `budget`).
+    app = client.application
+    with capture_queries() as captured:
+        response = client.open(url, method=method, **kwargs)
+        response.get_data()
+    if budget is None:
+        endpoint, _ = app.url_map.bind('localhost').match(url.split('?')[0], method=method)
+        budget = getattr(app.view_functions[endpoint], 'query_budget', None)
+        if budget is None:
+            raise AssertionError(f'{endpoint} declares no query budget')
+    if captured.count > budget:
+        shapes = '\n'.join(f'  {n}x {shape}' for shape, n in captured.shapes.most_common())
+        raise AssertionError(f'{method} {url} ran {captured.count} queries, budget is {budget}:\n{shapes}')
+    return response
+
+
+class SQLInstrumentation:
+
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        self.queries = Counter()
+        self.db_seconds = defaultdict(float)
+        self.n_plus_one = Counter()
+        self.over_budget = Counter()
+        self.collectors = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SQL_INSTRUMENTATION', True)
+        app.config.setdefault('SQL_REPEATED_STATEMENT_THRESHOLD', 5)
+        app.extensions['sql_instrumentation'] = self
+        if not app.config['SQL_INSTRUMENTATION']:
+            return
+        # Engine events are global, once for every app of the process
+        if not event.contains(Engine, 'before_cursor_execute', self._before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+    def add_collector(self, collect):
+        # `collect()` returns extra (name, value) gauges for /metrics.
+        self.collectors.append(collect)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info['query_start'].pop()
+        for captured in getattr(_captures, 'stack', ()):
+            captured.record(statement, duration)
+        if has_app_context():
+            queries = g.get('sql_queries')
+            if queries is not None:
+                queries.record(statement, duration)
+
+    def _before_request(self):
+        g.sql_queries = RequestQueries()
+
+    def _after_request(self, response):
+        queries = g.get('sql_queries')
+        if queries is None:
+            return response
+        app = current_app._get_current_object()
+        endpoint = request.endpoint or 'unknown'
+        budget = getattr(app.view_functions.get(request.endpoint), 'query_budget', None)
+        if response.is_streamed:
+            # the body, and most of its queries, runs after this hook
+            response.call_on_close(lambda: self._record(app, endpoint, queries, budget))
+            return response
+        repeated = self._record(app, endpoint, queries, budget)
+        response.headers['X-DB-Query-Count'] = str(queries.count)
+        response.headers['X-DB-Time-Ms'] = f'{queries.duration * 1000:.2f}'
+        response.headers['X-DB-Repeated-Statements'] = str(len(repeated))
+        return response
+
+    def _record(self, app, endpoint, queries, budget):
+        repeated = queries.repeated(app.config['SQL_REPEATED_STATEMENT_THRESHOLD'])
+        over_budget = budget is not None and queries.count > budget
+        if repeated:
+            app.logger.warning(
+                'Possible N+1 in %s: %s', endpoint,
+                '; '.join(f'{n}x {shape}' for shape, n in repeated.items())
+            )
+        if over_budget:
+            app.logger.warning('%s ran %d queries, budget is %d', endpoint, queries.count, budget)
+        with self.lock:
+            self.requests[endpoint] += 1
+            self.queries[endpoint] += queries.count
+            self.db_seconds[endpoint] += queries.duration
+            if repeated:
+                self.n_plus_one[endpoint] += 1
+            if over_budget:
+                self.over_budget[endpoint] += 1
+        return repeated
+
+    def metrics(self):
+        lines = []
+
+        def family(name, kind, help_text, values):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for endpoint, value in sorted(values.items()):
+                lines.append(f'{name}{{endpoint="{endpoint}"}} {value}')
+
+        with self.lock:
+            family('fyyur_http_requests_total', 'counter', 'Requests handled.', self.requests)
+            family('fyyur_db_queries_total', 'counter', 'SQL statements run while handling requests.', self.queries)
+            family('fyyur_db_seconds_total', 'counter', 'Time spent in SQL statements.',
+                   {k: round(v, 6) for k, v in self.db_seconds.items()})
+            family('fyyur_db_repeated_statement_requests_total', 'counter',
+                   'Requests that repeated a statement shape (possible N+1).', self.n_plus_one)
+            family('fyyur_db_query_budget_exceeded_total', 'counter',
+                   'Requests that ran more queries than their declared budget.', self.over_budget)
+        for collect in self.collectors:
+            for name, value in collect():
+                lines.append(f'# TYPE {name} gauge')
+                lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def metrics_view(self):
+        return Response(self.metrics(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,64 @@
+from collections import defaultdict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from fyyur import db
+
+# ----------------------------------------------------------------------------#
+# Batched relationship loading.
+#
+# Model helpers that need a related object or collection (a show's artist, a
+# venue's genres or shows) ask the session's BatchLoader instead of the lazy
+# loader. A page first tells the loader every key it will ask for (`want`);
+# the first `get` of a relation then fetches all of them with one IN query,
+# so a page listing N objects costs one query per relation instead of N.
+# Loaded values live until the session's transaction ends.
+# ----------------------------------------------------------------------------#
+
+RELATIONS = {}
+
+
+def relation(name, default=None):
+    # Registers `fetch(keys) -> {key: value}` for `name`; keys it does not
+    # return get `default` (called when callable, e.g. `list`).
+    def register(fetch):
+        RELATIONS[name] = (fetch, default)
+        return fetch
+    return register
+
+
+class BatchLoader:
+
+    def __init__(self):
+        self.pending = defaultdict(set)
+        self.values = defaultdict(dict)
+
+    def want(self, name, keys):
+        loaded = self.values[name]
+        self.pending[name].update(key for key in keys if key not in loaded)
+        return self
+
+    def get(self, name, key):
+        loaded = self.values[name]
+        if key not in loaded:
+            fetch, default = RELATIONS[name]
+            keys = (self.pending.pop(name, set()) | {key}) - loaded.keys()
+            found = fetch(keys)
+            for k in keys:
+                loaded[k] = found[k] if k in found else default() if callable(default) else default
+        return loaded[key]
+
+
+def batch_loader(session=None):
+    session = session or db.session
+    if 'batch_loader' not in session.info:
+        session.info['batch_loader'] = BatchLoader()
+    return session.info['batch_loader']
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _discard_batch_loader(session, transaction):
+    # objects held by the loader expire with the transaction
+    if transaction.parent is None:
+        session.info.pop('batch_loader', None)
@@ -1,16 +1,30 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 
-from sqlalchemy import func
+from collections import defaultdict
+
+from sqlalchemy import event, func, select
+from sqlalchemy.dialects.postgresql import ExcludeConstraint
+from sqlalchemy.orm import Session, with_loader_criteria
 
 from fyyur import db
+from fyyur.loader import batch_loader, relation
 
 # ----------------------------------------------------------------------------#
 # Models.
 # ----------------------------------------------------------------------------#
 
+# Length of a show booked without an explicit end.
+DEFAULT_SHOW_DURATION = timedelta(hours=2)
+
+
+def _default_end_time(context):
+    return context.get_current_parameters()['start_time'] + DEFAULT_SHOW_DURATION
+
 genres_venues = db.Table('genres_venues',
     db.Column('genre_id', db.Integer, db.ForeignKey('genres.id'), primary_key=True),
-    db.Column('venue_id', db.Integer, db.ForeignKey('venues.id'), primary_key=True)
+    db.Column('venue_id', db.Integer, db.ForeignKey('venues.id'), primary_key=True),
+    # the primary key leads with genre_id, venue pages look up by venue
+    db.Index('ix_genres_venues_venue_id', 'venue_id')
 )
 
 
@@ -28,6 +42,16 @@ class Genre(db.Model):
 
 class Venue(db.Model):
     __tablename__ = 'venues'
+    __table_args__ = (
+        # directory order, see fyyur/directory.py
+        db.Index('ix_venues_directory', 'state', 'city', 'name', 'id', postgresql_include=['num_upcoming_shows']),
+        db.Index('ix_venues_created_at_id', 'created_at', 'id'),
+        # availability by city, see fyyur/availability.py
+        db.Index('ix_venues_city_state', 'city', 'state'),
+        # pending purges, see fyyur/purge.py
+        db.Index('ix_venues_deleted_at', 'deleted_at',
+                 postgresql_where=db.text('deleted_at IS NOT NULL'), sqlite_where=db.text('deleted_at IS NOT NULL')),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     city = db.Column(db.String(120))
@@ -40,20 +64,31 @@ class Venue(db.Model):
     seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(120))
     created_at = db.Column(db.DateTime, nullable=False, server_default=func.now())
+    # touched on edits and show changes, see fyyur/conditional.py
+    updated_at = db.Column(db.DateTime, nullable=False, server_default=func.now(), onupdate=func.now(), index=True)
+    # maintained by the Show events in fyyur/counters.py
+    num_upcoming_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    num_past_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # name, city, state and genres, kept current by fyyur/search.py
+    search_text = db.Column(db.Text)
+    # set by the delete routes, hidden from reads and purged later, see fyyur/purge.py
+    deleted_at = db.Column(db.DateTime)
     genres = db.relationship('Genre', secondary=genres_venues, backref=db.backref('venues', lazy=True))
     shows = db.relationship('Show', backref='venue', lazy='dynamic')
 
     def past_shows(self):
-        return self.shows.filter(Show.start_time < datetime.today()).all()
+        now = datetime.today()
+        return [show for show in batch_loader().get('venue_shows', self.id) if show.start_time < now]
 
     def past_shows_count(self):
-        return self.shows.filter(Show.start_time < datetime.today()).count()
+        return self.num_past_shows
 
     def upcoming_shows(self):
-        return self.shows.filter(Show.start_time > datetime.today()).all()
+        now = datetime.today()
+        return [show for show in batch_loader().get('venue_shows', self.id) if show.start_time > now]
 
     def upcoming_shows_count(self):
-        return self.shows.filter(Show.start_time > datetime.today()).count()
+        return self.num_upcoming_shows
 
     def to_dict(self):
         return {
@@ -63,7 +98,7 @@ class Venue(db.Model):
             'state': self.state,
             'address': self.address,
             'phone': self.phone,
-            'genres': [g.name for g in self.genres],
+            'genres': batch_loader().get('venue_genres', self.id),
             'image_link': self.image_link,
             'facebook_link': self.facebook_link,
             'website': self.website,
@@ -74,6 +109,12 @@ class Venue(db.Model):
 
 class Artist(db.Model):
     __tablename__ = 'artists'
+    __table_args__ = (
+        db.Index('ix_artists_created_at_id', 'created_at', 'id'),
+        db.Index('ix_artists_city_state', 'city', 'state'),
+        db.Index('ix_artists_deleted_at', 'deleted_at',
+                 postgresql_where=db.text('deleted_at IS NOT NULL'), sqlite_where=db.text('deleted_at IS NOT NULL')),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     city = db.Column(db.String(120))
@@ -85,20 +126,31 @@ class Artist(db.Model):
     seeking_venue = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(120))
     created_at = db.Column(db.DateTime, nullable=False, server_default=func.now())
+    # touched on edits and show changes, see fyyur/conditional.py
+    updated_at = db.Column(db.DateTime, nullable=False, server_default=func.now(), onupdate=func.now(), index=True)
+    # maintained by the Show events in fyyur/counters.py
+    num_upcoming_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    num_past_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # name, city, state and genres, kept current by fyyur/search.py
+    search_text = db.Column(db.Text)
+    # set by the delete routes, hidden from reads and purged later, see fyyur/purge.py
+    deleted_at = db.Column(db.DateTime)
     genres = db.relationship('Genre', secondary=artists_genres, backref=db.backref('artists', lazy=True))
     shows = db.relationship('Show', backref='artist', lazy='dynamic')
 
     def past_shows(self):
-        return self.shows.filter(Show.start_time < datetime.today()).all()
+        now = datetime.today()
+        return [show for show in batch_loader().get('artist_shows', self.id) if show.start_time < now]
 
     def past_shows_count(self):
-        return self.shows.filter(Show.start_time < datetime.today()).count()
+        return self.num_past_shows
 
     def upcoming_shows(self):
-        return self.shows.filter(Show.start_time > datetime.today()).all()
+        now = datetime.today()
+        return [show for show in batch_loader().get('artist_shows', self.id) if show.start_time > now]
 
     def upcoming_shows_count(self):
-        return self.shows.filter(Show.start_time > datetime.today()).count()
+        return self.num_upcoming_shows
 
     def to_dict(self):
         return {
@@ -107,7 +159,7 @@ class Artist(db.Model):
             'city': self.city,
             'state': self.state,
             'phone': self.phone,
-            'genres': [g.name for g in self.genres],
+            'genres': batch_loader().get('artist_genres', self.id),
             'image_link': self.image_link,
             'facebook_link': self.facebook_link,
             'website': self.website,
@@ -118,29 +170,137 @@ class Artist(db.Model):
 
 class Show(db.Model):
     __tablename__ = 'shows'
+    __table_args__ = (
+        # venue and artist pages, split into past and upcoming by start_time
+        db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time', postgresql_include=['artist_id']),
+        db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time', postgresql_include=['venue_id']),
+        # show list order
+        db.Index('ix_shows_start_time_id', 'start_time', 'id'),
+        # `flask shows rollover`
+        db.Index('ix_shows_upcoming_start_time', 'start_time',
+                 postgresql_where=db.text('is_upcoming'), sqlite_where=db.text('is_upcoming')),
+        db.CheckConstraint('end_time > start_time', name='ck_shows_end_after_start'),
+        # a venue or artist cannot be booked twice at once, see fyyur/availability.py
+        ExcludeConstraint(
+            ('venue_id', '='), (func.tsrange(db.column('start_time'), db.column('end_time')), '&&'),
+            name='ex_shows_venue_booking', using='gist'
+        ).ddl_if(dialect='postgresql'),
+        ExcludeConstraint(
+            ('artist_id', '='), (func.tsrange(db.column('start_time'), db.column('end_time')), '&&'),
+            name='ex_shows_artist_booking', using='gist'
+        ).ddl_if(dialect='postgresql'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     artist_id = db.Column(db.Integer, db.ForeignKey('artists.id'), nullable=False)
     venue_id = db.Column(db.Integer, db.ForeignKey('venues.id'), nullable=False)
     start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, nullable=False, default=_default_end_time)
+    # which counter the show is currently counted in, see fyyur/counters.py
+    is_upcoming = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
     created_at = db.Column(db.DateTime, nullable=False, server_default=func.now())
 
+    @property
+    def duration(self):
+        return self.end_time - self.start_time
+
     def is_past(self):
         if self.start_time < datetime.today():
             return True
         return False
 
     def artist_dict(self):
+        artist = batch_loader().get('artist', self.artist_id)
         return {
             'artist_id': self.artist_id,
-            'artist_name': self.artist.name,
-            'artist_image_link': self.artist.image_link,
-            'start_time': self.start_time.strftime('%Y-%m-%d %H:%M:%S')
+            'artist_name': artist.name,
+            'artist_image_link': artist.image_link,
+            'start_time': self.start_time
         }
 
     def venue_dict(self):
+        venue = batch_loader().get('venue', self.venue_id)
         return {
             "venue_id": self.venue_id,
-            "venue_name": self.venue.name,
-            "venue_image_link": self.venue.image_link,
-            "start_time": self.start_time.strftime('%Y-%m-%d %H:%M:%S')
-        }
\ No newline at end of file
+            "venue_name": venue.name,
+            "venue_image_link": venue.image_link,
+            "start_time": self.start_time
+        }
+
+
+#  Soft delete, see fyyur/purge.py
+#  ----------------------------------------------------------------
+
+SOFT_DELETED = (Venue, Artist)
+
+
+def hide_deleted(statement):
+    # Leaves deleted venues and artists out of an ORM select, wherever they
+    # appear in it (joins and subqueries too), so a show of a deleted venue
+    # disappears from a query joining shows to venues.
+    return statement.options(*(
+        with_loader_criteria(model, model.deleted_at.is_(None), include_aliases=True) for model in SOFT_DELETED
+    ))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _hide_deleted(execute_state):
+    # Every select of the session; refreshes and relationship loads inherit
+    # the criteria of the query that loaded their parent. The purge reads
+    # deleted rows with execution_options(include_deleted=True).
+    if (execute_state.is_select and not execute_state.is_column_load and not execute_state.is_relationship_load
+            and not execute_state.execution_options.get('include_deleted', False)):
+        execute_state.statement = hide_deleted(execute_state.statement)
+
+
+#  Batched relations, see fyyur/loader.py
+#  ----------------------------------------------------------------
+
+
+def _grouped(rows):
+    groups = defaultdict(list)
+    for key, value in rows:
+        groups[key].append(value)
+    return groups
+
+
+@relation('venue')
+def _load_venues(ids):
+    return {venue.id: venue for venue in db.session.scalars(select(Venue).where(Venue.id.in_(ids)))}
+
+
+@relation('artist')
+def _load_artists(ids):
+    return {artist.id: artist for artist in db.session.scalars(select(Artist).where(Artist.id.in_(ids)))}
+
+
+@relation('venue_genres', default=list)
+def _load_venue_genres(ids):
+    key = genres_venues.c.venue_id
+    return _grouped(db.session.execute(
+        select(key, Genre.name).join(Genre, Genre.id == genres_venues.c.genre_id).where(key.in_(ids)).order_by(Genre.id)
+    ))
+
+
+@relation('artist_genres', default=list)
+def _load_artist_genres(ids):
+    key = artists_genres.c.artist_id
+    return _grouped(db.session.execute(
+        select(key, Genre.name).join(Genre, Genre.id == artists_genres.c.genre_id).where(key.in_(ids)).order_by(Genre.id)
+    ))
+
+
+@relation('venue_shows', default=list)
+def _load_venue_shows(ids):
+    # joined to the artist so shows of deleted artists stay hidden
+    shows = db.session.scalars(
+        select(Show).join(Artist, Artist.id == Show.artist_id).where(Show.venue_id.in_(ids)).order_by(Show.start_time, Show.id)
+    )
+    return _grouped((show.venue_id, show) for show in shows)
+
+
+@relation('artist_shows', default=list)
+def _load_artist_shows(ids):
+    shows = db.session.scalars(
+        select(Show).join(Venue, Venue.id == Show.venue_id).where(Show.artist_id.in_(ids)).order_by(Show.start_time, Show.id)
+    )
+    return _grouped((show.artist_id, show) for show in shows)
\ No newline at end of file
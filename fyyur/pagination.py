@@ -0,0 +1,146 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from flask import abort, current_app, request
+from sqlalchemy import literal, tuple_
+
+
+# ----------------------------------------------------------------------------#
+# Keyset pagination.
+#
+# Pages are addressed by an opaque cursor holding the sort key of the row
+# they start after (or before, when paging backwards), so every page is an
+# indexed range scan of `per_page + 1` rows instead of an OFFSET scan.
+# ----------------------------------------------------------------------------#
+
+STREAM_BATCH_SIZE = 100
+
+
+class Page:
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+class StreamedPage:
+    # Yields rows as the database cursor produces them; the cursors are known
+    # once iteration is done, which is where templates render their links.
+
+    def __init__(self, rows, columns, limit, has_prev):
+        self._rows = rows
+        self._columns = columns
+        self._limit = limit
+        self._has_prev = has_prev
+        self._has_next = False
+        self._first = None
+        self._last = None
+
+    def __iter__(self):
+        for i, row in enumerate(self._rows):
+            if i == self._limit:
+                self._has_next = True
+                continue
+            if i == 0:
+                self._first = row
+            self._last = row
+            yield row
+
+    @property
+    def next_cursor(self):
+        if self._has_next and self._last is not None:
+            return encode_cursor(self._columns, self._last, 'next')
+
+    @property
+    def prev_cursor(self):
+        if self._has_prev and self._first is not None:
+            return encode_cursor(self._columns, self._first, 'prev')
+
+
+def encode_cursor(columns, row, direction):
+    values = []
+    for column in columns:
+        value = getattr(row, column.key)
+        values.append(value.isoformat() if isinstance(value, datetime) else value)
+    payload = json.dumps({'k': values, 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def _cursor_value(column, value):
+    # a tampered cursor must not reach the query with the wrong type
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if value is None:
+        return value
+    if isinstance(value, bool) and python_type is not bool or not isinstance(value, python_type):
+        raise ValueError(value)
+    return value
+
+
+def decode_cursor(columns, cursor):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        values = payload['k']
+        direction = payload['d']
+        if len(values) != len(columns) or direction not in ('next', 'prev'):
+            raise ValueError(cursor)
+        values = [_cursor_value(column, value) for column, value in zip(columns, values)]
+    except (binascii.Error, KeyError, TypeError, ValueError):
+        abort(400)
+    return values, direction
+
+
+def per_page(default_key):
+    size = request.args.get('per_page', type=int) or current_app.config[default_key]
+    return max(1, min(size, current_app.config['MAX_PER_PAGE']))
+
+
+def keyset_query(query, columns, cursor=None):
+    # Orders and bounds `query` (an ORM query or a select) for the page the
+    # cursor points at. Returns the query and the paging direction.
+    key = tuple_(*columns)
+    direction = 'next'
+    if cursor:
+        values, direction = decode_cursor(columns, cursor)
+        bound = tuple_(*[literal(value, column.type) for column, value in zip(columns, values)])
+        query = query.filter(key > bound if direction == 'next' else key < bound)
+    if direction == 'next':
+        query = query.order_by(*columns)
+    else:
+        query = query.order_by(*[column.desc() for column in columns])
+    return query, direction
+
+
+def make_page(rows, columns, cursor, limit, direction):
+    # `rows` are the up to `limit + 1` rows read for the page.
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if direction == 'prev':
+        rows.reverse()
+    if not rows:
+        return Page(rows)
+
+    has_next = has_more if direction == 'next' else True
+    has_prev = has_more if direction == 'prev' else bool(cursor)
+    return Page(
+        rows,
+        next_cursor=encode_cursor(columns, rows[-1], 'next') if has_next else None,
+        prev_cursor=encode_cursor(columns, rows[0], 'prev') if has_prev else None
+    )
+
+
+def paginate(query, columns, cursor=None, limit=20, stream=False):
+    # `columns` is the full sort key and must end with a unique column. With
+    # `stream`, forward pages are read through a server-side cursor instead
+    # of being loaded up front.
+    query, direction = keyset_query(query, columns, cursor)
+    if stream and direction == 'next':
+        return StreamedPage(query.limit(limit + 1).yield_per(STREAM_BATCH_SIZE), columns, limit, bool(cursor))
+    return make_page(query.limit(limit + 1).all(), columns, cursor, limit, direction)
@@ -0,0 +1,162 @@
+import json
+import re
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import select, text
+
+from fyyur import db
+from fyyur.availability import available_rows, overlaps
+from fyyur.directory import DIRECTORY_ORDER, venue_rows, area_rows
+from fyyur.models import Genre, Venue, Artist, Show, genres_venues, artists_genres, hide_deleted
+from fyyur.recent import recent_listings, recent_rows
+
+# ----------------------------------------------------------------------------#
+# Query plan checks.
+#
+# `flask check-plans` runs EXPLAIN on the statements behind the busiest pages
+# against the configured (seeded, see `flask seed`) database and fails when
+# any of them reads one of the large tables with a sequential scan, which is
+# what a missing or unusable index looks like.
+# ----------------------------------------------------------------------------#
+
+CHECKED_TABLES = {'venues', 'artists', 'shows', 'genres_venues', 'artists_genres'}
+_SQLITE_TABLE_SCAN = re.compile(r'^SCAN (\w+)$')
+
+
+class HotQuery:
+
+    def __init__(self, name, query, allow_scans=()):
+        self.name = name
+        self.query = query
+        # tables the statement reads in full anyway
+        self.allow_scans = set(allow_scans)
+
+
+def hot_queries(venue, artist):
+    # Mirrors the statements run by the views in fyyur/routes.py.
+    now = datetime.now()
+    per_page = current_app.config['VENUES_PER_PAGE'] + 1
+    queries = [
+        HotQuery('recent listings: venues', recent_rows(Venue, recent_listings.feed.capacity)),
+        HotQuery('recent listings: artists', recent_rows(Artist, recent_listings.feed.capacity)),
+        HotQuery('venues: directory page', venue_rows().order_by(*DIRECTORY_ORDER).limit(per_page)),
+        HotQuery('venues: area headings', area_rows(), allow_scans={'venues'}),
+        HotQuery('venues_area: one area', venue_rows(venue.city, venue.state).order_by(*DIRECTORY_ORDER)),
+        HotQuery('artists: page', Artist.query.order_by(Artist.created_at, Artist.id).limit(per_page)),
+        HotQuery('shows: page', db.session.query(
+            Show.id, Show.start_time, Venue.name, Artist.name, Artist.image_link
+        ).join(Venue, Show.venue_id == Venue.id).join(Artist, Show.artist_id == Artist.id).order_by(
+            Show.start_time, Show.id
+        ).limit(current_app.config['SHOWS_PER_PAGE'] + 1)),
+        HotQuery('shows rollover', db.session.query(Show.id, Show.venue_id, Show.artist_id).filter(
+            Show.is_upcoming.is_(True), Show.start_time <= now
+        )),
+    ]
+    window = (now + timedelta(days=7), now + timedelta(days=7, hours=2))
+    queries += [
+        HotQuery('booking conflicts: venue', db.session.query(Show.id).filter(Show.venue_id == venue.id, overlaps(*window))),
+        HotQuery('booking conflicts: artist', db.session.query(Show.id).filter(Show.artist_id == artist.id, overlaps(*window))),
+        HotQuery('available venues', available_rows(Venue, venue.city, venue.state, *window)),
+        HotQuery('available artists', available_rows(Artist, artist.city, artist.state, *window)),
+    ]
+    # venue and artist pages, batched by fyyur/loader.py
+    queries += [
+        HotQuery('show_venue: shows', select(Show).join(Artist, Artist.id == Show.artist_id).where(
+            Show.venue_id.in_([venue.id])
+        ).order_by(Show.start_time, Show.id)),
+        HotQuery('show_venue: artists', select(Artist).where(Artist.id.in_([artist.id]))),
+        HotQuery('show_artist: shows', select(Show).join(Venue, Venue.id == Show.venue_id).where(
+            Show.artist_id.in_([artist.id])
+        ).order_by(Show.start_time, Show.id)),
+        HotQuery('show_artist: venues', select(Venue).where(Venue.id.in_([venue.id]))),
+        HotQuery('venue genres', select(genres_venues.c.venue_id, Genre.name).join(
+            Genre, Genre.id == genres_venues.c.genre_id
+        ).where(genres_venues.c.venue_id.in_([venue.id]))),
+        HotQuery('artist genres', select(artists_genres.c.artist_id, Genre.name).join(
+            Genre, Genre.id == artists_genres.c.genre_id
+        ).where(artists_genres.c.artist_id.in_([artist.id]))),
+    ]
+    return queries
+
+
+def _compile(query):
+    # with the criteria the session adds to every select it executes
+    statement = hide_deleted(getattr(query, 'statement', query))
+    compiled = statement.compile(dialect=db.engine.dialect, compile_kwargs={'render_postcompile': True})
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    return str(compiled), params
+
+
+def _postgres_plan(sql, params):
+    plan = db.session.connection().exec_driver_sql('EXPLAIN (FORMAT JSON) ' + sql, params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    scans = []
+
+    def walk(node):
+        if node.get('Node Type') == 'Seq Scan':
+            scans.append(node.get('Relation Name'))
+        for child in node.get('Plans', ()):
+            walk(child)
+    walk(plan[0]['Plan'])
+    return scans, json.dumps(plan, indent=2)
+
+
+def _sqlite_plan(sql, params):
+    rows = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + sql, params).all()
+    scans = []
+    for row in rows:
+        match = _SQLITE_TABLE_SCAN.match(row[-1])
+        if match:
+            scans.append(match.group(1))
+    return scans, '\n'.join(row[-1] for row in rows)
+
+
+def explain(query):
+    # Returns the tables read with a sequential scan and the plan as text.
+    sql, params = _compile(query)
+    if db.engine.dialect.name == 'postgresql':
+        return _postgres_plan(sql, params)
+    if db.engine.dialect.name == 'sqlite':
+        return _sqlite_plan(sql, params)
+    raise click.ClickException(f'No plan check for {db.engine.dialect.name}')
+
+
+def check_plans(verbose=False):
+    venue = Venue.query.order_by(Venue.num_past_shows.desc()).first()
+    artist = Artist.query.order_by(Artist.num_past_shows.desc()).first()
+    if venue is None or artist is None:
+        raise click.ClickException('The database is empty, run `flask seed` first.')
+    failures = 0
+    for hot in hot_queries(venue, artist):
+        scans, plan = explain(hot.query)
+        bad = sorted({t for t in scans if t in CHECKED_TABLES} - hot.allow_scans)
+        if bad:
+            failures += 1
+            click.echo(f'FAIL  {hot.name}: sequential scan of {", ".join(bad)}')
+        else:
+            click.echo(f'ok    {hot.name}')
+        if verbose or bad:
+            click.echo('      ' + plan.replace('\n', '\n      '))
+    return failures
+
+
+@click.command('check-plans')
+@click.option('--analyze/--no-analyze', default=True, show_default=True, help='Refresh planner statistics first.')
+@click.option('--verbose', is_flag=True, help='Print every plan.')
+@with_appcontext
+def check_plans_command(analyze, verbose):
+    """EXPLAIN the hot queries, fail on sequential scans of large tables."""
+    if analyze:
+        db.session.execute(text('ANALYZE'))
+        db.session.commit()
+    failures = check_plans(verbose)
+    db.session.rollback()
+    if failures:
+        raise click.ClickException(f'{failures} hot queries fall back to a sequential scan.')
+    click.echo('All hot queries use indexes.')
@@ -0,0 +1,161 @@
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool
+
+# ----------------------------------------------------------------------------#
+# Connection pool.
+# ----------------------------------------------------------------------------#
+
+
+class PoolMetrics:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, waited, timed_out=False):
+        with self.lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+
+class InstrumentedQueuePool(QueuePool):
+    # QueuePool that records how long callers wait for a connection.
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.record(time.perf_counter() - started, timed_out=True)
+            raise
+        self.metrics.record(time.perf_counter() - started)
+        return connection
+
+
+def _timeout_settings(config):
+    settings = {}
+    if config['DB_STATEMENT_TIMEOUT']:
+        settings['statement_timeout'] = config['DB_STATEMENT_TIMEOUT']
+    if config['DB_IDLE_IN_TRANSACTION_TIMEOUT']:
+        settings['idle_in_transaction_session_timeout'] = config['DB_IDLE_IN_TRANSACTION_TIMEOUT']
+    return settings
+
+
+def engine_options(config, url=None):
+    # `url` defaults to the primary database, replicas pass their own
+    url = make_url(url or config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite':
+        return {}
+    options = {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+    settings = _timeout_settings(config)
+    if url.get_backend_name() == 'postgresql' and settings and not config['DB_PGBOUNCER']:
+        options['connect_args'] = {
+            'options': ' '.join(f'-c {name}={value}' for name, value in settings.items())
+        }
+    return options
+
+
+def async_engine_options(config, url=None):
+    # Same pool and timeouts for the async engines of fyyur/aio.py. asyncpg
+    # takes server settings instead of libpq startup options, and behind
+    # PgBouncer its prepared statement caches have to be off.
+    url = make_url(url or config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite':
+        return {}
+    options = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+    if url.get_backend_name() != 'postgresql':
+        return options
+    if config['DB_PGBOUNCER']:
+        options['connect_args'] = {'statement_cache_size': 0, 'prepared_statement_cache_size': 0}
+    else:
+        settings = _timeout_settings(config)
+        if settings:
+            options['connect_args'] = {'server_settings': {name: str(value) for name, value in settings.items()}}
+    return options
+
+
+def transaction_timeouts(config):
+    # Statement setting the timeouts for the current transaction when
+    # PgBouncer drops startup options, otherwise None.
+    settings = _timeout_settings(config)
+    if not (config['DB_PGBOUNCER'] and settings):
+        return None
+    # set_config(..., true) is SET LOCAL as one statement, asyncpg cannot
+    # prepare several
+    return text('SELECT ' + ', '.join(f"set_config('{name}', '{int(value)}', true)" for name, value in settings.items()))
+
+
+def init_pool(app, db):
+    statement = transaction_timeouts(app.config)
+    if statement is None:
+        return
+    app.extensions['transaction_timeouts'] = statement
+    # one listener for every app of the process, each sets its own timeouts
+    if not event.contains(Session, 'after_begin', _set_transaction_timeouts):
+        event.listen(Session, 'after_begin', _set_transaction_timeouts)
+
+
+def _set_transaction_timeouts(session, transaction, connection):
+    statement = current_app.extensions.get('transaction_timeouts') if has_app_context() else None
+    if statement is not None and connection.dialect.name == 'postgresql':
+        connection.execute(statement)
+
+
+def pool_stats(engine):
+    pool = engine.pool
+    stats = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'checked_in': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0),
+            'max_overflow': pool._max_overflow,
+        })
+    metrics = getattr(pool, 'metrics', None)
+    if metrics is not None:
+        with metrics.lock:
+            stats.update({
+                'checkouts': metrics.checkouts,
+                'checkout_timeouts': metrics.timeouts,
+                'checkout_wait_total_ms': round(metrics.wait_total * 1000, 3),
+                'checkout_wait_max_ms': round(metrics.wait_max * 1000, 3),
+                'checkout_wait_avg_ms': round(metrics.wait_total * 1000 / metrics.checkouts, 3) if metrics.checkouts else 0.0,
+            })
+    return stats
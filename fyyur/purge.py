@@ -0,0 +1,122 @@
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import delete, select
+
+from fyyur import db, cache
+from fyyur.availability import unindex_bookings
+from fyyur.models import Venue, Artist, Show, genres_venues, artists_genres
+
+# ----------------------------------------------------------------------------#
+# Purge.
+#
+# Deleting a venue or artist only sets its deleted_at, which every read
+# leaves out (see hide_deleted in fyyur/models.py), so the request does not
+# wait for its show history; its shows leave the counters right away (see
+# count_hidden_shows in fyyur/counters.py). `flask purge` removes deleted
+# rows afterwards in small batches, one short transaction each: first the
+# shows, then the genre links, then the row itself. Between batches it
+# sleeps at least as long as the batch took, so it never keeps the database
+# busy more than half of the time.
+# ----------------------------------------------------------------------------#
+
+# model, foreign key of its shows, genre link key, cache dependency
+PURGED = (
+    (Venue, Show.venue_id, genres_venues.c.venue_id, 'venue'),
+    (Artist, Show.artist_id, artists_genres.c.artist_id, 'artist'),
+)
+
+
+def _next_deleted(model):
+    return db.session.scalar(
+        select(model.id)
+        .where(model.deleted_at.isnot(None))
+        .order_by(model.deleted_at, model.id)
+        .limit(1)
+        .execution_options(include_deleted=True)
+    )
+
+
+def _purge_shows(show_key, entity_id, batch_size):
+    shows = db.session.execute(
+        select(Show.id, Show.venue_id, Show.artist_id)
+        .where(show_key == entity_id)
+        .order_by(Show.id)
+        .limit(batch_size)
+    ).all()
+    if shows:
+        table = Show.__table__
+        # Core deletes skip the Show mapper events, the counters already
+        # dropped these shows when the venue or artist was deleted
+        db.session.execute(delete(table).where(table.c.id.in_([show.id for show in shows])))
+        db.session.commit()
+        unindex_bookings([(show.id, show.venue_id, show.artist_id) for show in shows])
+        cache.invalidate(
+            ('shows',),
+            *{('venue', show.venue_id) for show in shows},
+            *{('artist', show.artist_id) for show in shows}
+        )
+    return len(shows)
+
+
+def _purge_links(link_key, entity_id, batch_size):
+    link = link_key.table
+    genre_ids = db.session.scalars(select(link.c.genre_id).where(link_key == entity_id).limit(batch_size)).all()
+    if genre_ids:
+        db.session.execute(delete(link).where(link_key == entity_id, link.c.genre_id.in_(genre_ids)))
+        db.session.commit()
+    return len(genre_ids)
+
+
+def purge_batch(batch_size):
+    # One batch of the oldest deleted venue, else artist. Returns the number
+    # of rows removed, 0 once nothing is left to purge.
+    for model, show_key, link_key, dependency in PURGED:
+        entity_id = _next_deleted(model)
+        if entity_id is None:
+            continue
+        try:
+            removed = _purge_shows(show_key, entity_id, batch_size) or _purge_links(link_key, entity_id, batch_size)
+            if not removed:
+                table = model.__table__
+                db.session.execute(delete(table).where(table.c.id == entity_id))
+                db.session.commit()
+                cache.invalidate((model.__tablename__,), (dependency, entity_id))
+                removed = 1
+        except Exception:
+            db.session.rollback()
+            raise
+        return removed
+    return 0
+
+
+def purge(batch_size, pause):
+    # Runs batches until nothing is left, returns the number of rows removed.
+    total = 0
+    while True:
+        started = time.monotonic()
+        removed = purge_batch(batch_size)
+        if not removed:
+            return total
+        total += removed
+        time.sleep(max(pause, time.monotonic() - started))
+
+
+@click.command('purge')
+@click.option('--batch-size', type=click.IntRange(min=1), help='Defaults to PURGE_BATCH_SIZE.')
+@click.option('--pause', type=click.FloatRange(min=0), help='Seconds between batches, defaults to PURGE_BATCH_PAUSE.')
+@click.option('--watch', is_flag=True, help='Keep running and look for new deletes every PURGE_POLL_INTERVAL seconds.')
+@with_appcontext
+def purge_command(batch_size, pause, watch):
+    """Remove deleted venues and artists with their shows and genre links."""
+    batch_size = batch_size or current_app.config['PURGE_BATCH_SIZE']
+    pause = current_app.config['PURGE_BATCH_PAUSE'] if pause is None else pause
+    while True:
+        removed = purge(batch_size, pause)
+        if removed or not watch:
+            click.echo(f'{removed} rows purged.')
+        if not watch:
+            return
+        time.sleep(current_app.config['PURGE_POLL_INTERVAL'])
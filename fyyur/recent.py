@@ -0,0 +1,277 @@
+import json
+import threading
+import time
+from collections import deque
+
+from flask import current_app
+from sqlalchemy import desc, event
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from fyyur import db, cache, replica_router
+from fyyur.models import Venue, Artist
+
+# ----------------------------------------------------------------------------#
+# Recently listed venues and artists.
+#
+# The home page shows the newest venues and artists. They are kept in a
+# bounded, newest-first buffer per kind, loaded from the database when the
+# app is created and then kept current by committed creates, edits and
+# deletes, so rendering the home page runs no queries. The buffer holds more
+# entries than are shown so deletes can be absorbed without going back to
+# the database. In-process buffers miss the writes of other workers and
+# processes, so after RECENT_LISTINGS_TTL seconds a read reloads them in a
+# background thread and keeps serving the current entries meanwhile.
+# ----------------------------------------------------------------------------#
+
+LISTED = {Venue: 'venues', Artist: 'artists'}
+
+
+def listing_entry(entity_id, name, city, state):
+    return {'id': entity_id, 'name': name, 'city': city, 'state': state}
+
+
+def recent_rows(model, limit):
+    return db.session.query(model.id, model.name, model.city, model.state).order_by(
+        desc(model.created_at), desc(model.id)
+    ).limit(limit)
+
+
+class MemoryFeed:
+    # Per-process buffers, reloaded every `ttl` seconds to pick up what
+    # other workers wrote.
+
+    def __init__(self, capacity, ttl=None):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.buffers = {}
+        self.loaded_at = {}
+        self.lock = threading.Lock()
+
+    def get(self, kind):
+        with self.lock:
+            buffer = self.buffers.get(kind)
+            return list(buffer) if buffer is not None else None
+
+    def replace(self, kind, entries):
+        with self.lock:
+            self.buffers[kind] = deque(entries, maxlen=self.capacity)
+            self.loaded_at[kind] = time.monotonic()
+
+    def expired(self, kind):
+        with self.lock:
+            loaded_at = self.loaded_at.get(kind)
+        return bool(self.ttl) and loaded_at is not None and time.monotonic() - loaded_at > self.ttl
+
+    def push(self, kind, entries):
+        with self.lock:
+            buffer = self.buffers.get(kind)
+            if buffer is not None:
+                buffer.extendleft(reversed(entries))
+
+    def evict(self, kind, entity_id):
+        with self.lock:
+            buffer = self.buffers.get(kind)
+            if buffer is not None:
+                self.buffers[kind] = deque((e for e in buffer if e['id'] != entity_id), maxlen=self.capacity)
+
+    def update(self, kind, entry):
+        with self.lock:
+            buffer = self.buffers.get(kind)
+            if buffer is not None:
+                self.buffers[kind] = deque((entry if e['id'] == entry['id'] else e for e in buffer), maxlen=self.capacity)
+
+    def invalidate(self, kind):
+        with self.lock:
+            self.buffers.pop(kind, None)
+
+
+class RedisFeed:
+    # Lists shared by all workers, a marker key records that a kind is loaded.
+
+    def __init__(self, url, capacity, prefix='fyyur:recent:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.capacity = capacity
+        self.prefix = prefix
+
+    def _keys(self, kind):
+        return self.prefix + kind, self.prefix + 'loaded:' + kind
+
+    def get(self, kind):
+        key, loaded = self._keys(kind)
+        pipe = self.client.pipeline()
+        pipe.exists(loaded)
+        pipe.lrange(key, 0, -1)
+        is_loaded, values = pipe.execute()
+        return [json.loads(v) for v in values] if is_loaded else None
+
+    def replace(self, kind, entries):
+        key, loaded = self._keys(kind)
+        pipe = self.client.pipeline()
+        pipe.delete(key)
+        if entries:
+            pipe.rpush(key, *[json.dumps(e) for e in entries[:self.capacity]])
+        pipe.set(loaded, 1)
+        pipe.execute()
+
+    def push(self, kind, entries):
+        key, loaded = self._keys(kind)
+        if entries and self.client.exists(loaded):
+            pipe = self.client.pipeline()
+            pipe.lpush(key, *[json.dumps(e) for e in reversed(entries)])
+            pipe.ltrim(key, 0, self.capacity - 1)
+            pipe.execute()
+
+    def evict(self, kind, entity_id):
+        key, _ = self._keys(kind)
+        for value in self.client.lrange(key, 0, -1):
+            if json.loads(value)['id'] == entity_id:
+                self.client.lrem(key, 0, value)
+
+    def update(self, kind, entry):
+        key, _ = self._keys(kind)
+        for i, value in enumerate(self.client.lrange(key, 0, -1)):
+            if json.loads(value)['id'] == entry['id']:
+                self.client.lset(key, i, json.dumps(entry))
+
+    def expired(self, kind):
+        # shared by all workers, their commits keep it current
+        return False
+
+    def invalidate(self, kind):
+        self.client.delete(*self._keys(kind))
+
+
+class RecentListings:
+
+    def __init__(self, app=None):
+        self.size = 10
+        self.feed = None
+        self.refreshing = set()
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RECENT_LISTINGS_SIZE', 10)
+        # spare entries so deletes do not force a reload
+        app.config.setdefault('RECENT_LISTINGS_CAPACITY', 50)
+        app.config.setdefault('RECENT_LISTINGS_TTL', 60)
+        self.size = app.config['RECENT_LISTINGS_SIZE']
+        capacity = max(self.size, app.config['RECENT_LISTINGS_CAPACITY'])
+        if app.config.get('CACHE_BACKEND') == 'redis':
+            self.feed = RedisFeed(app.config['CACHE_REDIS_URL'], capacity)
+        else:
+            self.feed = MemoryFeed(capacity, app.config['RECENT_LISTINGS_TTL'])
+        app.extensions['recent_listings'] = self
+
+    def _load(self, kind):
+        model = next(m for m, k in LISTED.items() if k == kind)
+        with replica_router.primary():
+            entries = [listing_entry(*row) for row in recent_rows(model, self.feed.capacity)]
+        self.feed.replace(kind, entries)
+        return entries
+
+    def prime(self):
+        # Loads every kind, create_app() calls it so no request has to. A
+        # database without the tables yet (before `flask db upgrade`) or out
+        # of reach is skipped, the first read loads the feed then.
+        try:
+            for kind in LISTED.values():
+                self._load(kind)
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            current_app.logger.info('Recent listings not loaded: %s', getattr(e, 'orig', None) or e)
+
+    def _refresh(self, app, kind):
+        try:
+            with app.app_context():
+                previous = self.feed.get(kind)
+                if self._load(kind) != previous:
+                    # pages cached in this process missed the same writes
+                    cache.invalidate((kind,))
+        except SQLAlchemyError as e:
+            app.logger.warning('Reloading recent %s failed: %s', kind, getattr(e, 'orig', None) or e)
+        finally:
+            with self.lock:
+                self.refreshing.discard(kind)
+
+    def _refresh_later(self, kind):
+        with self.lock:
+            if kind in self.refreshing:
+                return
+            self.refreshing.add(kind)
+        app = current_app._get_current_object()
+        threading.Thread(target=self._refresh, args=(app, kind), daemon=True).start()
+
+    def latest(self, kind):
+        entries = self.feed.get(kind)
+        if entries is None:
+            entries = self._load(kind)
+        elif self.feed.expired(kind):
+            self._refresh_later(kind)
+        return entries[:self.size]
+
+    def version(self, **view_args):
+        # for @conditional: the home page is rendered from these entries only
+        token = json.dumps([self.latest(kind) for kind in LISTED.values()], sort_keys=True)
+        return None, token
+
+    def push(self, kind, entries):
+        # `entries` newest first
+        self.feed.push(kind, entries)
+
+    def evict(self, kind, entity_id):
+        self.feed.evict(kind, entity_id)
+        entries = self.feed.get(kind)
+        if entries is not None and len(entries) < self.size:
+            # out of spares, reload on the next read
+            self.feed.invalidate(kind)
+
+    def update(self, kind, entry):
+        self.feed.update(kind, entry)
+
+    def invalidate(self):
+        for kind in LISTED.values():
+            self.feed.invalidate(kind)
+
+
+# bound by create_app()
+recent_listings = RecentListings()
+
+
+#  Keeping the feed current
+#  ----------------------------------------------------------------
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_listing_changes(session, flush_context):
+    changes = session.info.setdefault('listing_changes', [])
+    for action, entities in (('push', session.new), ('update', session.dirty)):
+        for entity in entities:
+            kind = LISTED.get(type(entity))
+            if kind is not None and entity.deleted_at is not None:
+                changes.append(('evict', kind, entity.id))
+            elif kind is not None:
+                changes.append((action, kind, listing_entry(entity.id, entity.name, entity.city, entity.state)))
+    for entity in session.deleted:
+        kind = LISTED.get(type(entity))
+        if kind is not None:
+            changes.append(('evict', kind, entity.id))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_listing_changes(session):
+    for action, kind, value in session.info.pop('listing_changes', []):
+        if action == 'push':
+            recent_listings.push(kind, [value])
+        elif action == 'update':
+            recent_listings.update(kind, value)
+        else:
+            recent_listings.evict(kind, value)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_listing_changes(session):
+    session.info.pop('listing_changes', None)
@@ -0,0 +1,88 @@
+import threading
+
+from flask import current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import SQLAlchemyError
+
+from fyyur import db, replica_router
+from fyyur.models import Genre
+
+# ----------------------------------------------------------------------------#
+# Reference data.
+#
+# Genres change about never but every venue/artist form needs all of them.
+# The registry loads them once per process, when the app is created, and
+# serves form choices and id -> Genre lookups from memory; any Genre write
+# marks it stale.
+# ----------------------------------------------------------------------------#
+
+
+class GenreRegistry:
+
+    def __init__(self):
+        self._genres = None
+        self._choices = None
+        self._lock = threading.RLock()
+
+    def _load(self):
+        with self._lock:
+            if self._genres is None:
+                with db.session.no_autoflush, replica_router.primary():
+                    genres = Genre.query.order_by(Genre.id).all()
+                for genre in genres:
+                    db.session.expunge(genre)
+                self._choices = [(g.id, g.name) for g in genres]
+                self._genres = {g.id: g for g in genres}
+            return self._genres
+
+    def prime(self):
+        # create_app() loads the genres so no request has to; skipped like
+        # RecentListings.prime() while the tables are missing.
+        try:
+            self._load()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            current_app.logger.info('Genres not loaded: %s', getattr(e, 'orig', None) or e)
+
+    def choices(self):
+        self._load()
+        return self._choices
+
+    def get_many(self, ids):
+        # merge(load=False) attaches a session-local copy without a SELECT
+        genres = self._load()
+        return [db.session.merge(genres[i], load=False) for i in ids if i in genres]
+
+    def invalidate(self):
+        with self._lock:
+            self._genres = None
+            self._choices = None
+
+
+genre_registry = GenreRegistry()
+
+
+def sync_genres(entity, genre_ids):
+    # Makes entity.genres match `genre_ids` by set difference, so saving
+    # unchanged genres writes no link rows. Returns whether anything changed.
+    wanted = list(dict.fromkeys(genre_ids))
+    current = {genre.id: genre for genre in entity.genres}
+    for genre_id, genre in current.items():
+        if genre_id not in wanted:
+            entity.genres.remove(genre)
+    added = genre_registry.get_many([genre_id for genre_id in wanted if genre_id not in current])
+    entity.genres.extend(added)
+    return bool(added) or len(current) != len(wanted) - len(added)
+
+
+@event.listens_for(Genre, 'after_insert')
+@event.listens_for(Genre, 'after_delete')
+def _genres_changed(mapper, connection, genre):
+    genre_registry.invalidate()
+
+
+@event.listens_for(Genre, 'after_update')
+def _genre_updated(mapper, connection, genre):
+    # also fires when only the venues/artists backrefs changed
+    if inspect(genre).attrs.name.history.has_changes():
+        genre_registry.invalidate()
@@ -0,0 +1,182 @@
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session as OrmSession
+from sqlalchemy.sql.dml import UpdateBase
+
+from fyyur.pool import engine_options, pool_stats
+
+# ----------------------------------------------------------------------------#
+# Read replicas.
+#
+# Replicas are extra binds (replica_1, replica_2, ...) built from
+# SQLALCHEMY_REPLICA_URIS. Views marked @read_replica run their queries on a
+# replica picked per request, round robin or by fewest requests in flight,
+# among those no more than DB_REPLICA_MAX_LAG seconds behind. Other views,
+# flushes, and the requests of a client that wrote within the last
+# DB_READ_AFTER_WRITE_SECONDS (so the page a form redirects to shows the
+# change) stay on the primary.
+# ----------------------------------------------------------------------------#
+
+_PG_LAG = text(
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END'
+)
+
+
+def replica_binds(config):
+    return {
+        f'replica_{i}': dict(engine_options(config, url), url=url)
+        for i, url in enumerate(config.get('SQLALCHEMY_REPLICA_URIS') or (), 1)
+    }
+
+
+def read_replica(view):
+    # Marks a view whose queries may run on a replica.
+    view.read_replica = True
+    return view
+
+
+def replica_lag(engine):
+    # Seconds behind the primary, 0 for databases that are not streaming
+    # replicas (e.g. a second local database in development). Raises when
+    # the replica cannot be reached.
+    with engine.connect() as connection:
+        if engine.dialect.name != 'postgresql':
+            connection.execute(text('SELECT 1'))
+            return 0.0
+        return float(connection.execute(_PG_LAG).scalar() or 0)
+
+
+class RoutingSession(Session):
+    # Reads go to the replica chosen for the request, flushes and DML
+    # statements always to the primary.
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not isinstance(clause, UpdateBase) and has_app_context():
+            name = g.get('read_bind')
+            if name is not None:
+                return self._db.engines[name]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReplicaRouter:
+
+    def __init__(self, app=None, db=None):
+        self.names = []
+        self.lags = {}
+        self.in_flight = {}
+        self.checked_at = None
+        self.lock = threading.Lock()
+        self._turns = itertools.count()
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        app.config.setdefault('DB_REPLICA_SELECTION', 'round_robin')
+        app.config.setdefault('DB_REPLICA_MAX_LAG', 5)
+        app.config.setdefault('DB_REPLICA_CHECK_INTERVAL', 5)
+        app.config.setdefault('DB_READ_AFTER_WRITE_SECONDS', 5)
+        self.db = db
+        self.names = [name for name in app.config.get('SQLALCHEMY_BINDS', {}) if name.startswith('replica_')]
+        self.in_flight = {name: 0 for name in self.names}
+        app.extensions['replica_router'] = self
+        if not self.names:
+            return
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        # Session events are global, once for every app of the process
+        if not event.contains(OrmSession, 'after_flush', self._after_flush):
+            event.listen(OrmSession, 'after_flush', self._after_flush)
+            event.listen(OrmSession, 'after_commit', self._after_commit)
+            event.listen(OrmSession, 'after_rollback', self._after_rollback)
+
+    def _check_lag(self):
+        now = time.monotonic()
+        with self.lock:
+            if self.checked_at is not None and now - self.checked_at < current_app.config['DB_REPLICA_CHECK_INTERVAL']:
+                return
+            # one request refreshes, the others keep using the last readings
+            self.checked_at = now
+        for name in self.names:
+            try:
+                self.lags[name] = replica_lag(self.db.engines[name])
+            except SQLAlchemyError as e:
+                current_app.logger.warning('Replica %s is unavailable: %s', name, e)
+                self.lags[name] = None
+
+    def choose(self):
+        # The replica for the next read-only request, None for the primary.
+        self._check_lag()
+        max_lag = current_app.config['DB_REPLICA_MAX_LAG']
+        candidates = [n for n in self.names if self.lags.get(n) is not None and self.lags[n] <= max_lag]
+        if not candidates:
+            return None
+        turn = next(self._turns) % len(candidates)
+        candidates = candidates[turn:] + candidates[:turn]
+        if current_app.config['DB_REPLICA_SELECTION'] == 'least_connections':
+            # the rotation breaks ties
+            with self.lock:
+                return min(candidates, key=lambda name: self.in_flight[name])
+        return candidates[0]
+
+    @contextmanager
+    def primary(self):
+        # Reads inside the block use the primary, for data kept beyond the
+        # request (caches, in-process indexes) that must not miss a write.
+        name = g.pop('read_bind', None) if has_app_context() else None
+        try:
+            yield
+        finally:
+            if name is not None:
+                g.read_bind = name
+
+    def _before_request(self):
+        view = current_app.view_functions.get(request.endpoint)
+        if not getattr(view, 'read_replica', False):
+            return
+        if session.get('_read_primary_until', 0) > time.time():
+            return
+        name = self.choose()
+        if name is not None:
+            g.read_bind = g.replica = name
+            with self.lock:
+                self.in_flight[name] += 1
+
+    def _after_request(self, response):
+        response.headers['X-DB-Bind'] = g.get('read_bind') or 'primary'
+        return response
+
+    def _teardown_request(self, error):
+        name = g.pop('replica', None)
+        if name is not None:
+            with self.lock:
+                self.in_flight[name] -= 1
+
+    def _after_flush(self, db_session, flush_context):
+        db_session.info['replica_wrote'] = True
+        if has_app_context():
+            # later reads of this request must see the write
+            g.pop('read_bind', None)
+
+    def _after_commit(self, db_session):
+        if db_session.info.pop('replica_wrote', False) and has_request_context():
+            session['_read_primary_until'] = time.time() + current_app.config['DB_READ_AFTER_WRITE_SECONDS']
+
+    def _after_rollback(self, db_session):
+        db_session.info.pop('replica_wrote', None)
+
+    def stats(self):
+        with self.lock:
+            in_flight = dict(self.in_flight)
+        return {
+            name: dict(pool_stats(self.db.engines[name]), lag_seconds=self.lags.get(name), in_flight=in_flight[name])
+            for name in self.names
+        }
@@ -1,62 +1,88 @@
-from datetime import datetime
+import io
+from datetime import datetime, timedelta
 
-from flask import render_template, request, flash, redirect, url_for
-from sqlalchemy import desc
+from flask import Blueprint, current_app, render_template, stream_template, request, flash, redirect, url_for, jsonify, abort
 
-from fyyur import app, db
+from fyyur import db, cache, replica_router
+from fyyur.availability import booking_conflicts, describe_conflicts, is_booking_conflict
+from fyyur.conditional import conditional, EntityVersion, TableVersion
+from fyyur.counters import count_hidden_shows
+from fyyur.directory import DIRECTORY_ORDER, venue_rows, group_areas, venue_directory, venue_areas
 from fyyur.helpers import format_datetime
-from fyyur.models import Genre, Venue, Artist, Show
-from fyyur.forms import ShowForm, VenueForm, ArtistForm
+from fyyur.instrumentation import query_budget
+from fyyur.loader import batch_loader
+from fyyur.pagination import paginate, per_page
+from fyyur.pool import pool_stats
+from fyyur.recent import recent_listings
+from fyyur.replicas import read_replica
+from fyyur.reference import genre_registry, sync_genres
+from fyyur.search import search
+from fyyur.models import Venue, Artist, Show
 
 
-app.jinja_env.filters['datetime'] = format_datetime
+main = Blueprint('main', __name__)
+main.add_app_template_filter(format_datetime, 'datetime')
 
 # ----------------------------------------------------------------------------#
 # Controllers.
 # ----------------------------------------------------------------------------#
 
 
-@app.route('/')
+@main.route('/')
+@read_replica
+@query_budget(0)
+@conditional(recent_listings.version)
+@cache.page(lambda: [('venues',), ('artists',)])
 def index():
-    venues = Venue.query.order_by(desc(Venue.created_at)).limit(10).all()
-    artists = Artist.query.order_by(desc(Artist.created_at)).limit(10).all()
+    # served from the in-memory feed, see fyyur/recent.py
+    venues = recent_listings.latest('venues')
+    artists = recent_listings.latest('artists')
     return render_template('pages/home.html', venues=venues, artists=artists)
 
 
 #  List All Venues
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
+@main.route('/venues')
+@read_replica
+@query_budget(2)
+@conditional(TableVersion(Venue))
+@cache.page(lambda: [('venues',), ('shows',)])
 def venues():
-    data = []
-    # Get unique city/state combinations
-    areas = Venue.query.with_entities(Venue.city, Venue.state).group_by(Venue.city, Venue.state).all()
-    # Get all venues for each city/state combination
-    for area in areas:
-        venues_in_area = Venue.query.filter_by(city=area.city).filter_by(state=area.state).all()
-        venue_data = []
-        for venue in venues_in_area:
-            venue_data.append({
-                "id": venue.id,
-                "name": venue.name,
-                "num_upcoming_shows": venue.upcoming_shows_count()
-            })
-        data.append({
-            "city": area.city,
-            "state": area.state,
-            "venues": venue_data
-        })
-    return render_template('pages/venues.html', areas=data)
+    # Large directories can render the area headings only and let the page
+    # fetch each area's venues through the fragment endpoint below.
+    if current_app.config.get('VENUES_LAZY_AREAS'):
+        return render_template('pages/venues.html', areas=venue_areas(), lazy=True)
+    page = paginate(venue_rows(), DIRECTORY_ORDER, request.args.get('cursor'), per_page('VENUES_PER_PAGE'))
+    return render_template('pages/venues.html', areas=group_areas(page.items), page=page, lazy=False)
+
+
+@main.route('/venues/area')
+@read_replica
+@query_budget(2)
+@conditional(TableVersion(Venue))
+def venues_area():
+    city = request.args.get('city', '')
+    state = request.args.get('state', '')
+
+    def render():
+        areas = venue_directory(city=city, state=state)
+        venues_in_area = areas[0]['venues'] if areas else []
+        return render_template('pages/venue_area.html', venues=venues_in_area)
+
+    return cache.fragment(f'venue_area:{state}:{city}', [('venues',), ('shows',)], render)
 
 
 #  Search Venues
 #  ----------------------------------------------------------------
 
 
-@app.route('/venues/search', methods=['POST'])
+@main.route('/venues/search', methods=['POST'])
+@read_replica
+@query_budget(2)
 def search_venues():
     search_term = request.form.get('search_term', '')
-    search_results = Venue.query.filter(Venue.name.ilike(f'%{search_term}%')).all()
+    search_results = search(Venue, search_term)
     response = {
         "count": len(search_results),
         "data": []
@@ -74,7 +100,11 @@ def search_venues():
 #  ----------------------------------------------------------------
 
 
-@app.route('/venues/<int:venue_id>')
+@main.route('/venues/<int:venue_id>')
+@read_replica
+@query_budget(5)
+@conditional(EntityVersion(Venue))
+@cache.page(lambda venue_id: [('venue', venue_id), ('artists',)])
 def show_venue(venue_id):
     venue = Venue.query.get(venue_id)
     if not venue:
@@ -82,17 +112,14 @@ def show_venue(venue_id):
 
     data = venue.to_dict()
 
-    past_shows = db.session.query(Show).join(Artist).filter(Show.venue_id == venue_id).filter(Show.start_time < datetime.now()).all()
-    past_shows_data = []
-    for past_show in past_shows:
-        past_shows_data.append(past_show.artist_dict())
+    # one query for the shows and one for all of their artists, see fyyur/loader.py
+    loader = batch_loader()
+    loader.want('artist', {show.artist_id for show in loader.get('venue_shows', venue_id)})
+    past_shows_data = [show.artist_dict() for show in venue.past_shows()]
     data['past_shows'] = past_shows_data
     data['past_shows_count'] = len(past_shows_data)
 
-    upcoming_shows = db.session.query(Show).join(Artist).filter(Show.venue_id == venue_id).filter(Show.start_time > datetime.now()).all()
-    upcoming_shows_data = []
-    for upcoming_show in upcoming_shows:
-        upcoming_shows_data.append(upcoming_show.artist_dict())
+    upcoming_shows_data = [show.artist_dict() for show in venue.upcoming_shows()]
     data['upcoming_shows'] = upcoming_shows_data
     data['upcoming_shows_count'] = len(upcoming_shows_data)
 
@@ -103,18 +130,21 @@ def show_venue(venue_id):
 #  ----------------------------------------------------------------
 
 
-@app.route('/venues/create', methods=['GET'])
+@main.route('/venues/create', methods=['GET'])
+@query_budget(1)
 def create_venue_form():
+    from fyyur.forms import VenueForm
     form = VenueForm()
-    form.genres.choices = [(g.id, g.name) for g in Genre.query.all()]
+    form.genres.choices = genre_registry.choices()
     return render_template('forms/new_venue.html', form=form)
 
 
-@app.route('/venues/create', methods=['POST'])
+@main.route('/venues/create', methods=['POST'])
 def create_venue_submission():
+    from fyyur.forms import VenueForm
     error = False
     form = VenueForm()
-    form.genres.choices = [(g.id, g.name) for g in Genre.query.all()]
+    form.genres.choices = genre_registry.choices()
     if form.validate_on_submit():
         try:
             venue = Venue(
@@ -129,10 +159,11 @@ def create_venue_submission():
               seeking_talent= True if 'seeking_talent' in request.form else False,
               seeking_description=request.form['seeking_description']
             )
-            venue_genres = Genre.query.filter(Genre.id.in_([int(i) for i in request.form.getlist('genres')])).all()
+            venue_genres = genre_registry.get_many([int(i) for i in request.form.getlist('genres')])
             venue.genres.extend(venue_genres)
             db.session.add(venue)
             db.session.commit()
+            cache.invalidate(('venues',), ('venue', venue.id))
         except:
             error = True
             db.session.rollback()
@@ -143,7 +174,7 @@ def create_venue_submission():
             return render_template('forms/new_venue.html', form=form)
         else:
             flash('Venue ' + request.form['name'] + ' was successfully listed!')
-            return redirect(url_for('index'))
+            return redirect(url_for('.index'))
 
     # Errors on form input, render template again showing errors
     return render_template('forms/new_venue.html', form=form)
@@ -152,13 +183,14 @@ def create_venue_submission():
 #  Edit Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@main.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
+    from fyyur.forms import VenueForm
     venue = Venue.query.get(venue_id)
     if not venue:
         return render_template('errors/404.html')
     form = VenueForm()
-    form.genres.choices = [(g.id, g.name) for g in Genre.query.all()]
+    form.genres.choices = genre_registry.choices()
     form.name.data = venue.name
     form.city.data = venue.city
     form.state.data = venue.state
@@ -173,12 +205,13 @@ def edit_venue(venue_id):
     return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@main.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
+    from fyyur.forms import VenueForm
     error = False
     venue = Venue.query.get(venue_id)
     form = VenueForm()
-    form.genres.choices = [(g.id, g.name) for g in Genre.query.all()]
+    form.genres.choices = genre_registry.choices()
     if form.validate_on_submit():
         try:
             venue.name=request.form['name']
@@ -191,10 +224,9 @@ def edit_venue_submission(venue_id):
             venue.facebook_link=request.form['facebook_link']
             venue.seeking_talent= True if 'seeking_talent' in request.form else False
             venue.seeking_description=request.form['seeking_description']
-            venue.genres.clear()
-            venue_genres = Genre.query.filter(Genre.id.in_([int(i) for i in request.form.getlist('genres')])).all()
-            venue.genres.extend(venue_genres)
+            sync_genres(venue, [int(i) for i in request.form.getlist('genres')])
             db.session.commit()
+            cache.invalidate(('venues',), ('venue', venue_id))
         except:
             error = True
             db.session.rollback()
@@ -205,7 +237,7 @@ def edit_venue_submission(venue_id):
             return render_template('forms/edit_venue.html', form=form, venue=venue)
         else:
             flash('Venue ' + request.form['name'] + ' was successfully updated!')
-            return redirect(url_for('show_venue', venue_id=venue_id))
+            return redirect(url_for('.show_venue', venue_id=venue_id))
 
     # Errors on form input, render template again showing errors
     return render_template('forms/edit_venue.html', form=form, venue=venue)
@@ -215,42 +247,53 @@ def edit_venue_submission(venue_id):
 #  ----------------------------------------------------------------
 
 
-@app.route('/venues/<venue_id>/delete', methods=['POST'])
+@main.route('/venues/<int:venue_id>/delete', methods=['POST'])
 def delete_venue(venue_id):
+    # only marks the venue deleted, `flask purge` removes it and its shows
     error = False
+    venue = Venue.query.get(venue_id)
+    if venue is None:
+        abort(404)
+    name = venue.name
     try:
-        venue = Venue.query.get(venue_id)
-        db.session.delete(venue)
+        count_hidden_shows(Venue, venue_id)
+        venue.deleted_at = datetime.now()
         db.session.commit()
+        cache.invalidate(('venues',), ('shows',), ('venue', venue_id))
     except:
         error = True
         db.session.rollback()
     finally:
         db.session.close()
     if error:
-        flash('An error occurred. Venue ' + venue.name + ' could not be deleted, please try again.')
-        return render_template('pages/show_venue.html', venue=venue)
+        flash('An error occurred. Venue ' + name + ' could not be deleted, please try again.')
+        return redirect(url_for('.show_venue', venue_id=venue_id))
     else:
-        flash('Venue ' + venue.name + ' was successfully deleted!')
-        return redirect(url_for('index'))
+        flash('Venue ' + name + ' was successfully deleted!')
+        return redirect(url_for('.index'))
 
 
 #  List All Artists
 #  ----------------------------------------------------------------
-@app.route('/artists')
+@main.route('/artists')
+@read_replica
+@query_budget(2)
+@conditional(TableVersion(Artist))
 def artists():
-    data = Artist.query.all()
-    return render_template('pages/artists.html', artists=data)
+    page = paginate(Artist.query, (Artist.created_at, Artist.id), request.args.get('cursor'), per_page('ARTISTS_PER_PAGE'))
+    return render_template('pages/artists.html', artists=page.items, page=page)
 
 
 #  Search Artists
 #  ----------------------------------------------------------------
 
 
-@app.route('/artists/search', methods=['POST'])
+@main.route('/artists/search', methods=['POST'])
+@read_replica
+@query_budget(2)
 def search_artists():
     search_term = request.form.get('search_term', '')
-    search_results = Artist.query.filter(Artist.name.ilike(f'%{search_term}%')).all()
+    search_results = search(Artist, search_term)
     response = {
         "count": len(search_results),
         "data": []
@@ -268,7 +311,11 @@ def search_artists():
 #  ----------------------------------------------------------------
 
 
-@app.route('/artists/<int:artist_id>')
+@main.route('/artists/<int:artist_id>')
+@read_replica
+@query_budget(5)
+@conditional(EntityVersion(Artist))
+@cache.page(lambda artist_id: [('artist', artist_id), ('venues',)])
 def show_artist(artist_id):
     artist = Artist.query.get(artist_id)
     if not artist:
@@ -276,17 +323,14 @@ def show_artist(artist_id):
 
     data = artist.to_dict()
 
-    past_shows = db.session.query(Show).join(Venue).filter(Show.artist_id == artist_id).filter(Show.start_time < datetime.now()).all()
-    past_shows_data = []
-    for past_show in past_shows:
-        past_shows_data.append(past_show.venue_dict())
+    # one query for the shows and one for all of their venues, see fyyur/loader.py
+    loader = batch_loader()
+    loader.want('venue', {show.venue_id for show in loader.get('artist_shows', artist_id)})
+    past_shows_data = [show.venue_dict() for show in artist.past_shows()]
     data['past_shows'] = past_shows_data
     data['past_shows_count'] = len(past_shows_data)
 
-    upcoming_shows = db.session.query(Show).join(Venue).filter(Show.artist_id == artist_id).filter(Show.start_time > datetime.now()).all()
-    upcoming_shows_data = []
-    for upcoming_show in upcoming_shows:
-        upcoming_shows_data.append(upcoming_show.venue_dict())
+    upcoming_shows_data = [show.venue_dict() for show in artist.upcoming_shows()]
     data['upcoming_shows'] = upcoming_shows_data
     data['upcoming_shows_count'] = len(upcoming_shows_data)
 
@@ -296,18 +340,21 @@ def show_artist(artist_id):
 #  Create Artist
 #  ----------------------------------------------------------------
 
-@app.route('/artists/create', methods=['GET'])
+@main.route('/artists/create', methods=['GET'])
+@query_budget(1)
 def create_artist_form():
+    from fyyur.forms import ArtistForm
     form = ArtistForm()
-    form.genres.choices = [(g.id, g.name) for g in Genre.query.all()]
+    form.genres.choices = genre_registry.choices()
     return render_template('forms/new_artist.html', form=form)
 
 
-@app.route('/artists/create', methods=['POST'])
+@main.route('/artists/create', methods=['POST'])
 def create_artist_submission():
+    from fyyur.forms import ArtistForm
     error = False
     form = ArtistForm()
-    form.genres.choices = [(g.id, g.name) for g in Genre.query.all()]
+    form.genres.choices = genre_registry.choices()
     if form.validate_on_submit():
         try:
             artist = Artist(
@@ -321,10 +368,11 @@ def create_artist_submission():
                 seeking_venue=True if 'seeking_venue' in request.form else False,
                 seeking_description=request.form['seeking_description']
             )
-            artist_genres = Genre.query.filter(Genre.id.in_([int(i) for i in request.form.getlist('genres')])).all()
+            artist_genres = genre_registry.get_many([int(i) for i in request.form.getlist('genres')])
             artist.genres.extend(artist_genres)
             db.session.add(artist)
             db.session.commit()
+            cache.invalidate(('artists',), ('artist', artist.id))
         except:
             error = True
             db.session.rollback()
@@ -335,7 +383,7 @@ def create_artist_submission():
             return render_template('forms/new_artist.html', form=form)
         else:
             flash('Artist ' + request.form['name'] + ' was successfully listed!')
-            return redirect(url_for('index'))
+            return redirect(url_for('.index'))
 
     # Errors on form input, render template again showing errors
     return render_template('forms/new_artist.html', form=form)
@@ -345,13 +393,14 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@main.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
+    from fyyur.forms import ArtistForm
     artist = Artist.query.get(artist_id)
     if not artist:
         return render_template('errors/404.html')
     form = ArtistForm()
-    form.genres.choices = [(g.id, g.name) for g in Genre.query.all()]
+    form.genres.choices = genre_registry.choices()
     form.name.data = artist.name
     form.city.data = artist.city
     form.state.data = artist.state
@@ -365,12 +414,13 @@ def edit_artist(artist_id):
     return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@main.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
+    from fyyur.forms import ArtistForm
     error = False
     artist = Artist.query.get(artist_id)
     form = ArtistForm()
-    form.genres.choices = [(g.id, g.name) for g in Genre.query.all()]
+    form.genres.choices = genre_registry.choices()
     if form.validate_on_submit():
         try:
             artist.name = request.form['name']
@@ -382,10 +432,9 @@ def edit_artist_submission(artist_id):
             artist.facebook_link = request.form['facebook_link']
             artist.seeking_venue = True if 'seeking_venue' in request.form else False
             artist.seeking_description = request.form['seeking_description']
-            artist.genres.clear()
-            artist_genres = Genre.query.filter(Genre.id.in_([int(i) for i in request.form.getlist('genres')])).all()
-            artist.genres.extend(artist_genres)
+            sync_genres(artist, [int(i) for i in request.form.getlist('genres')])
             db.session.commit()
+            cache.invalidate(('artists',), ('artist', artist_id))
         except:
             error = True
             db.session.rollback()
@@ -396,44 +445,88 @@ def edit_artist_submission(artist_id):
             return render_template('forms/edit_artist.html', form=form, artist=artist)
         else:
             flash('Artist ' + request.form['name'] + ' was successfully updated!')
-            return redirect(url_for('show_artist', artist_id=artist_id))
+            return redirect(url_for('.show_artist', artist_id=artist_id))
 
     # Errors on form input, render template again showing errors
     return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 
+#  Delete Artist
+#  ----------------------------------------------------------------
+
+
+@main.route('/artists/<int:artist_id>/delete', methods=['POST'])
+def delete_artist(artist_id):
+    # only marks the artist deleted, `flask purge` removes it and its shows
+    error = False
+    artist = Artist.query.get(artist_id)
+    if artist is None:
+        abort(404)
+    name = artist.name
+    try:
+        count_hidden_shows(Artist, artist_id)
+        artist.deleted_at = datetime.now()
+        db.session.commit()
+        cache.invalidate(('artists',), ('shows',), ('artist', artist_id))
+    except:
+        error = True
+        db.session.rollback()
+    finally:
+        db.session.close()
+    if error:
+        flash('An error occurred. Artist ' + name + ' could not be deleted, please try again.')
+        return redirect(url_for('.show_artist', artist_id=artist_id))
+    else:
+        flash('Artist ' + name + ' was successfully deleted!')
+        return redirect(url_for('.index'))
+
+
 #  List All Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
+@main.route('/shows')
+@read_replica
+@query_budget(2)
+@conditional(TableVersion(Venue, Artist))
 def shows():
-    data = []
-    all_shows = Show.query.all()
-    for show in all_shows:
-        data.append({
-            "venue_id": show.venue_id,
-            "venue_name": show.venue.name,
-            "artist_id": show.artist_id,
-            "artist_name": show.artist.name,
-            "artist_image_link": show.artist.image_link,
-            "start_time": show.start_time.strftime('%Y-%m-%d %H:%M:%S')
-        })
-    return render_template('pages/shows.html', shows=data)
+    # One joined select read through a server-side cursor, rows are rendered
+    # and sent to the client as they arrive.
+    query = db.session.query(
+        Show.id,
+        Show.start_time,
+        Show.venue_id,
+        Venue.name.label('venue_name'),
+        Show.artist_id,
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link')
+    ).join(Venue, Show.venue_id == Venue.id).join(Artist, Show.artist_id == Artist.id)
+    page = paginate(query, (Show.start_time, Show.id), request.args.get('cursor'), per_page('SHOWS_PER_PAGE'), stream=True)
+    data = ({
+        "venue_id": show.venue_id,
+        "venue_name": show.venue_name,
+        "artist_id": show.artist_id,
+        "artist_name": show.artist_name,
+        "artist_image_link": show.artist_image_link,
+        "start_time": show.start_time
+    } for show in page)
+    return stream_template('pages/shows.html', shows=data, page=page)
 
 
 #  Create Show
 #  ----------------------------------------------------------------
 
 
-@app.route('/shows/create')
+@main.route('/shows/create')
 def create_shows():
+    from fyyur.forms import ShowForm
     form = ShowForm()
     return render_template('forms/new_show.html', form=form)
 
 
-@app.route('/shows/create', methods=['POST'])
+@main.route('/shows/create', methods=['POST'])
 def create_show_submission():
-    error = False
+    from fyyur.forms import ShowForm
+    error = booked = False
     form = ShowForm()
     if form.validate_on_submit():
         # check that the provided venue id and artist id exist in DB
@@ -442,37 +535,94 @@ def create_show_submission():
         if venue is None or artist is None:
             flash('Please make sure the Artist ID and the Venue ID exist.')
             return render_template('forms/new_show.html', form=form)
-        # both venue and artist exist, can now create the show
+        start_time = form.start_time.data
+        end_time = start_time + timedelta(minutes=form.duration.data)
+        conflicts = booking_conflicts(venue.id, artist.id, start_time, end_time)
+        if conflicts:
+            flash(describe_conflicts(conflicts))
+            return render_template('forms/new_show.html', form=form)
+        # both venue and artist exist and are free, can now create the show
         try:
             show = Show(
                 artist=artist,
                 venue=venue,
-                start_time=request.form['start_time']
+                start_time=start_time,
+                end_time=end_time
             )
             db.session.add(show)
             db.session.commit()
-        except:
+            cache.invalidate(('shows',), ('venue', venue.id), ('artist', artist.id))
+        except Exception as e:
+            # a concurrent booking can still take the slot after the check
             error = True
+            booked = is_booking_conflict(e)
             db.session.rollback()
         finally:
             db.session.close()
+        if booked:
+            flash('The venue or the artist was booked for that time in the meantime, please pick another time.')
+            return render_template('forms/new_show.html', form=form)
         if error:
             flash('An error occurred. The Show could not be listed, please try again.')
             return render_template('forms/new_show.html', form=form)
         else:
             flash('The Show was successfully listed!')
-            return redirect(url_for('index'))
+            return redirect(url_for('.index'))
 
     # Errors on form input, render template again showing errors
     return render_template('forms/new_show.html', form=form)
 
 
-@app.errorhandler(404)
+#  Bulk Import
+#  ----------------------------------------------------------------
+
+
+@main.route('/import/<kind>', methods=['POST'])
+def import_data(kind):
+    # multipart upload of a CSV or JSONL file, answers with the import report
+    from fyyur.importer import IMPORTERS, detect_format, import_rows, read_rows
+    upload = request.files.get('file')
+    if kind not in IMPORTERS or upload is None:
+        abort(400)
+    try:
+        format = request.form.get('format') or detect_format(upload.filename)
+    except ValueError:
+        abort(400)
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8', newline='')
+    report = import_rows(kind, read_rows(stream, format))
+    return jsonify(report.to_dict())
+
+
+@main.route('/edit/<kind>', methods=['POST'])
+def edit_data(kind):
+    # a JSON list of partial updates, each with an `id`, answers with a result per item
+    from fyyur.importer import EDITABLE, edit_rows
+    items = request.get_json(silent=True)
+    if kind not in EDITABLE or not isinstance(items, list):
+        abort(400)
+    report = edit_rows(kind, [(i, item if isinstance(item, dict) else None) for i, item in enumerate(items, 1)])
+    return jsonify(report.to_dict())
+
+
+@main.route('/cache/stats')
+def cache_stats():
+    return jsonify(cache.stats())
+
+
+@main.route('/pool/stats')
+def pool_stats_view():
+    stats = pool_stats(db.engine)
+    if replica_router.names:
+        stats['replicas'] = replica_router.stats()
+    return jsonify(stats)
+
+
+@main.app_errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
 
-@app.errorhandler(500)
+@main.app_errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
@@ -0,0 +1,197 @@
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from difflib import get_close_matches
+
+from flask import current_app
+from sqlalchemy import event, func, literal_column, or_
+from sqlalchemy.orm import Session
+
+from fyyur import db, replica_router
+from fyyur.models import Venue, Artist
+
+# ----------------------------------------------------------------------------#
+# Search.
+#
+# Venues and artists keep a `search_text` document (name, city, state and
+# genre names). On Postgres the migration adds a generated `search_vector`
+# tsvector plus GIN and trigram indexes over it, so a search is one indexed
+# query ranked by ts_rank and trigram similarity. Other backends use an
+# in-process inverted index kept in step with committed changes.
+# ----------------------------------------------------------------------------#
+
+SEARCHABLE = (Venue, Artist)
+
+
+def tokenize(text):
+    return re.findall(r'\w+', (text or '').lower())
+
+
+def document_text(parts):
+    return ' '.join(tokenize(' '.join(p for p in parts if p)))
+
+
+def search_document(entity):
+    return document_text([entity.name, entity.city, entity.state] + [g.name for g in entity.genres])
+
+
+def search(model, term, limit=None, query=None):
+    # Entities matching `term`, best first. `query` narrows what is loaded,
+    # e.g. a query of some columns of `model` that include `id`.
+    limit = limit or current_app.config.get('SEARCH_RESULT_LIMIT', 50)
+    query = query if query is not None else model.query
+    tokens = tokenize(term)
+    if not tokens:
+        return query.order_by(model.name).limit(limit).all()
+    if db.engine.dialect.name == 'postgresql':
+        match, rank = postgres_match(model, tokens)
+        return query.filter(match).order_by(rank.desc(), model.id).limit(limit).all()
+    ids = index_search(model, tokens, limit)
+    if not ids:
+        return []
+    found = {row.id: row for row in query.filter(model.id.in_(ids))}
+    return [found[i] for i in ids if i in found]
+
+
+def postgres_match(model, tokens):
+    # The full-text/trigram condition and its rank, for any select over `model`.
+    vector = literal_column(f'{model.__tablename__}.search_vector')
+    query = func.to_tsquery('simple', ' & '.join(f'{t}:*' for t in tokens))
+    term = ' '.join(tokens)
+    rank = func.ts_rank(vector, query) + func.similarity(model.search_text, term)
+    return or_(vector.op('@@')(query), model.search_text.bool_op('%')(term)), rank
+
+
+def index_search(model, tokens, limit):
+    # Ids of the best matches in the in-process index, best first.
+    index = _index_for(model)
+    with _indexes_lock:
+        return index.search(tokens, limit)
+
+
+#  In-process inverted index
+#  ----------------------------------------------------------------
+
+
+class InvertedIndex:
+
+    def __init__(self):
+        self.postings = defaultdict(set)
+        self.documents = {}
+        self._terms = None
+
+    def add(self, doc_id, text):
+        self.remove(doc_id)
+        tokens = set(tokenize(text))
+        self.documents[doc_id] = tokens
+        for token in tokens:
+            self.postings[token].add(doc_id)
+        self._terms = None
+
+    def remove(self, doc_id):
+        for token in self.documents.pop(doc_id, ()):
+            self.postings[token].discard(doc_id)
+            if not self.postings[token]:
+                del self.postings[token]
+        self._terms = None
+
+    @property
+    def terms(self):
+        if self._terms is None:
+            self._terms = sorted(self.postings)
+        return self._terms
+
+    def _matches(self, token):
+        # exact hits score highest, then prefix hits, then close misspellings
+        scores = {}
+        terms = self.terms
+        i = bisect_left(terms, token)
+        while i < len(terms) and terms[i].startswith(token):
+            weight = 3 if terms[i] == token else 2
+            for doc_id in self.postings[terms[i]]:
+                scores[doc_id] = max(scores.get(doc_id, 0), weight)
+            i += 1
+        if not scores:
+            for close in get_close_matches(token, terms, n=3, cutoff=0.75):
+                for doc_id in self.postings[close]:
+                    scores[doc_id] = 1
+        return scores
+
+    def search(self, tokens, limit):
+        ranked = None
+        for token in tokens:
+            scores = self._matches(token)
+            if ranked is None:
+                ranked = scores
+            else:
+                ranked = {d: ranked[d] + s for d, s in scores.items() if d in ranked}
+            if not ranked:
+                return []
+        return sorted(ranked, key=lambda d: (-ranked[d], d))[:limit]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def _index_for(model):
+    with _indexes_lock:
+        if model not in _indexes:
+            index = InvertedIndex()
+            with replica_router.primary():
+                for doc_id, text in db.session.query(model.id, model.search_text):
+                    index.add(doc_id, text)
+            _indexes[model] = index
+        return _indexes[model]
+
+
+def index_documents(model, documents):
+    # For rows written without the ORM (bulk imports), once committed.
+    with _indexes_lock:
+        index = _indexes.get(model)
+        if index is not None:
+            for doc_id, text in documents:
+                index.add(doc_id, text)
+
+
+#  Keeping documents current
+#  ----------------------------------------------------------------
+
+
+@event.listens_for(Session, 'before_flush')
+def _refresh_search_documents(session, flush_context, instances):
+    for entity in list(session.new) + list(session.dirty):
+        if isinstance(entity, SEARCHABLE):
+            entity.search_text = search_document(entity)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_index_changes(session, flush_context):
+    changes = session.info.setdefault('search_changes', [])
+    for entity in list(session.new) + list(session.dirty):
+        if isinstance(entity, SEARCHABLE):
+            # soft deletes leave the index like deletes
+            changes.append((type(entity), entity.id, None if entity.deleted_at else entity.search_text))
+    for entity in session.deleted:
+        if isinstance(entity, SEARCHABLE):
+            changes.append((type(entity), entity.id, None))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_index_changes(session):
+    changes = session.info.pop('search_changes', [])
+    with _indexes_lock:
+        for model, doc_id, text in changes:
+            index = _indexes.get(model)
+            if index is None:
+                continue
+            if text is None:
+                index.remove(doc_id)
+            else:
+                index.add(doc_id, text)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_index_changes(session):
+    session.info.pop('search_changes', None)
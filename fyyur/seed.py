@@ -0,0 +1,166 @@
+import random
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, insert, text
+
+from fyyur import db, cache
+from fyyur.counters import reconcile_counters
+from fyyur.availability import invalidate_bookings
+from fyyur.models import Genre, Venue, Artist, Show, genres_venues, artists_genres, DEFAULT_SHOW_DURATION
+from fyyur.recent import recent_listings
+from fyyur.reference import genre_registry
+from fyyur.search import document_text
+
+# ----------------------------------------------------------------------------#
+# Synthetic data.
+# ----------------------------------------------------------------------------#
+
+CITIES = [
+    ('New York', 'NY'), ('Los Angeles', 'CA'), ('Chicago', 'IL'), ('Austin', 'TX'),
+    ('Nashville', 'TN'), ('Seattle', 'WA'), ('New Orleans', 'LA'), ('Denver', 'CO'),
+    ('San Francisco', 'CA'), ('Atlanta', 'GA'), ('Portland', 'OR'), ('Boston', 'MA'),
+    ('Detroit', 'MI'), ('Memphis', 'TN'), ('Philadelphia', 'PA'), ('Minneapolis', 'MN'),
+]
+WORDS = [
+    'Blue', 'Red', 'Velvet', 'Electric', 'Golden', 'Midnight', 'Silver', 'Wild',
+    'Lonesome', 'Neon', 'Crimson', 'Iron', 'Echo', 'Lucky', 'Rolling', 'Hollow',
+]
+VENUE_NOUNS = ['Room', 'Hall', 'Lounge', 'Tavern', 'Club', 'Theater', 'Garden', 'Bar']
+ARTIST_NOUNS = ['Band', 'Collective', 'Quartet', 'Kings', 'Sisters', 'Trio', 'Project', 'Revival']
+BATCH_SIZE = 5000
+
+
+def _weights(n, skew):
+    # Zipf-like: a handful of entities get most of the shows.
+    return [1.0 / (rank + 1) ** skew for rank in range(n)]
+
+
+def _batches(rows):
+    for i in range(0, len(rows), BATCH_SIZE):
+        yield rows[i:i + BATCH_SIZE]
+
+
+def _insert(table, rows):
+    for batch in _batches(rows):
+        db.session.execute(insert(table), batch)
+
+
+def _sync_sequence(table):
+    # rows were inserted with explicit ids, move the serial past them
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), coalesce(max(id), 1)) FROM {table.name}"
+        ))
+
+
+def _name(rng, nouns, i):
+    return f'{rng.choice(WORDS)} {rng.choice(WORDS)} {rng.choice(nouns)} {i}'
+
+
+def seed_database(venues, artists, genres, shows, past_ratio=0.8, skew=1.1, seed=0):
+    # Returns the number of shows inserted, fewer than `shows` when busy
+    # venues and artists had no free slot left.
+    rng = random.Random(seed)
+    now = datetime.now()
+
+    existing = db.session.query(func.count(Genre.id)).scalar()
+    next_id = (db.session.query(func.max(Genre.id)).scalar() or 0) + 1
+    _insert(Genre.__table__, [{'id': next_id + i, 'name': f'Genre {next_id + i}'} for i in range(max(genres - existing, 0))])
+    genre_names = dict(db.session.query(Genre.id, Genre.name))
+    genre_ids = list(genre_names)
+
+    def entity_rows(model, count, nouns, seeking_key):
+        first_id = (db.session.query(func.max(model.id)).scalar() or 0) + 1
+        rows, links = [], []
+        for i in range(count):
+            city, state = rng.choice(CITIES)
+            picked = rng.sample(genre_ids, k=min(len(genre_ids), rng.randint(1, 3)))
+            name = _name(rng, nouns, first_id + i)
+            rows.append({
+                'id': first_id + i,
+                'name': name,
+                'city': city,
+                'state': state,
+                'phone': f'{rng.randint(200, 999)}-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}',
+                'image_link': f'https://picsum.photos/seed/{nouns[0].lower()}{first_id + i}/300/300',
+                seeking_key: rng.random() < 0.3,
+                'seeking_description': None,
+                'created_at': now - timedelta(days=rng.randint(0, 3 * 365), seconds=rng.randint(0, 86400)),
+                'search_text': document_text([name, city, state] + [genre_names[g] for g in picked]),
+            })
+            links.append((first_id + i, picked))
+        return rows, links
+
+    venue_rows, venue_links = entity_rows(Venue, venues, VENUE_NOUNS, 'seeking_talent')
+    for row in venue_rows:
+        row['address'] = f'{rng.randint(1, 9999)} {rng.choice(WORDS)} St'
+    _insert(Venue.__table__, venue_rows)
+    _insert(genres_venues, [{'venue_id': v, 'genre_id': g} for v, picked in venue_links for g in picked])
+
+    artist_rows, artist_links = entity_rows(Artist, artists, ARTIST_NOUNS, 'seeking_venue')
+    _insert(Artist.__table__, artist_rows)
+    _insert(artists_genres, [{'artist_id': a, 'genre_id': g} for a, picked in artist_links for g in picked])
+
+    venue_ids = [row['id'] for row in venue_rows]
+    artist_ids = [row['id'] for row in artist_rows]
+    show_rows = []
+    if venue_ids and artist_ids and shows:
+        rng.shuffle(venue_ids)
+        rng.shuffle(artist_ids)
+        picked_venues = rng.choices(venue_ids, weights=_weights(len(venue_ids), skew), k=shows)
+        picked_artists = rng.choices(artist_ids, weights=_weights(len(artist_ids), skew), k=shows)
+        # shows start on the hour, a booking holds every hour it touches
+        hours = [timedelta(hours=h) for h in range(-(-DEFAULT_SHOW_DURATION // timedelta(hours=1)))]
+        booked = set()
+        for venue_id, artist_id in zip(picked_venues, picked_artists):
+            # a few tries for a time both are free, busy pairs are skipped
+            for attempt in range(10):
+                if rng.random() < past_ratio:
+                    start_time = now - timedelta(days=rng.randint(1, 5 * 365), hours=rng.randint(0, 23))
+                else:
+                    start_time = now + timedelta(days=rng.randint(1, 365), hours=rng.randint(0, 23))
+                start_time = start_time.replace(minute=0, second=0, microsecond=0)
+                slots = [(key, start_time + h) for key in (('venue', venue_id), ('artist', artist_id)) for h in hours]
+                if booked.isdisjoint(slots):
+                    break
+            else:
+                continue
+            booked.update(slots)
+            show_rows.append({
+                'venue_id': venue_id,
+                'artist_id': artist_id,
+                'start_time': start_time,
+                'end_time': start_time + DEFAULT_SHOW_DURATION,
+                'is_upcoming': start_time > now,
+            })
+        _insert(Show.__table__, show_rows)
+
+    for model in (Genre, Venue, Artist):
+        _sync_sequence(model.__table__)
+    db.session.commit()
+    # bulk inserts skip the ORM events, rebuild the counters in one pass
+    reconcile_counters()
+    genre_registry.invalidate()
+    recent_listings.invalidate()
+    invalidate_bookings()
+    cache.invalidate(('venues',), ('artists',), ('shows',))
+    return len(show_rows)
+
+
+@click.command('seed')
+@click.option('--venues', default=1000, show_default=True)
+@click.option('--artists', default=2000, show_default=True)
+@click.option('--genres', default=19, show_default=True, help='Total number of genres.')
+@click.option('--shows', default=20000, show_default=True)
+@click.option('--past-ratio', default=0.8, show_default=True, help='Share of shows in the past.')
+@click.option('--skew', default=1.1, show_default=True, help='Zipf exponent of shows per venue/artist.')
+@click.option('--seed', default=0, show_default=True, help='Random seed.')
+@with_appcontext
+def seed_command(venues, artists, genres, shows, past_ratio, skew, seed):
+    """Fill the database with synthetic venues, artists and shows."""
+    inserted = seed_database(venues, artists, genres, shows, past_ratio, skew, seed)
+    click.echo(f'Seeded {venues} venues, {artists} artists and {inserted} shows.')
+    if inserted < shows:
+        click.echo(f'{shows - inserted} shows were skipped, their venue or artist had no free slot.')
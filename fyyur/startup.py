@@ -0,0 +1,106 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+
+import click
+
+from fyyur.benchmark import _git_commit
+
+# ----------------------------------------------------------------------------#
+# Startup benchmark.
+#
+# `flask bench-startup` measures what a new worker pays before serving:
+# `import fyyur`, create_app() and the first request to a few pages, each
+# run in a fresh interpreter so no module is already imported. The median of
+# the runs is reported with the slowest imports of the last one
+# (python -X importtime).
+# ----------------------------------------------------------------------------#
+
+FIRST_REQUESTS = ['/', '/venues', '/artists']
+
+# runs in the child interpreter, prints one JSON line
+_PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+import fyyur
+imported = time.perf_counter()
+app = fyyur.create_app()
+created = time.perf_counter()
+client = app.test_client()
+first = {}
+for url in sys.argv[1:]:
+    t = time.perf_counter()
+    client.get(url)
+    first[url] = time.perf_counter() - t
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_request_ms': {url: seconds * 1000 for url, seconds in first.items()},
+    'modules': len(sys.modules),
+}))
+'''
+
+
+def _probe(urls, importtime=False):
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', _PROBE] + urls
+    # the child reads the same FYYUR_ENV and config.py, but not the CLI's app
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.getcwd(), os.environ.get('PYTHONPATH')])))
+    result = subprocess.run(command, capture_output=True, text=True, env=env)
+    if result.returncode != 0:
+        raise click.ClickException(f'Startup probe failed:\n{result.stderr}')
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def slowest_imports(importtime_log, top):
+    # (cumulative ms, module) of the top-level imports in -X importtime output
+    rows = []
+    for line in importtime_log.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit() and not module.startswith('   '):
+            rows.append((int(cumulative) / 1000, module.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def _median(runs, key):
+    return round(statistics.median(key(run) for run in runs), 1)
+
+
+@click.command('bench-startup')
+@click.option('--runs', default=5, show_default=True, help='Fresh interpreters to time.')
+@click.option('--top', default=10, show_default=True, help='Slowest imports to list.')
+@click.option('--output', type=click.Path(), help='Also save the results as JSON.')
+def bench_startup_command(runs, top, output):
+    """Time importing fyyur, create_app() and the first requests."""
+    samples = [_probe(FIRST_REQUESTS)[0] for _ in range(runs)]
+    _, importtime_log = _probe(FIRST_REQUESTS, importtime=True)
+
+    results = {
+        'commit': _git_commit(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'runs': runs,
+        'import_ms': _median(samples, lambda run: run['import_ms']),
+        'create_app_ms': _median(samples, lambda run: run['create_app_ms']),
+        'first_request_ms': {
+            url: _median(samples, lambda run: run['first_request_ms'][url]) for url in FIRST_REQUESTS
+        },
+        'modules': samples[-1]['modules'],
+        'slowest_imports': [{'module': module, 'ms': ms} for ms, module in slowest_imports(importtime_log, top)],
+    }
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    click.echo(f'median of {runs} fresh interpreters')
+    click.echo(f'{"import fyyur":<24}{results["import_ms"]:>10} ms')
+    click.echo(f'{"create_app()":<24}{results["create_app_ms"]:>10} ms')
+    for url, ms in results['first_request_ms'].items():
+        click.echo(f'{"first GET " + url:<24}{ms:>10} ms')
+    click.echo(f'{results["modules"]} modules loaded after the first requests')
+    click.echo('slowest imports:')
+    for row in results['slowest_imports']:
+        click.echo(f'  {row["ms"]:>8.1f} ms  {row["module"]}')
@@ -2,3 +2,47 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// load venue areas rendered as placeholders on the /venues page when they
+// come near the viewport, a few at a time
+var AREA_FETCHES = 4;
+
+document.addEventListener('DOMContentLoaded', function() {
+  var areas = document.querySelectorAll('.venue-area[data-url]');
+  var queue = [];
+  var running = 0;
+
+  function next() {
+    if (running >= AREA_FETCHES || !queue.length) return;
+    var area = queue.shift();
+    running++;
+    fetch(area.getAttribute('data-url'))
+      .then(function(response) { return response.text(); })
+      .then(function(html) { area.innerHTML = html; })
+      // a failed area keeps its venue count
+      .catch(function() {})
+      .then(function() { running--; next(); });
+    next();
+  }
+
+  function load(area) {
+    if (area.hasAttribute('data-loading')) return;
+    area.setAttribute('data-loading', '');
+    queue.push(area);
+    next();
+  }
+
+  if (!('IntersectionObserver' in window)) {
+    Array.prototype.forEach.call(areas, load);
+    return;
+  }
+  var observer = new IntersectionObserver(function(entries) {
+    entries.forEach(function(entry) {
+      if (entry.isIntersecting) {
+        observer.unobserve(entry.target);
+        load(entry.target);
+      }
+    });
+  }, { rootMargin: '200px 0px' });
+  Array.prototype.forEach.call(areas, function(area) { observer.observe(area); });
+});
@@ -0,0 +1,43 @@
+"""indexes for the hot queries
+
+Revision ID: 3b9f04c6d7e1
+Revises: c4e7b19d2a63
+Create Date: 2026-10-18 12:05:44.102938
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b9f04c6d7e1'
+down_revision = 'c4e7b19d2a63'
+branch_labels = None
+depends_on = None
+
+# name, table, columns, options; same as the Index() entries in fyyur/models.py
+INDEXES = [
+    ('ix_shows_venue_id_start_time', 'shows', ['venue_id', 'start_time'], {'postgresql_include': ['artist_id']}),
+    ('ix_shows_artist_id_start_time', 'shows', ['artist_id', 'start_time'], {'postgresql_include': ['venue_id']}),
+    ('ix_shows_start_time_id', 'shows', ['start_time', 'id'], {}),
+    ('ix_shows_upcoming_start_time', 'shows', ['start_time'], {'postgresql_where': sa.text('is_upcoming')}),
+    ('ix_venues_directory', 'venues', ['state', 'city', 'name', 'id'], {'postgresql_include': ['num_upcoming_shows']}),
+    ('ix_venues_created_at_id', 'venues', ['created_at', 'id'], {}),
+    ('ix_artists_created_at_id', 'artists', ['created_at', 'id'], {}),
+    ('ix_genres_venues_venue_id', 'genres_venues', ['venue_id'], {}),
+]
+
+
+def upgrade():
+    # CONCURRENTLY keeps the tables writable during the build but cannot run
+    # inside a transaction. A build that fails leaves an INVALID index
+    # behind; drop it before running the upgrade again.
+    with op.get_context().autocommit_block():
+        for name, table, columns, options in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True, **options)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,41 @@
+"""show counters on venues and artists
+
+Revision ID: 5f1c2a9e7b40
+Revises: 2d166383b202
+Create Date: 2026-10-18 09:12:41.331902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5f1c2a9e7b40'
+down_revision = '2d166383b202'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('artists', sa.Column('num_upcoming_shows', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('artists', sa.Column('num_past_shows', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('venues', sa.Column('num_upcoming_shows', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('venues', sa.Column('num_past_shows', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('shows', sa.Column('is_upcoming', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+    # backfill, same as `flask shows reconcile`
+    op.execute('UPDATE shows SET is_upcoming = start_time > now()')
+    for table, fk in (('venues', 'venue_id'), ('artists', 'artist_id')):
+        op.execute(f'''
+            UPDATE {table} SET
+                num_upcoming_shows = (SELECT count(*) FROM shows WHERE shows.{fk} = {table}.id AND shows.is_upcoming),
+                num_past_shows = (SELECT count(*) FROM shows WHERE shows.{fk} = {table}.id AND NOT shows.is_upcoming)
+        ''')
+
+
+def downgrade():
+    op.drop_column('shows', 'is_upcoming')
+    op.drop_column('venues', 'num_past_shows')
+    op.drop_column('venues', 'num_upcoming_shows')
+    op.drop_column('artists', 'num_past_shows')
+    op.drop_column('artists', 'num_upcoming_shows')
@@ -0,0 +1,44 @@
+"""search documents and indexes for venues and artists
+
+Revision ID: 8a3d6e21c9f5
+Revises: 5f1c2a9e7b40
+Create Date: 2026-10-18 10:02:17.554120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a3d6e21c9f5'
+down_revision = '5f1c2a9e7b40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table, association, fk in (('venues', 'genres_venues', 'venue_id'), ('artists', 'artists_genres', 'artist_id')):
+        op.add_column(table, sa.Column('search_text', sa.Text(), nullable=True))
+        # same document as fyyur.search.search_document()
+        op.execute(f'''
+            UPDATE {table} SET search_text = lower(regexp_replace(concat_ws(' ', name, city, state, (
+                SELECT string_agg(genres.name, ' ')
+                FROM {association} JOIN genres ON genres.id = {association}.genre_id
+                WHERE {association}.{fk} = {table}.id
+            )), '[^[:alnum:]_]+', ' ', 'g'))
+        ''')
+        op.execute(f'''
+            ALTER TABLE {table} ADD COLUMN search_vector tsvector
+            GENERATED ALWAYS AS (to_tsvector('simple', coalesce(search_text, ''))) STORED
+        ''')
+        op.create_index(f'ix_{table}_search_vector', table, ['search_vector'], postgresql_using='gin')
+        op.execute(f'CREATE INDEX ix_{table}_search_text_trgm ON {table} USING gin (search_text gin_trgm_ops)')
+
+
+def downgrade():
+    for table in ('venues', 'artists'):
+        op.drop_index(f'ix_{table}_search_text_trgm', table_name=table)
+        op.drop_index(f'ix_{table}_search_vector', table_name=table)
+        op.drop_column(table, 'search_vector')
+        op.drop_column(table, 'search_text')
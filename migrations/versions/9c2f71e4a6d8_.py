@@ -0,0 +1,34 @@
+"""soft delete of venues and artists
+
+Revision ID: 9c2f71e4a6d8
+Revises: e7a25c0d9b14
+Create Date: 2026-10-18 16:40:12.884317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c2f71e4a6d8'
+down_revision = 'e7a25c0d9b14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('venues', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.add_column('artists', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    # only deleted rows are indexed, so the indexes start out empty
+    with op.get_context().autocommit_block():
+        for table in ('venues', 'artists'):
+            op.create_index(f'ix_{table}_deleted_at', table, ['deleted_at'], unique=False,
+                            postgresql_where=sa.text('deleted_at IS NOT NULL'), postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for table in ('artists', 'venues'):
+            op.drop_index(f'ix_{table}_deleted_at', table_name=table, postgresql_concurrently=True)
+    op.drop_column('artists', 'deleted_at')
+    op.drop_column('venues', 'deleted_at')
@@ -0,0 +1,30 @@
+"""updated_at on venues and artists
+
+Revision ID: c4e7b19d2a63
+Revises: 8a3d6e21c9f5
+Create Date: 2026-10-18 11:20:05.618347
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e7b19d2a63'
+down_revision = '8a3d6e21c9f5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venues', 'artists'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now(), nullable=False))
+        op.execute(f'UPDATE {table} SET updated_at = created_at')
+        # max(updated_at) is read for every conditional list request
+        op.create_index(op.f(f'ix_{table}_updated_at'), table, ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table in ('artists', 'venues'):
+        op.drop_index(op.f(f'ix_{table}_updated_at'), table_name=table)
+        op.drop_column(table, 'updated_at')
@@ -0,0 +1,60 @@
+"""show end times and booking exclusion constraints
+
+Revision ID: e7a25c0d9b14
+Revises: 3b9f04c6d7e1
+Create Date: 2026-10-18 14:02:37.551204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a25c0d9b14'
+down_revision = '3b9f04c6d7e1'
+branch_labels = None
+depends_on = None
+
+# shows booked at the same venue, or by the same artist, at overlapping times
+OVERLAPS = '''
+SELECT count(*) FROM shows a JOIN shows b
+  ON a.{key} = b.{key} AND a.id < b.id
+ AND a.start_time < b.end_time AND b.start_time < a.end_time
+'''
+
+
+def upgrade():
+    op.add_column('shows', sa.Column('end_time', sa.DateTime(), nullable=True))
+    # every existing show gets the default length of two hours
+    op.execute("UPDATE shows SET end_time = start_time + interval '2 hours'")
+    op.alter_column('shows', 'end_time', nullable=False)
+    op.create_check_constraint('ck_shows_end_after_start', 'shows', 'end_time > start_time')
+
+    bind = op.get_bind()
+    for key in ('venue_id', 'artist_id'):
+        overlapping = bind.execute(sa.text(OVERLAPS.format(key=key))).scalar()
+        if overlapping:
+            raise RuntimeError(
+                f'{overlapping} pairs of shows overlap on {key}; list them with '
+                '`flask shows conflicts`, move or shorten them and run the upgrade again.'
+            )
+
+    # equality on an integer inside a GiST index needs btree_gist
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    for name, key in (('ex_shows_venue_booking', 'venue_id'), ('ex_shows_artist_booking', 'artist_id')):
+        op.execute(
+            f'ALTER TABLE shows ADD CONSTRAINT {name} '
+            f'EXCLUDE USING gist ({key} WITH =, tsrange(start_time, end_time) WITH &&)'
+        )
+
+    for table in ('venues', 'artists'):
+        op.create_index(f'ix_{table}_city_state', table, ['city', 'state'], unique=False)
+
+
+def downgrade():
+    for table in ('artists', 'venues'):
+        op.drop_index(f'ix_{table}_city_state', table_name=table)
+    op.drop_constraint('ex_shows_artist_booking', 'shows')
+    op.drop_constraint('ex_shows_venue_booking', 'shows')
+    op.drop_constraint('ck_shows_end_after_start', 'shows', type_='check')
+    op.drop_column('shows', 'end_time')
@@ -0,0 +1,45 @@
+import pytest
+
+from fyyur import create_app, db
+from fyyur.availability import invalidate_bookings
+from fyyur.reference import genre_registry
+from fyyur.search import _indexes, _indexes_lock
+
+# Every test app gets its own SQLite file. The in-process indexes (search,
+# bookings, genres) belong to the process, not the app, and are reset with it.
+
+
+def _make_app(path, **config):
+    app = create_app(dict({
+        'TESTING': True,
+        'SECRET_KEY': 'test',
+        'WTF_CSRF_ENABLED': False,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}',
+        'SQLALCHEMY_BINDS': {},
+        # cached pages would hide what the views do
+        'CACHE_ENABLED': False,
+    }, **config))
+    with app.app_context():
+        # replicas of an earlier app leave their (empty) bind metadata behind
+        db.create_all(bind_key=None)
+    with _indexes_lock:
+        _indexes.clear()
+    invalidate_bookings()
+    genre_registry.invalidate()
+    return app
+
+
+@pytest.fixture(scope='session')
+def make_app():
+    # make_app(path, **config): an app over a new database at `path`
+    return _make_app
+
+
+@pytest.fixture
+def app(make_app, tmp_path):
+    return make_app(tmp_path / 'fyyur.db')
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,172 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from fyyur import db
+from fyyur.availability import BookingConflict, IntervalIndex, booking_conflicts
+from fyyur.importer import import_rows
+from fyyur.models import Venue, Artist, Show
+
+START = (datetime.now() + timedelta(days=30)).replace(hour=20, minute=0, second=0, microsecond=0)
+
+
+def _at(hours, minutes=0):
+    return START + timedelta(hours=hours, minutes=minutes)
+
+
+@pytest.fixture
+def booked(app):
+    # venue 1 and artist 1 play from START to START + 2h
+    with app.app_context():
+        db.session.add_all([
+            Venue(name='Blue Note', city='New York', state='NY'),
+            Venue(name='Red Rocks', city='Morrison', state='CO'),
+            Artist(name='Velvet Hum', city='Austin', state='TX'),
+            Artist(name='Iron Echo', city='Austin', state='TX'),
+        ])
+        db.session.flush()
+        db.session.add(Show(venue_id=1, artist_id=1, start_time=_at(0), end_time=_at(2)))
+        db.session.commit()
+    return app
+
+
+#  Interval index
+#  ----------------------------------------------------------------
+
+
+def test_interval_index_overlaps():
+    index = IntervalIndex()
+    index.add('a', 1, 10, 20)
+    index.add('a', 2, 30, 40)
+    index.add('a', 3, 0, 100)
+    index.add('b', 4, 10, 20)
+    assert sorted(index.overlapping('a', 15, 16)) == [1, 3]
+    assert sorted(index.overlapping('a', 25, 35)) == [2, 3]
+    assert index.overlapping('c', 0, 100) == []
+
+
+def test_interval_index_touching_intervals_do_not_overlap():
+    index = IntervalIndex()
+    index.add('a', 1, 10, 20)
+    assert index.overlapping('a', 20, 30) == []
+    assert index.overlapping('a', 0, 10) == []
+    assert index.overlapping('a', 19, 30) == [1]
+
+
+def test_interval_index_remove():
+    index = IntervalIndex()
+    index.add('a', 1, 0, 100)
+    index.add('a', 2, 10, 20)
+    index.remove('a', 1)
+    # the running maximum no longer reaches past 20
+    assert index.overlapping('a', 50, 60) == []
+    assert index.overlapping('a', 15, 16) == [2]
+    index.remove('a', 2)
+    index.remove('a', 2)
+    assert index.overlapping('a', 15, 16) == []
+
+
+#  Booking conflicts
+#  ----------------------------------------------------------------
+
+
+def test_booking_conflicts(booked):
+    with booked.app_context():
+        assert booking_conflicts(1, 2, _at(1), _at(3)) == [('venue', 1)]
+        assert booking_conflicts(2, 1, _at(-1), _at(1)) == [('artist', 1)]
+        assert sorted(booking_conflicts(1, 1, _at(0, 30), _at(1))) == [('artist', 1), ('venue', 1)]
+        # back to back
+        assert booking_conflicts(1, 1, _at(2), _at(4)) == []
+        assert booking_conflicts(1, 1, _at(-2), _at(0)) == []
+        # the show itself, when it is moved
+        assert booking_conflicts(1, 1, _at(1), _at(3), exclude_id=1) == []
+
+
+def test_flush_rejects_overlapping_shows(booked):
+    with booked.app_context():
+        db.session.add(Show(venue_id=1, artist_id=2, start_time=_at(1), end_time=_at(3)))
+        with pytest.raises(BookingConflict) as raised:
+            db.session.flush()
+        assert raised.value.conflicts == [('venue', 1)]
+        db.session.rollback()
+        # the rejected show did not keep its slot
+        assert booking_conflicts(1, 2, _at(2), _at(3)) == []
+
+
+def test_moving_a_show_frees_its_old_slot(booked):
+    with booked.app_context():
+        show = db.session.get(Show, 1)
+        show.start_time, show.end_time = _at(5), _at(7)
+        db.session.commit()
+        assert booking_conflicts(1, 2, _at(0), _at(2)) == []
+        assert booking_conflicts(1, 2, _at(6), _at(8)) == [('venue', 1)]
+
+
+#  Create show form
+#  ----------------------------------------------------------------
+
+
+def _show_form(venue_id, artist_id, start_time, duration=120):
+    return {
+        'venue_id': venue_id, 'artist_id': artist_id,
+        'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S'), 'duration': duration,
+    }
+
+
+def test_create_show_rejects_an_overlapping_booking(booked):
+    client = booked.test_client()
+    response = client.post('/shows/create', data=_show_form(1, 2, _at(1)))
+    assert response.status_code == 200
+    assert b'The venue is already booked at that time.' in response.data
+    response = client.post('/shows/create', data=_show_form(1, 1, _at(1, 30), duration=15))
+    assert b'The venue and the artist are already booked at that time.' in response.data
+    with booked.app_context():
+        assert Show.query.count() == 1
+
+
+def test_create_show_accepts_a_touching_booking(booked):
+    client = booked.test_client()
+    assert client.post('/shows/create', data=_show_form(1, 1, _at(2))).status_code == 302
+    assert client.post('/shows/create', data=_show_form(1, 1, _at(-1), duration=60)).status_code == 302
+    with booked.app_context():
+        assert Show.query.count() == 3
+
+
+#  Import
+#  ----------------------------------------------------------------
+
+
+def _row(venue_id, artist_id, start_time, duration=120):
+    return {
+        'venue_id': venue_id, 'artist_id': artist_id,
+        'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S'), 'duration': duration,
+    }
+
+
+def test_import_reports_conflicts_by_line(booked):
+    rows = [
+        (2, _row(1, 2, _at(1))),  # the existing show's venue
+        (3, _row(1, 2, _at(2))),  # right after it
+        (4, _row(2, 2, _at(3))),  # line 3's artist
+        (5, _row(2, 1, _at(4))),  # after line 3
+        (6, _row(2, 1, _at(5))),  # line 5's venue and artist
+    ]
+    with booked.app_context():
+        report = import_rows('shows', rows, chunk_size=10)
+        assert report.imported == 2
+        assert report.errors == [
+            {'line': 2, 'errors': {'start_time': ['The venue is already booked at that time.']}},
+            {'line': 4, 'errors': {'start_time': ['The artist is already booked at that time.']}},
+            {'line': 6, 'errors': {'start_time': ['The venue and the artist are already booked at that time.']}},
+        ]
+        assert Show.query.count() == 3
+
+
+def test_import_checks_later_chunks_against_earlier_ones(booked):
+    rows = [(2, _row(2, 2, _at(10))), (3, _row(2, 2, _at(11)))]
+    with booked.app_context():
+        report = import_rows('shows', rows, chunk_size=1)
+        assert report.imported == 1
+        assert [error['line'] for error in report.errors] == [3]
+        # the imported show is in the booking index too
+        assert booking_conflicts(2, 1, _at(10), _at(11)) == [('venue', 2)]
@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+from werkzeug.http import http_date
+
+from fyyur import db
+from fyyur.models import Genre, Venue, Artist, Show
+
+
+@pytest.fixture
+def listed(app):
+    with app.app_context():
+        db.session.add(Genre(id=1, name='Jazz'))
+        db.session.add(Venue(name='Blue Note', city='New York', state='NY', phone='555-555-5555'))
+        db.session.add(Artist(name='Velvet Hum', city='Austin', state='TX'))
+        db.session.commit()
+        _age()
+    return app
+
+
+def _age():
+    # SQLite's now() has whole seconds, move the versions out of this one
+    # so the edits of a test change them
+    for model in (Venue, Artist):
+        db.session.execute(update(model.__table__).values(updated_at=datetime.now() - timedelta(days=1)))
+    db.session.commit()
+
+
+def _touch(app, model, **values):
+    with app.app_context():
+        entity = db.session.get(model, 1)
+        for key, value in values.items():
+            setattr(entity, key, value)
+        db.session.commit()
+
+
+@pytest.mark.parametrize('url', ['/venues/1', '/artists/1', '/venues', '/artists', '/shows', '/api/v1/venues/1'])
+def test_matching_etag_is_not_modified(listed, url):
+    client = listed.test_client()
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'no-cache'
+    etag = response.headers['ETag']
+
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+
+
+def test_if_modified_since(listed):
+    client = listed.test_client()
+    last_modified = client.get('/venues/1').headers['Last-Modified']
+    assert client.get('/venues/1', headers={'If-Modified-Since': last_modified}).status_code == 304
+    earlier = http_date(datetime.now() - timedelta(days=2))
+    assert client.get('/venues/1', headers={'If-Modified-Since': earlier}).status_code == 200
+
+
+def test_if_none_match_wins_over_if_modified_since(listed):
+    client = listed.test_client()
+    last_modified = client.get('/venues/1').headers['Last-Modified']
+    headers = {'If-None-Match': 'W/"stale"', 'If-Modified-Since': last_modified}
+    assert client.get('/venues/1', headers=headers).status_code == 200
+
+
+def test_edit_changes_the_etag(listed):
+    client = listed.test_client()
+    etag = client.get('/venues/1').headers['ETag']
+    listing_etag = client.get('/venues').headers['ETag']
+
+    _touch(listed, Venue, name='Blue Note Jazz Club')
+    response = client.get('/venues/1', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert b'Blue Note Jazz Club' in response.data
+    assert response.headers['ETag'] != etag
+    assert client.get('/venues', headers={'If-None-Match': listing_etag}).status_code == 200
+
+
+def test_partner_changes_change_the_etag(listed):
+    client = listed.test_client()
+    with listed.app_context():
+        db.session.add(Show(venue_id=1, artist_id=1, start_time=datetime.now() + timedelta(days=3)))
+        db.session.commit()
+        _age()
+    etag = client.get('/venues/1').headers['ETag']
+    # the venue page shows the artist's name
+    _touch(listed, Artist, name='Velvet Hum Trio')
+    assert client.get('/venues/1', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_build_changes_the_etag(listed, monkeypatch):
+    client = listed.test_client()
+    etag = client.get('/venues/1').headers['ETag']
+    monkeypatch.setattr('fyyur.conditional._build', (None, None))
+    monkeypatch.setattr('fyyur.conditional._code', 'next-release')
+    assert client.get('/venues/1', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_flashed_pages_are_not_conditional(listed):
+    client = listed.test_client()
+    etag = client.get('/venues/1').headers['ETag']
+    with client.session_transaction() as session:
+        session['_flashes'] = [('message', 'Venue Blue Note was successfully updated!')]
+    response = client.get('/venues/1', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert b'successfully updated' in response.data
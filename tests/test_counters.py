@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+from fyyur import db, register_commands
+from fyyur.counters import count_hidden_shows, reconcile_counters, rollover_shows
+from fyyur.models import Venue, Artist, Show
+
+NOW = datetime.now().replace(microsecond=0)
+
+
+@pytest.fixture
+def entities(app):
+    with app.app_context():
+        db.session.add_all([
+            Venue(name='Blue Note', city='New York', state='NY'),
+            Venue(name='Red Rocks', city='Morrison', state='CO'),
+            Artist(name='Velvet Hum', city='Austin', state='TX'),
+        ])
+        db.session.commit()
+    return app
+
+
+def _counts(model, entity_id):
+    entity = db.session.get(model, entity_id)
+    db.session.refresh(entity)
+    return entity.num_upcoming_shows, entity.num_past_shows
+
+
+def _add_show(venue_id, start_time):
+    show = Show(venue_id=venue_id, artist_id=1, start_time=start_time)
+    db.session.add(show)
+    db.session.commit()
+    return show
+
+
+def test_counters_follow_show_changes(entities):
+    with entities.app_context():
+        show = _add_show(1, NOW + timedelta(days=1))
+        _add_show(1, NOW - timedelta(days=1))
+        assert _counts(Venue, 1) == (1, 1)
+        assert _counts(Artist, 1) == (1, 1)
+
+        # to the past, then to another venue
+        show.start_time = NOW - timedelta(days=2)
+        show.end_time = show.start_time + timedelta(hours=2)
+        db.session.commit()
+        assert _counts(Venue, 1) == (0, 2)
+        show.venue_id = 2
+        db.session.commit()
+        assert _counts(Venue, 1) == (0, 1)
+        assert _counts(Venue, 2) == (0, 1)
+        assert _counts(Artist, 1) == (0, 2)
+
+        db.session.delete(show)
+        db.session.commit()
+        assert _counts(Venue, 2) == (0, 0)
+        assert _counts(Artist, 1) == (0, 1)
+
+
+def test_rollover_moves_started_shows(entities):
+    with entities.app_context():
+        _add_show(1, NOW + timedelta(hours=1))
+        _add_show(1, NOW + timedelta(hours=5))
+        assert rollover_shows(now=NOW) == 0
+        assert rollover_shows(now=NOW + timedelta(hours=2)) == 1
+        assert _counts(Venue, 1) == (1, 1)
+        assert _counts(Artist, 1) == (1, 1)
+        # already moved
+        assert rollover_shows(now=NOW + timedelta(hours=2)) == 0
+        assert _counts(Venue, 1) == (1, 1)
+
+
+def test_hidden_shows_leave_both_counters(entities):
+    with entities.app_context():
+        _add_show(1, NOW + timedelta(hours=1))
+        _add_show(2, NOW - timedelta(days=1))
+        assert count_hidden_shows(Venue, 1) == 1
+        db.session.get(Venue, 1).deleted_at = NOW
+        db.session.commit()
+        assert _counts(Artist, 1) == (0, 1)
+
+        # a hidden show rolls over without counting again
+        assert rollover_shows(now=NOW + timedelta(hours=2)) == 1
+        assert _counts(Artist, 1) == (0, 1)
+        reconcile_counters()
+        assert _counts(Artist, 1) == (0, 1)
+
+
+def test_shows_commands(entities):
+    register_commands(entities)
+    runner = entities.test_cli_runner()
+    with entities.app_context():
+        show = _add_show(1, NOW + timedelta(days=1))
+        # moved into the past without the mapper events, like time passing
+        db.session.execute(update(Show.__table__).values(start_time=NOW - timedelta(hours=1)))
+        db.session.commit()
+        assert db.session.get(Show, show.id).is_upcoming
+
+    result = runner.invoke(args=['shows', 'rollover'])
+    assert result.output == '1 shows rolled over.\n'
+    with entities.app_context():
+        assert _counts(Venue, 1) == (0, 1)
+        db.session.execute(update(Venue.__table__).values(num_upcoming_shows=3, num_past_shows=0))
+        db.session.commit()
+        untouched = db.session.get(Artist, 1).updated_at
+
+    result = runner.invoke(args=['shows', 'reconcile'])
+    assert result.output == 'Show counters reconciled.\n'
+    with entities.app_context():
+        assert _counts(Venue, 1) == (0, 1)
+        assert _counts(Venue, 2) == (0, 0)
+        # only drifted rows are written
+        assert db.session.get(Artist, 1).updated_at == untouched
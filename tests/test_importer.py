@@ -0,0 +1,174 @@
+import io
+import json
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from fyyur import db, register_commands
+from fyyur.importer import ImportReport, Record, _load, edit_rows, import_rows, read_rows
+from fyyur.models import Genre, Venue
+
+
+@pytest.fixture
+def genres(app):
+    with app.app_context():
+        db.session.add_all([Genre(id=1, name='Jazz'), Genre(id=2, name='Blues')])
+        db.session.commit()
+    return app
+
+
+def _venue(name, **values):
+    return dict({
+        'name': name, 'city': 'Austin', 'state': 'TX', 'address': '1 Main St',
+        'phone': '555-555-5555', 'genres': 'Jazz',
+    }, **values)
+
+
+def test_read_rows_numbers_lines():
+    csv_rows = list(read_rows(io.StringIO('name,city\nBlue Note,New York\n"Red\nRocks",Morrison\n'), 'csv'))
+    assert csv_rows == [(2, {'name': 'Blue Note', 'city': 'New York'}), (4, {'name': 'Red\nRocks', 'city': 'Morrison'})]
+    jsonl_rows = list(read_rows(io.StringIO('{"name": "Blue Note"}\n\nnot json\n[1]\n'), 'jsonl'))
+    assert jsonl_rows == [(1, {'name': 'Blue Note'}), (3, None), (4, None)]
+
+
+def test_import_rejects_invalid_rows_by_line(genres):
+    rows = [
+        (1, _venue('Blue Note', genres='jazz; Blues')),
+        (2, _venue('Bad Phone', phone='5555')),
+        (3, None),
+        (4, _venue('Unknown Genre', genres='Jazz;Polka')),
+        (5, _venue('', state='')),
+        (6, _venue('Red Rocks', genres=[2], seeking_talent='yes')),
+    ]
+    with genres.app_context():
+        report = import_rows('venues', rows, chunk_size=4)
+        assert (report.rows, report.imported, report.failed) == (6, 2, 4)
+        assert report.errors == [
+            {'line': 2, 'errors': {'phone': ['Error, phone number must be in format xxx-xxx-xxxx']}},
+            {'line': 3, 'errors': {'row': ['Not a JSON object']}},
+            {'line': 4, 'errors': {'genres': ['Unknown genre: Polka']}},
+            {'line': 5, 'errors': {'name': ['This field is required.'], 'state': ['This field is required.']}},
+        ]
+        blue_note, red_rocks = Venue.query.order_by(Venue.id).all()
+        assert [g.name for g in blue_note.genres] == ['Jazz', 'Blues']
+        assert red_rocks.seeking_talent
+        # imported rows are searchable like created ones
+        assert blue_note.search_text == 'blue note austin tx jazz blues'
+
+
+def test_import_report_keeps_the_first_errors(genres):
+    rows = [(line, None) for line in range(1, 6)]
+    with genres.app_context():
+        report = import_rows('venues', rows, report=ImportReport('venues', max_errors=2))
+        assert report.failed == 5
+        assert [error['line'] for error in report.errors] == [1, 2]
+
+
+class _Rejecting:
+    # loads records unless the batch holds a rejected line
+
+    def __init__(self, bad_lines):
+        self.bad_lines = bad_lines
+        self.loaded_lines = []
+
+    def load(self, records):
+        if any(record.line in self.bad_lines for record in records):
+            raise IntegrityError('INSERT', {}, Exception('duplicate key'))
+
+    def rejected(self, record, error):
+        return {'row': [str(error.orig)]}
+
+    def loaded(self, records, ids):
+        self.loaded_lines += [record.line for record in records]
+
+
+def test_database_rejects_are_narrowed_to_their_line(app):
+    importer = _Rejecting({3, 6})
+    report = ImportReport('venues')
+    with app.app_context():
+        _load(importer, [Record(line, {}, None) for line in range(1, 9)], report)
+    assert report.imported == 6
+    assert sorted(importer.loaded_lines) == [1, 2, 4, 5, 7, 8]
+    assert report.errors == [{'line': 3, 'errors': {'row': ['duplicate key']}},
+                             {'line': 6, 'errors': {'row': ['duplicate key']}}]
+
+
+def test_import_command_writes_rejects(genres, tmp_path):
+    register_commands(genres)
+    source = tmp_path / 'venues.jsonl'
+    source.write_text('\n'.join(json.dumps(row) for row in [_venue('Blue Note'), _venue('Bad Phone', phone='x')]))
+    rejects = tmp_path / 'rejects.jsonl'
+
+    result = genres.test_cli_runner().invoke(args=['import', 'venues', str(source), '--errors', str(rejects)])
+    assert result.exit_code == 0, result.output
+    assert '2 rows read, 1 imported, 1 rejected' in result.output
+    assert [json.loads(line)['line'] for line in rejects.read_text().splitlines()] == [2]
+
+
+def test_import_upload_answers_with_the_report(genres):
+    body = 'name,city,state,address,phone,genres\nBlue Note,Austin,TX,1 Main St,555-555-5555,Jazz\nBad,Austin,TX,,5,Jazz\n'
+    response = genres.test_client().post('/import/venues', data={'file': (io.BytesIO(body.encode()), 'venues.csv')})
+    assert response.status_code == 200
+    report = response.get_json()
+    assert (report['imported'], report['failed']) == (1, 1)
+    assert report['errors'][0]['line'] == 3
+    assert set(report['errors'][0]['errors']) == {'address', 'phone'}
+
+
+#  Bulk edit
+#  ----------------------------------------------------------------
+
+
+@pytest.fixture
+def venues(genres):
+    with genres.app_context():
+        import_rows('venues', [(1, _venue('Blue Note')), (2, _venue('Red Rocks', genres='Jazz;Blues'))])
+    return genres
+
+
+def test_resaved_rows_are_unchanged(venues):
+    rows = [
+        (1, {'id': 1, 'name': 'Blue Note', 'phone': '555-555-5555', 'genres': 'Jazz'}),
+        (2, {'id': 2, 'genres': ['Blues', 'jazz']}),
+    ]
+    with venues.app_context():
+        before = {v.id: v.updated_at for v in Venue.query}
+        report = edit_rows('venues', rows).to_dict()
+        assert (report['updated'], report['unchanged'], report['failed']) == (0, 2, 0)
+        assert {v.id: v.updated_at for v in Venue.query} == before
+
+
+def test_edit_writes_only_changed_rows(venues):
+    rows = [
+        (1, {'id': 1, 'city': 'Dallas'}),
+        (2, {'id': 2, 'genres': 'Blues'}),
+        (3, {'id': 3, 'name': 'Nowhere'}),
+        (4, {'id': 1, 'phone': 'call us'}),
+        (5, {'id': 2, 'capacity': 500}),
+    ]
+    with venues.app_context():
+        report = edit_rows('venues', rows).to_dict()
+        assert [(r['line'], r['status']) for r in report['results']] == [
+            (1, 'updated'), (2, 'updated'), (3, 'failed'), (4, 'failed'), (5, 'failed'),
+        ]
+        assert report['results'][2]['errors'] == {'id': ['No venue with id 3']}
+        assert set(report['results'][3]['errors']) == {'phone'}
+        assert report['results'][4]['errors'] == {'row': ['Unknown fields: capacity']}
+        blue_note, red_rocks = Venue.query.order_by(Venue.id).all()
+        assert (blue_note.city, blue_note.phone) == ('Dallas', '555-555-5555')
+        assert [g.name for g in red_rocks.genres] == ['Blues']
+
+
+def test_bulk_edit_upload_reports_unchanged(venues):
+    client = venues.test_client()
+    response = client.post('/edit/venues', json=[{'id': 1, 'name': 'Blue Note'}, {'id': 1, 'name': 'Blue Note II'}])
+    assert response.status_code == 200
+    assert [r['status'] for r in response.get_json()['results']] == ['unchanged', 'updated']
+
+
+def test_bulk_edit_command_skips_empty_cells(venues, tmp_path):
+    register_commands(venues)
+    source = tmp_path / 'venues.csv'
+    source.write_text('id,name,city,phone,genres\n1,Blue Note,,,Jazz\n2,,Houston,,\n')
+    result = venues.test_cli_runner().invoke(args=['bulk-edit', 'venues', str(source)])
+    assert result.output == '1 updated, 1 unchanged, 0 rejected\n'
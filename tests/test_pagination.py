@@ -0,0 +1,96 @@
+import base64
+import json
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+import pytest
+from werkzeug.exceptions import BadRequest
+
+from fyyur import db
+from fyyur.models import Venue, Artist, Show
+from fyyur.pagination import decode_cursor, encode_cursor
+
+START = datetime(2030, 1, 1, 20, 0)
+
+
+def _cursor(values, direction='next'):
+    payload = json.dumps({'k': values, 'd': direction})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+@pytest.fixture
+def listed(app):
+    # seven of each; shows share start times, so the id breaks the ties
+    with app.app_context():
+        db.session.add_all([Venue(name=f'Venue {i}', city='New York', state='NY') for i in range(1, 8)])
+        db.session.add_all([Artist(name=f'Artist {i}', city='Austin', state='TX') for i in range(1, 8)])
+        db.session.flush()
+        db.session.add_all([
+            Show(venue_id=i, artist_id=i, start_time=START + timedelta(days=i // 3)) for i in range(1, 8)
+        ])
+        db.session.commit()
+    return app
+
+
+def _walk(client, url, link):
+    # every page from `url` on, following `link`
+    pages = []
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        body = response.get_json()
+        pages.append(body)
+        url = body['links'][link]
+        if url:
+            url = urlsplit(url)._replace(scheme='', netloc='').geturl()
+    return pages
+
+
+def test_cursor_round_trip():
+    row = type('Row', (), {'start_time': START, 'id': 7})()
+    columns = (Show.start_time, Show.id)
+    assert decode_cursor(columns, encode_cursor(columns, row, 'prev')) == ([START, 7], 'prev')
+
+
+@pytest.mark.parametrize('cursor', [
+    'not base64!',
+    base64.urlsafe_b64encode(b'not json').decode(),
+    _cursor(['2030-01-01T20:00:00']),
+    _cursor(['2030-01-01T20:00:00', 1], direction='sideways'),
+    _cursor(['yesterday', 1]),
+    _cursor(['2030-01-01T20:00:00', [1]]),
+    _cursor(['2030-01-01T20:00:00', '1']),
+    _cursor(['2030-01-01T20:00:00', True]),
+    _cursor([1, 1]),
+])
+def test_tampered_cursors_are_rejected(cursor):
+    with pytest.raises(BadRequest):
+        decode_cursor((Show.start_time, Show.id), cursor)
+
+
+def test_next_and_prev_pages(listed):
+    client = listed.test_client()
+    pages = _walk(client, '/api/v1/shows?per_page=3&fields=id', 'next')
+    assert [[show['id'] for show in page['data']] for page in pages] == [[1, 2, 3], [4, 5, 6], [7]]
+    assert pages[0]['links']['prev'] is None
+    assert pages[-1]['links']['next'] is None
+    # the filters stay on the links
+    assert 'per_page=3' in pages[0]['links']['next']
+
+    back = _walk(client, pages[-1]['links']['prev'], 'prev')
+    assert [[show['id'] for show in page['data']] for page in back] == [[4, 5, 6], [1, 2, 3]]
+    assert back[-1]['links']['prev'] is None
+
+
+def test_entity_pages_cover_every_row_once(listed):
+    client = listed.test_client()
+    pages = _walk(client, '/api/v1/artists?per_page=2&fields=name', 'next')
+    ids = [artist['id'] for page in pages for artist in page['data']]
+    assert ids == list(range(1, 8))
+
+
+@pytest.mark.parametrize('url', ['/api/v1/shows', '/shows', '/api/v1/artists', '/artists', '/venues'])
+def test_tampered_cursor_is_a_bad_request(listed, url):
+    client = listed.test_client()
+    assert client.get(url, query_string={'cursor': _cursor([[1], 1])}).status_code == 400
+    assert client.get(url, query_string={'cursor': 'garbage'}).status_code == 400
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from fyyur import db, register_commands
+from fyyur.availability import booking_conflicts
+from fyyur.models import Genre, Venue, Artist, Show, genres_venues
+from fyyur.purge import purge, purge_batch
+from fyyur.search import search
+
+START = (datetime.now() + timedelta(days=7)).replace(minute=0, second=0, microsecond=0)
+
+
+@pytest.fixture
+def deleted(app):
+    # venue 1 has five shows and two genres and is deleted through the
+    # route, venue 2 and the artist stay
+    with app.app_context():
+        jazz, blues = Genre(name='Jazz'), Genre(name='Blues')
+        db.session.add_all([
+            Venue(name='Blue Note', city='New York', state='NY', genres=[jazz, blues]),
+            Venue(name='Red Rocks', city='Morrison', state='CO'),
+            Artist(name='Velvet Hum', city='Austin', state='TX'),
+        ])
+        db.session.flush()
+        db.session.add_all([Show(venue_id=1, artist_id=1, start_time=START + timedelta(days=i)) for i in range(5)])
+        db.session.add(Show(venue_id=2, artist_id=1, start_time=START - timedelta(days=30)))
+        db.session.commit()
+        # the booking index is loaded before the delete
+        assert booking_conflicts(2, 1, START, START + timedelta(hours=1))
+    assert app.test_client().post('/venues/1/delete').status_code == 302
+    return app
+
+
+def _count(table):
+    return db.session.scalar(select(func.count()).select_from(table))
+
+
+def test_deleted_venue_is_hidden(deleted):
+    client = deleted.test_client()
+    assert client.get('/api/v1/venues/1').status_code == 404
+    assert [v['id'] for v in client.get('/api/v1/venues').get_json()['data']] == [2]
+    assert [s['venue_id'] for s in client.get('/api/v1/shows?fields=venue_id').get_json()['data']] == [2]
+    assert b'Blue Note' not in client.get('/venues').data
+    with deleted.app_context():
+        assert search(Venue, 'blue') == []
+        assert Venue.query.count() == 1
+        assert db.session.scalars(select(Venue.id).execution_options(include_deleted=True)).all() == [1, 2]
+        # its shows left the artist's counters right away
+        artist = db.session.get(Artist, 1)
+        assert (artist.num_upcoming_shows, artist.num_past_shows) == (0, 1)
+
+
+def test_purge_runs_in_batches(deleted):
+    with deleted.app_context():
+        # shows two at a time, then the genre links, then the venue
+        assert [purge_batch(2) for _ in range(6)] == [2, 2, 1, 2, 1, 0]
+        assert _count(Show.__table__) == 1
+        assert _count(genres_venues) == 0
+        assert db.session.scalars(select(Venue.id).execution_options(include_deleted=True)).all() == [2]
+        artist = db.session.get(Artist, 1)
+        assert (artist.num_upcoming_shows, artist.num_past_shows) == (0, 1)
+        # the purged shows no longer book the artist
+        assert booking_conflicts(2, 1, START, START + timedelta(hours=1)) == []
+
+
+def test_purge_pauses_between_batches(deleted, monkeypatch):
+    pauses = []
+    monkeypatch.setattr('fyyur.purge.time.sleep', pauses.append)
+    with deleted.app_context():
+        assert purge(batch_size=3, pause=0.5) == 8
+    # after each of the four batches, none once nothing is left
+    assert pauses == [0.5] * 4
+
+
+def test_purge_command(deleted):
+    register_commands(deleted)
+    runner = deleted.test_cli_runner()
+    assert runner.invoke(args=['purge', '--batch-size', '10', '--pause', '0']).output == '8 rows purged.\n'
+    assert runner.invoke(args=['purge', '--pause', '0']).output == '0 rows purged.\n'
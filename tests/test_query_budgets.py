@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+import pytest
+
+from fyyur.instrumentation import assert_query_budget
+from fyyur.models import Venue, Artist
+from fyyur.recent import recent_listings
+from fyyur.seed import seed_database
+
+# Every view with a @query_budget is requested against a small seeded
+# database; an N+1 or any other extra query fails the test.
+
+
+@pytest.fixture(scope='module')
+def app(make_app, tmp_path_factory):
+    app = make_app(tmp_path_factory.mktemp('db') / 'fyyur.db')
+    with app.app_context():
+        seed_database(venues=20, artists=30, genres=8, shows=300)
+        # what create_app() loads when the tables already exist
+        recent_listings.prime()
+    return app
+
+
+def _requests(app):
+    with app.app_context():
+        venue = Venue.query.order_by(Venue.num_past_shows.desc()).first()
+        artist = Artist.query.order_by(Artist.num_past_shows.desc()).first()
+        term = venue.name.split()[0]
+        window = {
+            'start': (datetime.now() + timedelta(days=7)).replace(minute=0, second=0, microsecond=0).isoformat(),
+            'end': (datetime.now() + timedelta(days=7, hours=2)).replace(minute=0, second=0, microsecond=0).isoformat(),
+        }
+        return {
+            'main.index': ('GET', '/', None),
+            'main.venues': ('GET', '/venues', None),
+            'main.venues_area': ('GET', '/venues/area?' + urlencode({'city': venue.city, 'state': venue.state}), None),
+            'main.search_venues': ('POST', '/venues/search', {'search_term': term}),
+            'main.show_venue': ('GET', f'/venues/{venue.id}', None),
+            'main.create_venue_form': ('GET', '/venues/create', None),
+            'main.artists': ('GET', '/artists', None),
+            'main.search_artists': ('POST', '/artists/search', {'search_term': term}),
+            'main.show_artist': ('GET', f'/artists/{artist.id}', None),
+            'main.create_artist_form': ('GET', '/artists/create', None),
+            'main.shows': ('GET', '/shows', None),
+            'api_v1.venues': ('GET', '/api/v1/venues', None),
+            'api_v1.venue_facets': ('GET', '/api/v1/venues/facets', None),
+            'api_v1.venue': ('GET', f'/api/v1/venues/{venue.id}', None),
+            'api_v1.artists': ('GET', '/api/v1/artists', None),
+            'api_v1.artist_facets': ('GET', '/api/v1/artists/facets', None),
+            'api_v1.artist': ('GET', f'/api/v1/artists/{artist.id}', None),
+            'api_v1.shows': ('GET', '/api/v1/shows', None),
+            'api_v1.available_venues': ('GET', '/api/v1/venues/available?' + urlencode(dict(window, city=venue.city)), None),
+            'api_v1.available_artists': ('GET', '/api/v1/artists/available?' + urlencode(dict(window, city=artist.city)), None),
+            'api_v1.search_entities': ('GET', '/api/v1/search?' + urlencode({'q': term}), None),
+        }
+
+
+def test_every_budgeted_view_is_checked(app):
+    budgeted = {
+        rule.endpoint for rule in app.url_map.iter_rules()
+        if getattr(app.view_functions[rule.endpoint], 'query_budget', None) is not None
+    }
+    assert budgeted == set(_requests(app))
+
+
+def test_query_budgets(app):
+    client = app.test_client()
+    for endpoint, (method, url, data) in _requests(app).items():
+        # the first request may fill in-process indexes (search, facets,
+        # bookings, genres) that later requests reuse; budgets cover the rest
+        client.open(url, method=method, data=data)
+        response = assert_query_budget(client, url, method=method, data=data)
+        assert response.status_code == 200, endpoint
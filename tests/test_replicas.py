@@ -0,0 +1,102 @@
+import shutil
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from fyyur import db, replica_router
+from fyyur.models import Genre, Venue
+
+# The primary and its replicas are SQLite files; a replica starts as a copy
+# of the primary, so a write after the copy shows which one answered.
+
+
+def _venue_form(name):
+    return {
+        'name': name, 'city': 'Austin', 'state': 'TX', 'address': '1 Main St', 'phone': '555-555-5555',
+        'genres': ['1'], 'image_link': '', 'website_link': '', 'facebook_link': '', 'seeking_description': '',
+    }
+
+
+@pytest.fixture
+def make_replicated(make_app, tmp_path):
+    def make(replicas=1, **config):
+        primary = tmp_path / 'primary.db'
+        app = make_app(primary, **config)
+        with app.app_context():
+            db.session.add(Genre(id=1, name='Jazz'))
+            db.session.add(Venue(name='Copied Hall', city='Austin', state='TX'))
+            db.session.commit()
+        binds = {}
+        for i in range(1, replicas + 1):
+            shutil.copy(primary, tmp_path / f'replica_{i}.db')
+            binds[f'replica_{i}'] = f'sqlite:///{tmp_path / f"replica_{i}.db"}'
+        # checked on every request, so each test sets the lag it needs
+        return make_app(primary, SQLALCHEMY_BINDS=binds, DB_REPLICA_CHECK_INTERVAL=0, **config)
+    return make
+
+
+def test_read_replica_views_use_the_replica(make_replicated):
+    client = make_replicated().test_client()
+    assert client.get('/venues').headers['X-DB-Bind'] == 'replica_1'
+    assert client.get('/api/v1/venues/1').headers['X-DB-Bind'] == 'replica_1'
+    # not marked @read_replica
+    assert client.get('/venues/create').headers['X-DB-Bind'] == 'primary'
+
+
+def test_reads_after_a_write_stay_on_the_primary(make_replicated):
+    app = make_replicated()
+    client = app.test_client()
+
+    response = client.post('/venues/create', data=_venue_form('New Hall'))
+    assert response.status_code == 302
+    assert response.headers['X-DB-Bind'] == 'primary'
+    with client.session_transaction() as session:
+        assert '_read_primary_until' in session
+
+    # the page the form redirects to, and the new venue the replica lacks
+    assert client.get(response.headers['Location']).headers['X-DB-Bind'] == 'primary'
+    response = client.get('/api/v1/venues/2')
+    assert response.status_code == 200
+    assert response.headers['X-DB-Bind'] == 'primary'
+
+    with client.session_transaction() as session:
+        session['_read_primary_until'] = 0
+    response = client.get('/api/v1/venues/2')
+    assert response.headers['X-DB-Bind'] == 'replica_1'
+    assert response.status_code == 404
+
+
+def test_lagging_replica_falls_back_to_the_primary(make_replicated, monkeypatch):
+    client = make_replicated(DB_REPLICA_MAX_LAG=5).test_client()
+    monkeypatch.setattr('fyyur.replicas.replica_lag', lambda engine: 6.0)
+    assert client.get('/venues').headers['X-DB-Bind'] == 'primary'
+    monkeypatch.setattr('fyyur.replicas.replica_lag', lambda engine: 5.0)
+    assert client.get('/venues').headers['X-DB-Bind'] == 'replica_1'
+
+
+def test_unreachable_replica_falls_back_to_the_primary(make_replicated, monkeypatch):
+    client = make_replicated().test_client()
+
+    def unreachable(engine):
+        raise OperationalError('SELECT 1', {}, Exception('connection refused'))
+
+    monkeypatch.setattr('fyyur.replicas.replica_lag', unreachable)
+    assert client.get('/venues').headers['X-DB-Bind'] == 'primary'
+
+
+def test_least_connections_picks_the_idlest_replica(make_replicated):
+    app = make_replicated(replicas=2, DB_REPLICA_SELECTION='least_connections')
+    with app.test_request_context():
+        replica_router.in_flight['replica_1'] = 3
+        assert {replica_router.choose() for _ in range(4)} == {'replica_2'}
+        replica_router.in_flight['replica_2'] = 5
+        assert replica_router.choose() == 'replica_1'
+
+
+def test_least_connections_falls_back_to_the_primary(make_replicated, monkeypatch):
+    app = make_replicated(replicas=2, DB_REPLICA_SELECTION='least_connections', DB_REPLICA_MAX_LAG=5)
+    monkeypatch.setattr('fyyur.replicas.replica_lag', lambda engine: 60.0)
+    client = app.test_client()
+    assert client.get('/venues').headers['X-DB-Bind'] == 'primary'
+    with app.test_request_context():
+        assert replica_router.choose() is None
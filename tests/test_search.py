@@ -0,0 +1,100 @@
+from datetime import datetime
+
+import pytest
+
+from fyyur import db
+from fyyur.models import Genre, Venue, Artist
+from fyyur.search import index_search, search, tokenize
+
+
+@pytest.fixture
+def venues(app):
+    with app.app_context():
+        jazz, blues = Genre(name='Jazz'), Genre(name='Blues')
+        db.session.add_all([
+            Venue(name='Blue Note', city='New York', state='NY', genres=[jazz]),
+            Venue(name='Bluebird Cafe', city='Nashville', state='TN', genres=[blues]),
+            Venue(name='The Blue Room', city='Kansas City', state='MO', genres=[jazz, blues]),
+            Venue(name='Red Rocks', city='Morrison', state='CO'),
+        ])
+        db.session.commit()
+    return app
+
+
+def _names(ids):
+    return [db.session.get(Venue, i).name for i in ids]
+
+
+def test_tokenize():
+    assert tokenize('The Blue-Note, NYC!') == ['the', 'blue', 'note', 'nyc']
+    assert tokenize(None) == []
+
+
+def test_exact_tokens_rank_above_prefixes(venues):
+    with venues.app_context():
+        # "blue" is a word of two names and a prefix of "bluebird" and "blues"
+        names = _names(index_search(Venue, ['blue'], 10))
+        assert set(names) == {'Blue Note', 'The Blue Room', 'Bluebird Cafe'}
+        assert names[-1] == 'Bluebird Cafe'
+        assert _names(index_search(Venue, ['bluebi'], 10)) == ['Bluebird Cafe']
+
+
+def test_every_token_has_to_match(venues):
+    with venues.app_context():
+        assert _names(index_search(Venue, tokenize('blue jazz'), 10)) == ['Blue Note', 'The Blue Room']
+        assert _names(index_search(Venue, tokenize('blue kansas'), 10)) == ['The Blue Room']
+        assert index_search(Venue, tokenize('blue denver'), 10) == []
+
+
+def test_misspelled_token_matches_close_terms(venues):
+    with venues.app_context():
+        assert _names(index_search(Venue, ['nashvile'], 10)) == ['Bluebird Cafe']
+
+
+def test_search_limit_and_empty_term(venues):
+    with venues.app_context():
+        assert len(search(Venue, 'blue', limit=2)) == 2
+        # no term lists by name
+        assert [v.name for v in search(Venue, '  ')][:2] == ['Blue Note', 'Bluebird Cafe']
+
+
+def test_index_follows_create_edit_and_delete(venues):
+    with venues.app_context():
+        assert search(Artist, 'velvet') == []
+        db.session.add(Artist(name='Velvet Hum', city='Austin', state='TX'))
+        db.session.commit()
+        assert [a.name for a in search(Artist, 'velvet')] == ['Velvet Hum']
+
+        # the index is built by now, the edits below update it
+        assert [v.name for v in search(Venue, 'red')] == ['Red Rocks']
+        venue = Venue.query.filter_by(name='Red Rocks').one()
+        venue.name = 'Green Rocks'
+        db.session.commit()
+        assert search(Venue, 'red') == []
+        assert [v.name for v in search(Venue, 'green')] == ['Green Rocks']
+
+        venue.city = 'Boulder'
+        venue.deleted_at = datetime.now()
+        db.session.commit()
+        assert index_search(Venue, ['green'], 10) == []
+        assert index_search(Venue, ['boulder'], 10) == []
+
+
+def test_index_ignores_rolled_back_changes(venues):
+    with venues.app_context():
+        assert [v.name for v in search(Venue, 'red')] == ['Red Rocks']
+        venue = Venue.query.filter_by(name='Red Rocks').one()
+        venue.name = 'Green Rocks'
+        db.session.flush()
+        db.session.rollback()
+        assert search(Venue, 'green') == []
+        assert [v.name for v in search(Venue, 'red')] == ['Red Rocks']
+
+
+def test_genre_changes_are_searchable(venues):
+    with venues.app_context():
+        assert 'Red Rocks' not in [v.name for v in search(Venue, 'jazz')]
+        venue = Venue.query.filter_by(name='Red Rocks').one()
+        venue.genres.append(Genre.query.filter_by(name='Jazz').one())
+        db.session.commit()
+        assert 'Red Rocks' in [v.name for v in search(Venue, 'jazz')]